@@ -17,13 +17,31 @@ HOST="${HOST:-127.0.0.1}"
 LOGDIR="${LOGDIR:-logs}"
 PYAPP_BASE="scripts.agents"   # base module for agent apps
 
+# AGENT_MODE=separate (default): one uvicorn process per agent
+# AGENT_MODE=combined: every agent in one process on the super port, sharing
+#                      one vector store / embedding model / LLM client
+AGENT_MODE="${AGENT_MODE:-separate}"
+
+# AGENT_SERVE=dev (default): uvicorn --reload, one process per app
+# AGENT_SERVE=prod: scripts/agents/serve.py — preload once, prefork AGENT_WORKERS
+#                   workers sharing the loaded model/index copy-on-write
+AGENT_SERVE="${AGENT_SERVE:-dev}"
+AGENT_WORKERS="${AGENT_WORKERS:-2}"
+READY_TIMEOUT="${READY_TIMEOUT:-300}"
+
 # Agent name → [module, port]
-AGENTS=(
-  "rca_agent:${PYAPP_BASE}.rca_agent:app:9131"
-  "sop_agent:${PYAPP_BASE}.sop_agent:app:9132"
-  "ticket_agent:${PYAPP_BASE}.ticket_agent:app:9133"
-  "super_agent:${PYAPP_BASE}.super_agent:app:9191"
-)
+if [[ "${AGENT_MODE}" == "combined" ]]; then
+  AGENTS=(
+    "agent_host:${PYAPP_BASE}.host:app:9191"
+  )
+else
+  AGENTS=(
+    "rca_agent:${PYAPP_BASE}.rca_agent:app:9131"
+    "sop_agent:${PYAPP_BASE}.sop_agent:app:9132"
+    "ticket_agent:${PYAPP_BASE}.ticket_agent:app:9133"
+    "super_agent:${PYAPP_BASE}.super_agent:app:9191"
+  )
+fi
 
 # Preferred environments: try .venv first, then Conda env `knowledge-ai`
 VENV_PATH=".venv"
@@ -99,17 +117,34 @@ start_agent () {
   local logfile="${LOGDIR}/${name}.log"
   local pidfile="${LOGDIR}/${name}.pid"
 
-  echo "▶️  Starting ${name} on http://${HOST}:${port} …"
-  nohup uvicorn "${module}:${app}" --host "${HOST}" --port "${port}" --reload \
-    >"${logfile}" 2>&1 &
-  local pid=$!
-  echo "${pid}" > "${pidfile}"
-  sleep 1
-  if kill -0 "${pid}" >/dev/null 2>&1; then
-    echo "✅ ${name} running (pid ${pid}) — logs: ${logfile}"
+  echo "▶️  Starting ${name} on http://${HOST}:${port} (${AGENT_SERVE}) …"
+  local started=${SECONDS}
+  if [[ "${AGENT_SERVE}" == "prod" ]]; then
+    nohup python -m scripts.agents.serve "${module}:${app}" --host "${HOST}" --port "${port}" \
+      --workers "${AGENT_WORKERS}" >"${logfile}" 2>&1 &
   else
-    echo "❌ ${name} failed to start — check ${logfile}"
+    nohup uvicorn "${module}:${app}" --host "${HOST}" --port "${port}" --reload \
+      >"${logfile}" 2>&1 &
   fi
+  local pid=$!
+  echo "${pid}" > "${pidfile}"
+
+  # /health answers once the process serves HTTP; /ready once the model and
+  # index are loaded and a warm-up query has run
+  until curl -fsS "http://${HOST}:${port}/ready" >/dev/null 2>&1; do
+    if ! kill -0 "${pid}" >/dev/null 2>&1; then
+      echo "❌ ${name} failed to start — check ${logfile}"
+      return
+    fi
+    if (( SECONDS - started >= READY_TIMEOUT )); then
+      echo "⚠️  ${name} (pid ${pid}) not ready after ${READY_TIMEOUT}s — check ${logfile}"
+      return
+    fi
+    sleep 0.5
+  done
+  echo "✅ ${name} ready in $(( SECONDS - started ))s (pid ${pid}) — logs: ${logfile}"
+  curl -fsS "http://${HOST}:${port}/ready" 2>/dev/null | sed 's/^/   ⏱️  /' || true
+  echo
 }
 
 # ── Launch all agents ─────────────────────────────────────────────────────────
@@ -117,7 +152,10 @@ echo "📦 Starting agents…"
 for spec in "${AGENTS[@]}"; do
   IFS=":" read -r name module app port <<<"${spec}"
   start_agent "${name}" "${module}" "${app}" "${port}"
-  sleep 1
 done
 
-echo "🚀 All agents triggered. Tail logs with: tail -f ${LOGDIR}/*.log"
\ No newline at end of file
+echo "🚀 All agents triggered. Tail logs with: tail -f ${LOGDIR}/*.log"
+if [[ "${AGENT_MODE}" == "combined" ]]; then
+  echo "ℹ️  Combined mode: /rca, /sop, /ticket and /super all served on port 9191"
+  echo "   (test with: RCA_PORT=9191 SOP_PORT=9191 TICKET_PORT=9191 ./agents_test.sh)"
+fi
\ No newline at end of file
@@ -13,6 +13,7 @@ AGENTS=(
   "sop:9132"
   "ticket:9133"
   "super:9191"
+  "agent_host:9191"   # AGENT_MODE=combined
 )
 
 mkdir -p "$LOGDIR"
@@ -0,0 +1,161 @@
+# backend/chatlog.py
+"""Non-blocking JSONL chat log.
+
+Requests only enqueue a record (`ChatLog.log`, never touches the disk); a
+background task drains the queue in batches and serializes + writes each batch
+in a worker thread. The active file rotates when it passes CHAT_LOG_MAX_BYTES
+or CHAT_LOG_MAX_AGE seconds and the closed segment is gzip-compressed
+(`chat-YYYYmmdd-HHMMSS-ffffff.log.gz`), keeping the newest CHAT_LOG_KEEP segments.
+
+If the disk falls behind and the queue fills, records are dropped rather than
+slowing requests down: CHAT_LOG_DROP=newest (default) discards the incoming
+record, `oldest` evicts the oldest queued one. Drops are counted in `stats()`.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+
+class ChatLog:
+    def __init__(self, path: Path, max_bytes: int = 50_000_000, max_age_s: float = 86400,
+                 keep: int = 30, queue_size: int = 10_000, batch_size: int = 500,
+                 flush_interval: float = 1.0, drop: str = "newest"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.keep = keep
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop = drop
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._opened_at = time.time()
+        self.written = self.dropped = self.batches = self.rotations = 0
+        self.write_s = 0.0
+
+    @classmethod
+    def from_env(cls, path: Path) -> "ChatLog":
+        return cls(
+            path,
+            max_bytes=int(os.getenv("CHAT_LOG_MAX_BYTES", "50000000")),
+            max_age_s=float(os.getenv("CHAT_LOG_MAX_AGE", "86400")),
+            keep=int(os.getenv("CHAT_LOG_KEEP", "30")),
+            queue_size=int(os.getenv("CHAT_LOG_QUEUE", "10000")),
+            batch_size=int(os.getenv("CHAT_LOG_BATCH", "500")),
+            flush_interval=float(os.getenv("CHAT_LOG_FLUSH_S", "1.0")),
+            drop=os.getenv("CHAT_LOG_DROP", "newest"),
+        )
+
+    # ---- request path --------------------------------------------------------
+
+    def log(self, record: dict) -> bool:
+        """Enqueue one record without blocking; False if it was dropped."""
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.drop == "oldest":
+                self._queue.get_nowait()
+                self._queue.put_nowait(record)
+                return True
+            return False
+
+    # ---- lifecycle -----------------------------------------------------------
+
+    async def start(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self._opened_at = self.path.stat().st_mtime
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run(), name="chat-log-writer")
+
+    async def aclose(self) -> None:
+        """Stop the writer after flushing whatever is still queued."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    # ---- writer --------------------------------------------------------------
+
+    async def _run(self) -> None:
+        done = False
+        while not done:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if batch[-1] is None:  # shutdown sentinel from aclose()
+                batch.pop()
+                done = True
+            if not batch:
+                continue
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception:
+                self.dropped += len(batch)
+                logging.exception("Failed to write chat log batch")
+
+    def _write(self, batch: list[dict]) -> None:
+        t0 = time.perf_counter()
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+        if self._should_rotate():
+            self._rotate()
+        with self.path.open("a", encoding="utf-8") as fp:
+            fp.write(data)
+        self.written += len(batch)
+        self.batches += 1
+        self.write_s += time.perf_counter() - t0
+
+    def _should_rotate(self) -> bool:
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            self._opened_at = time.time()
+            return False
+        return size > 0 and (size >= self.max_bytes
+                             or time.time() - self._opened_at >= self.max_age_s)
+
+    def _rotate(self) -> None:
+        stamp = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+        closed = self.path.with_name(f"{self.path.stem}-{stamp}{self.path.suffix}")
+        os.replace(self.path, closed)
+        self._opened_at = time.time()
+        with closed.open("rb") as src, gzip.open(f"{closed}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        closed.unlink()
+        self.rotations += 1
+        segments = sorted(self.path.parent.glob(f"{self.path.stem}-*{self.path.suffix}.gz"))
+        for old in segments[:-self.keep] if self.keep else []:
+            old.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "avg_batch_write_ms": round(self.write_s / self.batches * 1000, 2) if self.batches else 0.0,
+            "drop_policy": self.drop,
+        }
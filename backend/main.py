@@ -1,8 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.routes import chat      
+from scripts import http_pool, tracing
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Long-lived HTTP pools for downstream hops and the chat log writer live
+    # as long as the app; the log is flushed before the pools close
+    async with http_pool.lifespan(chat.super_http)(app):
+        await chat.chat_log.start()
+        try:
+            yield
+        finally:
+            await chat.chat_log.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS ---------------------------------------------------------------
 origins = [
@@ -20,4 +33,5 @@ app.add_middleware(
 )
 # -----------------------------------------------------------------------
 
-app.include_router(chat.router)
\ No newline at end of file
+app.include_router(chat.router)
+tracing.instrument(app, "backend")
\ No newline at end of file
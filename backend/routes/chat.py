@@ -1,14 +1,17 @@
 # backend/routes/chat.py
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 from pydantic import BaseModel, Field
-import httpx, logging, os, uuid, json
+import logging, os, uuid, json
 from pathlib import Path
 import datetime as dt
+from scripts import http_pool, tracing
+from scripts.http_pool import PooledClient
+from backend.chatlog import ChatLog
 
-router = APIRouter()
+router = APIRouter(route_class=tracing.TimedRoute)
 
 # ---- Config ----
 SUPER_URL = os.getenv("SUPER_URL", "http://127.0.0.1:9191/super")
@@ -17,6 +20,13 @@ CHAT_LOG = Path(os.getenv("CHAT_LOG", "backend/logs/chat.log"))
 # Ensure parent directory exists to avoid FileNotFoundError
 CHAT_LOG.parent.mkdir(parents=True, exist_ok=True)
 
+# Batched background writer; started/stopped by the app lifespan in backend/main.py
+chat_log = ChatLog.from_env(CHAT_LOG)
+
+# One keep-alive pool for every chat → super call; opened/closed by the app
+# lifespan in backend/main.py. SUPER_UDS switches it to a Unix socket.
+super_http = PooledClient("chat→super", timeout=45, uds_env="SUPER_UDS")
+
 class ChatReq(BaseModel):
     text: str = Field(..., description="User prompt")
     mode: str = Field("sop", pattern=r"^(sop|rca|ticket)$")
@@ -25,34 +35,31 @@ async def _call_super(payload: dict) -> dict:
     """Call the SUPER agent and return JSON.
     Raises HTTP 502 on failure.
     """
-    async with httpx.AsyncClient(timeout=45) as client:
-        try:
-            res = await client.post(SUPER_URL, json=payload)
-            res.raise_for_status()
-            return res.json()
-        except Exception as e:
-            logging.exception("chat→super error")
-            raise HTTPException(502, f"Agent error: {e}")
+    try:
+        res = await super_http.post(SUPER_URL, json=payload)
+        res.raise_for_status()
+        return res.json()
+    except Exception as e:
+        logging.exception("chat→super error")
+        raise HTTPException(502, f"Agent error: {e}")
 
 def _log_chat(mode: str, question: str, answer: dict) -> None:
-    """Append one JSONL record to CHAT_LOG. Best-effort; never crash request."""
-    try:
-        rec = {
-            "id": uuid.uuid4().hex,
-            "ts": dt.datetime.utcnow().isoformat(),
-            "mode": mode,
-            "question": question,
-            "answer": answer,
-        }
-        with CHAT_LOG.open("a", encoding="utf-8") as fp:
-            fp.write(json.dumps(rec, ensure_ascii=False) + "\n")
-    except Exception:
-        logging.exception("Failed to write chat log")
+    """Queue one JSONL record for CHAT_LOG. Best-effort; no file I/O on the request."""
+    chat_log.log({
+        "id": uuid.uuid4().hex,
+        "ts": dt.datetime.utcnow().isoformat(),
+        "mode": mode,
+        "question": question,
+        "answer": answer,
+    })
 
 @router.post("/chat")
-async def chat(req: ChatReq):
+async def chat(req: ChatReq, response: Response):
     payload = {"mode": req.mode, "payload": {"topic": req.text}}
     data = await _call_super(payload)
+    # Agents report their answer cache outcome; surface it for the FE
+    if "cache" in data:
+        response.headers["X-Answer-Cache"] = str(data["cache"])
 
     # Log interaction (best-effort)
     _log_chat(req.mode, req.text, data)
@@ -62,27 +69,40 @@ async def chat(req: ChatReq):
 
 @router.get("/chat/stream")
 async def chat_stream(text: str, mode: str = "sop"):
-    """Server-Sent Events stream so the FE can render tokens chunk-by-chunk."""
-    payload = {"mode": mode, "payload": {"topic": text}}
+    """Server-Sent Events stream so the FE can render tokens chunk-by-chunk.
+
+    Asks /super for its NDJSON token stream (`stream: true`) and relays each
+    token as it arrives, so the first words show up after retrieval plus the
+    model's first token instead of after the whole completion.
+    """
+    payload = {"mode": mode, "stream": True, "payload": {"topic": text}}
 
     async def event_generator():
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("POST", SUPER_URL, json=payload) as res:
-                res.raise_for_status()
-                async for line in res.aiter_lines():
-                    if not line:
-                        continue
-                    if line.strip() == "[DONE]":
-                        # signal end of stream
-                        yield ServerSentEvent(data="", event="end")
-                        break
-                    try:
-                        chunk = json.loads(line)
-                        # extract the text for the chosen mode
-                        text_chunk = chunk.get(mode) or next(iter(chunk.values()))
-                        yield ServerSentEvent(data=text_chunk)
-                    except json.JSONDecodeError:
-                        # skip non-JSON keepalive lines
-                        continue
-
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+        async with super_http.stream("POST", SUPER_URL, json=payload, timeout=None) as res:
+            res.raise_for_status()
+            async for line in res.aiter_lines():
+                if not line:
+                    continue
+                if line.strip() == "[DONE]":
+                    # signal end of stream
+                    yield ServerSentEvent(data="", event="end")
+                    break
+                try:
+                    chunk = json.loads(line)
+                    # extract the text for the chosen mode
+                    text_chunk = chunk.get(mode) or next(iter(chunk.values()))
+                    yield ServerSentEvent(data=text_chunk)
+                except json.JSONDecodeError:
+                    # skip non-JSON keepalive lines
+                    continue
+
+    return EventSourceResponse(event_generator())
+
+@router.get("/http/stats")
+async def http_stats():
+    """Per-hop connection reuse and connect vs. request time."""
+    return http_pool.stats(super_http)
+
+@router.get("/chat/log/stats")
+async def chat_log_stats():
+    return chat_log.stats()
@@ -0,0 +1,183 @@
+"""
+scripts/agents/answer_cache.py
+
+Persistent answer cache in front of the agents' LLM calls.
+
+Entries are keyed on (mode, normalized question, hash of the retrieved
+context). A lookup first tries the exact question, then any cached question in
+the same (mode, context) bucket whose embedding is at least `threshold`
+cosine-similar, so "why is checkout down?" and "why is checkout down" share an
+answer. Because the context hash is part of the key, re-ingesting the chunks a
+question retrieves changes the hash and the old answer is simply never matched
+again; TTL and LRU eviction then reclaim it.
+
+Rows live in SQLite (state/answers.sqlite3 by default) so the cache survives
+restarts and is shared by every agent process on the host.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from scripts.agents.cache import normalize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    mode       TEXT NOT NULL,
+    question   TEXT NOT NULL,
+    ctx_hash   TEXT NOT NULL,
+    embedding  BLOB NOT NULL,
+    answer     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used  REAL NOT NULL,
+    hits       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (mode, question, ctx_hash)
+);
+CREATE INDEX IF NOT EXISTS answers_bucket ON answers (mode, ctx_hash);
+CREATE INDEX IF NOT EXISTS answers_lru ON answers (last_used);
+"""
+
+
+def context_hash(docs) -> str:
+    """Stable hash of the retrieved chunks a prompt was built from."""
+    h = hashlib.sha1()
+    for d in docs:
+        h.update(d.page_content.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AnswerCache:
+    """SQLite-backed LRU/TTL answer cache with near-duplicate matching.
+
+    `embeddings` must return normalized vectors (the agents' bge model does),
+    so cosine similarity is a dot product.
+    """
+
+    def __init__(self, embeddings, db_path: Path, maxsize: int = 5000, ttl: float = 86400,
+                 threshold: float = 0.95, enabled: bool = True):
+        self.embeddings = embeddings
+        self.db_path = db_path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.enabled = enabled
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self.exact_hits = self.semantic_hits = self.misses = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._db.commit()
+        return self._db
+
+    # ---- sync core (runs in a worker thread) ---------------------------------
+
+    def _get(self, mode: str, question: str, ctx_hash: str) -> str | None:
+        question = normalize(question).lower()
+        now = time.time()
+        with self._lock:
+            row = self.db.execute(
+                "SELECT answer FROM answers WHERE mode = ? AND question = ? AND ctx_hash = ? "
+                "AND created_at > ?", (mode, question, ctx_hash, now - self.ttl)
+            ).fetchone()
+            if row:
+                self.exact_hits += 1
+                self._touch(mode, question, ctx_hash, now)
+                return row[0]
+            bucket = self.db.execute(
+                "SELECT question, embedding, answer FROM answers WHERE mode = ? AND ctx_hash = ? "
+                "AND created_at > ?", (mode, ctx_hash, now - self.ttl)
+            ).fetchall()
+        if bucket:
+            q = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+            sims = np.stack([np.frombuffer(b, dtype=np.float32) for _, b, _ in bucket]) @ q
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                with self._lock:
+                    self.semantic_hits += 1
+                    self._touch(mode, bucket[best][0], ctx_hash, now)
+                return bucket[best][2]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _touch(self, mode: str, question: str, ctx_hash: str, now: float) -> None:
+        with self.db:
+            self.db.execute(
+                "UPDATE answers SET last_used = ?, hits = hits + 1 "
+                "WHERE mode = ? AND question = ? AND ctx_hash = ?",
+                (now, mode, question, ctx_hash),
+            )
+
+    def _put(self, mode: str, question: str, ctx_hash: str, answer: str) -> None:
+        question = normalize(question).lower()
+        vec = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(mode, question, ctx_hash, embedding, answer, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (mode, question, ctx_hash, vec.tobytes(), answer, now, now),
+            )
+            self.db.execute("DELETE FROM answers WHERE created_at <= ?", (now - self.ttl,))
+            self.db.execute(
+                "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.maxsize,)
+            )
+
+    # ---- async API -----------------------------------------------------------
+
+    async def get(self, mode: str, question: str, ctx_hash: str) -> str | None:
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._get, mode, question, ctx_hash)
+
+    async def put(self, mode: str, question: str, ctx_hash: str, answer: str) -> None:
+        if self.enabled and answer:
+            await asyncio.to_thread(self._put, mode, question, ctx_hash, answer)
+
+    async def stream(self, mode: str, question: str, ctx_hash: str, tokens):
+        """Yield the cached answer as one token, or relay `tokens` and cache the result."""
+        cached = await self.get(mode, question, ctx_hash)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        async for token in tokens:
+            parts.append(token)
+            yield token
+        await self.put(mode, question, ctx_hash, "".join(parts).strip())
+
+    def clear(self) -> None:
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM answers")
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self.db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": size,
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "threshold": self.threshold,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+            }
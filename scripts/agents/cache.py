@@ -0,0 +1,190 @@
+"""
+scripts/agents/cache.py
+
+Query-embedding and retrieval-result caches for the agents' vector store.
+
+`CachedEmbeddings` memoizes query vectors keyed on (normalized text, model);
+`CachedVectorStore` memoizes `similarity_search` results keyed on
+(normalized query, k, filter). Both are size-bounded LRUs with a TTL and are
+cleared as soon as ingestion bumps the index generation
+(`scripts.index_generation`). Hit/miss counts and the latency saved are kept
+per cache so they can be sized from real traffic.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from scripts import index_generation
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+class TTLCache:
+    """Thread-safe LRU with per-entry TTL and hit/miss/saved-latency stats."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.saved_s = 0.0
+        self.miss_s = 0.0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                # A hit saves roughly what an average miss costs
+                self.saved_s += self.miss_s / self.misses if self.misses else 0.0
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            return None
+
+    def put(self, key, value, cost_s: float) -> None:
+        with self._lock:
+            self.misses += 1
+            self.miss_s += cost_s
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "avg_miss_ms": round(self.miss_s / self.misses * 1000, 2) if self.misses else 0.0,
+                "saved_ms": round(self.saved_s * 1000, 1),
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an Embeddings model with an LRU for `embed_query`."""
+
+    def __init__(self, inner: Embeddings, model_name: str, cache: TTLCache):
+        self.inner = inner
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = (self.model_name, normalize(text))
+        vec = self.cache.get(key)
+        if vec is None:
+            t0 = time.perf_counter()
+            vec = self.inner.embed_query(key[1])
+            self.cache.put(key, vec, time.perf_counter() - t0)
+        return vec
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed many queries, encoding all cache misses in one batched call."""
+        keys = [(self.model_name, normalize(t)) for t in texts]
+        vecs = [self.cache.get(k) for k in keys]
+        misses = list(dict.fromkeys(k for k, v in zip(keys, vecs) if v is None))
+        if misses:
+            t0 = time.perf_counter()
+            fresh = dict(zip(misses, self.inner.embed_documents([k[1] for k in misses])))
+            cost = (time.perf_counter() - t0) / len(misses)
+            for k, v in fresh.items():
+                self.cache.put(k, v, cost)
+            vecs = [v if v is not None else fresh[k] for k, v in zip(keys, vecs)]
+        return vecs
+
+
+class CachedVectorStore:
+    """Result cache in front of a LangChain vector store.
+
+    Only `similarity_search` is cached; every other attribute is passed through.
+    Both this cache and the embedding cache are dropped when the index
+    generation changes.
+
+    `store_factory` is called on first use (or by `shared.warm()`), so importing
+    the agents does not open the index.
+    """
+
+    def __init__(self, store_factory, results: TTLCache, embeddings: CachedEmbeddings,
+                 check_interval: float = 1.0):
+        self._factory = store_factory
+        self._store = None
+        self._store_lock = threading.Lock()
+        self.results = results
+        self.embeddings = embeddings
+        self.watcher = index_generation.Watcher(check_interval)
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = self._factory()
+        return self._store
+
+    @property
+    def loaded(self) -> bool:
+        return self._store is not None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def _invalidate_if_stale(self) -> None:
+        if self.watcher.changed():
+            self.results.clear()
+            self.embeddings.cache.clear()
+
+    def _key(self, query: str, k: int, filter: dict | None, kwargs: dict):
+        return (normalize(query), k, json.dumps(filter, sort_keys=True),
+                json.dumps(kwargs, sort_keys=True, default=str))
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs):
+        self._invalidate_if_stale()
+        key = self._key(query, k, filter, kwargs)
+        docs = self.results.get(key)
+        if docs is None:
+            t0 = time.perf_counter()
+            docs = self.store.similarity_search(query, k=k, filter=filter, **kwargs)
+            self.results.put(key, docs, time.perf_counter() - t0)
+        return list(docs)
+
+    async def asimilarity_search(self, query: str, k: int = 4, filter: dict | None = None,
+                                 **kwargs):
+        """Async variant: cache hits stay on the event loop, misses run in a worker thread."""
+        self._invalidate_if_stale()
+        docs = self.results.get(self._key(query, k, filter, kwargs))
+        if docs is not None:
+            return list(docs)
+        return await asyncio.to_thread(self.similarity_search, query, k, filter, **kwargs)
+
+    def stats(self) -> dict:
+        out = {
+            "generation": self.watcher.current,
+            "query_embeddings": self.embeddings.cache.stats(),
+            "results": self.results.stats(),
+        }
+        if self.loaded and callable(getattr(self._store, "stats", None)):
+            out["store"] = self._store.stats()
+        return out
@@ -0,0 +1,189 @@
+"""
+scripts/agents/context.py
+
+Context assembly for agent prompts.
+
+Retrieved chunks are:
+
+1. merged when they are adjacent or overlapping pieces of the same source
+   (scripts/chunker.py carries up to CHUNK_OVERLAP_TOKENS between neighbours),
+2. dropped when they are near-duplicates of a better-ranked piece (word
+   5-gram Jaccard ≥ CONTEXT_DEDUP, e.g. the same slide in two copies of a deck),
+3. optionally reranked with a cross-encoder (RERANK_MODEL, off by default),
+4. packed in rank order into CONTEXT_TOKENS tokens.
+
+Token counts come from chunk metadata written by the chunker (scripts/tokens.py),
+so nothing is tokenized on the request path for freshly ingested chunks.
+"""
+
+import asyncio
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+from scripts.tokens import count_tokens
+from scripts import tracing
+
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "2500"))
+DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP", "0.8"))
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+SEPARATOR = "\n---\n"
+
+
+@dataclass
+class Piece:
+    text: str
+    tokens: int
+    rank: int
+    doc_id: str | None = None
+    start: int | None = None
+    shingles: set = field(default_factory=set, repr=False)
+
+    @property
+    def end(self) -> int | None:
+        return None if self.start is None else self.start + len(self.text)
+
+
+def _piece(doc, rank: int) -> Piece:
+    meta = doc.metadata or {}
+    tokens = meta.get("tokens")
+    return Piece(
+        text=doc.page_content,
+        tokens=tokens if tokens is not None else count_tokens(doc.page_content),
+        rank=rank,
+        doc_id=meta.get("doc_id"),
+        start=meta.get("start"),
+    )
+
+
+def merge_adjacent(pieces: list[Piece]) -> list[Piece]:
+    """Join pieces of the same source whose character spans touch or overlap."""
+    by_doc, loose = {}, []
+    for p in pieces:
+        if p.doc_id is None or p.start is None:
+            loose.append(p)
+        else:
+            by_doc.setdefault(p.doc_id, []).append(p)
+
+    merged = []
+    for group in by_doc.values():
+        group.sort(key=lambda p: p.start)
+        cur = group[0]
+        for nxt in group[1:]:
+            if nxt.start <= cur.end:
+                tail = nxt.text[cur.end - nxt.start:]
+                if tail:
+                    # Scale the precomputed count to the part that is actually new
+                    extra = round(nxt.tokens * len(tail) / max(1, len(nxt.text)))
+                    cur = Piece(cur.text + tail, cur.tokens + extra, min(cur.rank, nxt.rank),
+                                cur.doc_id, cur.start)
+                else:
+                    cur.rank = min(cur.rank, nxt.rank)
+            else:
+                merged.append(cur)
+                cur = nxt
+        merged.append(cur)
+    return sorted(merged + loose, key=lambda p: p.rank)
+
+
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str, n: int = 5) -> set:
+    words = _WORD.findall(text.lower())
+    return {hash(tuple(words[i:i + n])) for i in range(max(1, len(words) - n + 1))}
+
+
+def drop_near_duplicates(pieces: list[Piece], threshold: float) -> list[Piece]:
+    """Keep a piece only if it is not ≥ `threshold` similar to a better-ranked one."""
+    kept = []
+    for p in pieces:
+        p.shingles = _shingles(p.text)
+        if not any(len(p.shingles & k.shingles) / (len(p.shingles | k.shingles) or 1) >= threshold
+                   for k in kept):
+            kept.append(p)
+    return kept
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def reranker():
+    """The RERANK_MODEL cross-encoder, loaded on first use (or by shared.warm())."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            from sentence_transformers import CrossEncoder
+            _reranker = CrossEncoder(RERANK_MODEL)
+    return _reranker
+
+
+def rerank(query: str, pieces: list[Piece]) -> list[Piece]:
+    if not RERANK_MODEL or len(pieces) < 2:
+        return pieces
+    scores = reranker().predict([(query, p.text) for p in pieces])
+    order = sorted(range(len(pieces)), key=lambda i: -scores[i])
+    for rank, i in enumerate(order):
+        pieces[i].rank = rank
+    return [pieces[i] for i in order]
+
+
+def pack(pieces: list[Piece], budget: int) -> list[Piece]:
+    """Take pieces in rank order while they fit; skip (don't truncate) ones that don't."""
+    out, used = [], 0
+    for p in pieces:
+        if used + p.tokens <= budget:
+            out.append(p)
+            used += p.tokens
+    # Never send an empty context when the best piece alone is over budget
+    return out or pieces[:1]
+
+
+class _Stats:
+    def __init__(self):
+        self.requests = 0
+        self.chunks_in = self.chunks_out = 0
+        self.tokens_in = self.tokens_out = 0
+
+    def record(self, chunks_in, chunks_out, tokens_in, tokens_out) -> None:
+        self.requests += 1
+        self.chunks_in += chunks_in
+        self.chunks_out += chunks_out
+        self.tokens_in += tokens_in
+        self.tokens_out += tokens_out
+
+    def snapshot(self) -> dict:
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "budget_tokens": CONTEXT_TOKENS,
+            "rerank_model": RERANK_MODEL or None,
+            "avg_chunks_retrieved": round(self.chunks_in / n, 2),
+            "avg_pieces_sent": round(self.chunks_out / n, 2),
+            "avg_tokens_retrieved": round(self.tokens_in / n, 1),
+            "avg_tokens_sent": round(self.tokens_out / n, 1),
+        }
+
+
+stats = _Stats()
+
+
+def build_context(query: str, docs, budget: int | None = None) -> str:
+    pieces = [_piece(d, i) for i, d in enumerate(docs)]
+    tokens_in = sum(p.tokens for p in pieces)
+    out = merge_adjacent(pieces)
+    out = drop_near_duplicates(out, DEDUP_THRESHOLD)
+    out = rerank(query, out)
+    out = pack(out, budget or CONTEXT_TOKENS)
+    stats.record(len(pieces), len(out), tokens_in, sum(p.tokens for p in out))
+    return SEPARATOR.join(p.text for p in out)
+
+
+async def assemble(query: str, docs, budget: int | None = None) -> str:
+    """`build_context` off the event loop when a cross-encoder has to run."""
+    with tracing.stage("prompt"):
+        if RERANK_MODEL:
+            return await asyncio.to_thread(build_context, query, docs, budget)
+        return build_context(query, docs, budget)
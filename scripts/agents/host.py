@@ -0,0 +1,37 @@
+# scripts/agents/host.py
+"""
+Combined agent host: RCA, SOP, Ticket, Super and the search tool in one ASGI app.
+
+All routers share one vector store, one embedding model and one OpenAI client
+(scripts/agents/shared.py), and /super dispatches to the agents in-process
+instead of over localhost HTTP. Paths are unchanged, so the host can stand in
+for every agent port:
+
+    uvicorn scripts.agents.host:app --port 9191
+
+The one-process-per-agent layout (agents_start.sh default) keeps working.
+"""
+from fastapi import FastAPI
+from scripts.agents import rca_agent, sop_agent, ticket_agent, super_agent, context, readiness
+from scripts.agents.shared import vectordb, answers, retrieval_stats, limiter_stats, warm
+from scripts import tools_rag, tracing
+
+# Loads the model and opens the index once, then reports on /ready
+app = FastAPI(title="KnowledgeAI agents", lifespan=readiness.lifespan(warm))
+
+app.include_router(readiness.router)
+for agent in (rca_agent, sop_agent, ticket_agent, super_agent, tools_rag):
+    app.include_router(agent.router)
+tracing.instrument(app, "agents")
+
+super_agent.register_local("rca", rca_agent.root_cause_analysis, rca_agent.RCARequest,
+                           rca_agent.rca_stream, rca_agent.limiter.admit)
+super_agent.register_local("sop", sop_agent.sop_generation, sop_agent.SOPRequest,
+                           sop_agent.sop_stream, sop_agent.limiter.admit)
+super_agent.register_local("ticket", ticket_agent.resolve_ticket, ticket_agent.TicketRequest,
+                           ticket_agent.ticket_stream, ticket_agent.limiter.admit)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**vectordb.stats(), "answers": answers.stats(), "retrieval": retrieval_stats(),
+            "context": context.stats.snapshot(), "limiters": limiter_stats()}
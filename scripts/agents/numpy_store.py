@@ -0,0 +1,47 @@
+"""
+scripts/agents/numpy_store.py
+
+LangChain-style vector store over the memory-mapped export in
+scripts/numpy_index.py, selected in shared.py with VECTOR_BACKEND=numpy.
+
+Implements the slice of the Chroma interface the agents use
+(`similarity_search`, `similarity_search_by_vector`,
+`similarity_search_with_score`) plus `batch_search` for many queries in one
+vectorized pass.
+"""
+
+from langchain_core.documents import Document
+
+from scripts.numpy_index import NumpyIndex, EXPORT_DIR
+
+
+class NumpyVectorStore:
+    def __init__(self, embeddings, root=EXPORT_DIR):
+        self.embeddings = embeddings
+        self.index = NumpyIndex(root)
+
+    @staticmethod
+    def _docs(hits, with_score: bool = False):
+        docs = [(Document(page_content=text, metadata=meta), score)
+                for _, score, text, meta in hits]
+        return docs if with_score else [d for d, _ in docs]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict | None = None,
+                                    **kwargs):
+        return self._docs(self.index.search([embedding], [k], [filter])[0])
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict | None = None,
+                                     **kwargs):
+        vec = self.embeddings.embed_query(query)
+        return self._docs(self.index.search([vec], [k], [filter])[0], with_score=True)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k, filter)
+
+    def batch_search(self, vectors, ks: list[int], filters: list[dict | None] | None = None):
+        """(Document, score) lists for many query vectors in one scoring pass."""
+        return [self._docs(hits, with_score=True)
+                for hits in self.index.search(vectors, ks, filters)]
+
+    def stats(self) -> dict:
+        return self.index.stats()
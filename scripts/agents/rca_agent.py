@@ -1,7 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from scripts.logconf import logging
-from scripts.agents.shared import vectordb, client
+from scripts import tracing
+from scripts.agents import readiness
+from scripts.agents.context import assemble, stats as context_stats
+from scripts.agents.shared import (vectordb, complete, ConcurrencyLimiter, NDJSON,
+                                   stream_tokens, ndjson_lines, answers, context_hash,
+                                   retrieve, retrieval_stats, limiter_stats, warm)
 import signal
 import sys
 
@@ -11,29 +17,62 @@ def handle_shutdown(sig, frame):
 
 signal.signal(signal.SIGTERM, handle_shutdown)
 
-app = FastAPI()
+app = FastAPI(lifespan=readiness.lifespan(warm))
+router = APIRouter(route_class=tracing.TimedRoute)
+limiter = ConcurrencyLimiter("rca")
 
 class RCARequest(BaseModel):
     topic: str  
 
-@app.post("/rca")
-def root_cause_analysis(req: RCARequest):
-    try:
-        logging.info(f"🔥 RCA request: {req.topic}")
-        docs = vectordb.similarity_search(req.topic, k=8)
-        context = "\n---\n".join([d.page_content for d in docs])
-        prompt = f"""You are an SRE assistant. Based on the context below, find and summarize the most probable root cause:
+async def _prompt(topic: str) -> tuple[str, str]:
+    """Retrieve context for `topic`; returns (context hash for the answer cache, prompt)."""
+    docs, _ = await retrieve(topic)
+    context = await assemble(topic, docs)
+    return context_hash(docs), f"""You are an SRE assistant. Based on the context below, find and summarize the most probable root cause:
         
 Context:
 {context}
 
 Output a concise Root Cause Analysis (RCA) in 5-7 lines. **When you answer, ALWAYS use markdown lists or sub-lists with numbered or bulleted steps.**
 """
-        res = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        return {"rca": res.choices[0].message.content.strip()}
+
+@router.post("/rca")
+@limiter
+async def root_cause_analysis(req: RCARequest):
+    try:
+        logging.info(f"🔥 RCA request: {req.topic}")
+        ctx, prompt = await _prompt(req.topic)
+        cached = await answers.get("rca", req.topic, ctx)
+        if cached is not None:
+            return {"rca": cached, "cache": "hit"}
+        answer = await complete(prompt)
+        await answers.put("rca", req.topic, ctx, answer)
+        return {"rca": answer, "cache": "miss"}
     except Exception:
         logging.exception("RCA agent failed")
         return {"rca": "Error processing RCA"}
+
+async def _rca_tokens(req: RCARequest):
+    async with limiter:
+        logging.info(f"🔥 RCA stream request: {req.topic}")
+        ctx, prompt = await _prompt(req.topic)
+        async for token in answers.stream("rca", req.topic, ctx, stream_tokens(prompt)):
+            yield token
+
+def rca_stream(req: RCARequest):
+    """NDJSON lines `{"rca": token}` … `[DONE]`; also used by /super in-process."""
+    return ndjson_lines("rca", _rca_tokens(req), "Error processing RCA")
+
+@router.post("/rca/stream")
+async def root_cause_analysis_stream(req: RCARequest):
+    limiter.admit()
+    return StreamingResponse(rca_stream(req), media_type=NDJSON)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**vectordb.stats(), "answers": answers.stats(), "retrieval": retrieval_stats(),
+            "context": context_stats.snapshot(), "limiters": limiter_stats()}
+
+app.include_router(router)
+app.include_router(readiness.router)
+tracing.instrument(app, "rca")
@@ -1,19 +1,22 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 from scripts.logconf import logging
-from scripts.agents.shared import vectordb, client
+from scripts.agents.context import assemble
+from scripts.agents.shared import complete, ConcurrencyLimiter, retrieve
 
 app = FastAPI()
+limiter = ConcurrencyLimiter("rca")
 
 class RCARequest(BaseModel):
     topic: str  
 
 @app.post("/rca")
-def root_cause_analysis(req: RCARequest):
+@limiter
+async def root_cause_analysis(req: RCARequest):
     try:
         logging.info(f"🔥 RCA request: {req.topic}")
-        docs = vectordb.similarity_search(req.topic, k=8)
-        context = "\n---\n".join([d.page_content for d in docs])
+        docs, _ = await retrieve(req.topic)
+        context = await assemble(req.topic, docs)
         prompt = f"""You're an SRE assistant performing Root Cause Analysis using the 5 Whys technique:
         Only use the provided context. Do not make assumptions. If context is missing, say "insufficient context to answer".
         
@@ -31,11 +34,7 @@ Based on the information above, answer the following:
 
 Give clear, numbered answers.
 """
-        res = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        return {"rca": res.choices[0].message.content.strip()}
+        return {"rca": await complete(prompt)}
     except Exception:
         logging.exception("RCA agent failed")
         return {"rca": "Error processing RCA"}
@@ -0,0 +1,127 @@
+"""
+scripts/agents/readiness.py
+
+Startup phases, liveness and readiness for the agent services.
+
+`GET /health` answers as soon as the process serves HTTP; `GET /ready`
+answers 503 until the app's warm-up (model load, index open, a dummy query)
+has finished, then 200 with the cold-start breakdown:
+
+    {"ready": true, "process_s": 0.4, "phases_ms": {"embedding_model": 5100.3, ...},
+     "ready_s": 7.9}
+
+`ready_s` is measured from process start (Linux /proc; module import time
+elsewhere), so it covers interpreter start, imports and warm-up.
+
+`lifespan(warm)` runs `warm` in the background by default, so orchestrators
+see a live process immediately and route traffic once it is ready.
+AGENT_WARM=blocking finishes warm-up before the app accepts connections
+(what scripts/agents/serve.py uses for its workers); AGENT_WARM=0 skips it
+and reports ready at once, leaving the first request to load everything.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+
+def _process_age() -> float:
+    """Seconds since this process started."""
+    try:
+        with open("/proc/self/stat") as fp:
+            start_ticks = int(fp.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as fp:
+            uptime = float(fp.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class Startup:
+    def __init__(self):
+        self.t0 = time.perf_counter() - _process_age()
+        self.process_s = round(time.perf_counter() - self.t0, 3)
+        self.phases_ms: dict[str, float] = {}
+        self.ready = False
+        self.ready_s: float | None = None
+        self.error: str | None = None
+
+    def reset(self) -> None:
+        """Restart the clock in a freshly forked worker (serve.py)."""
+        self.__init__()
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases_ms[name] = round(self.phases_ms.get(name, 0.0)
+                                         + (time.perf_counter() - t0) * 1000, 1)
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.ready_s = round(time.perf_counter() - self.t0, 3)
+        logging.info(f"🟢 Ready in {self.ready_s:.2f}s "
+                     f"({', '.join(f'{k} {v:.0f} ms' for k, v in self.phases_ms.items()) or 'no warm-up'})")
+
+    def snapshot(self) -> dict:
+        return {"ready": self.ready, "process_s": self.process_s, "phases_ms": self.phases_ms,
+                "ready_s": self.ready_s, "error": self.error, "pid": os.getpid()}
+
+
+startup = Startup()
+router = APIRouter()
+
+
+@router.get("/health")
+def health():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+def ready():
+    """Readiness: warm-up finished; 503 until then (or if it failed)."""
+    return JSONResponse(startup.snapshot(), status_code=200 if startup.ready else 503)
+
+
+async def _warm(warm) -> None:
+    try:
+        if warm is not None:
+            await warm()
+        startup.mark_ready()
+    except Exception as e:
+        startup.error = repr(e)
+        logging.exception("❌ Warm-up failed; /ready stays 503")
+
+
+def lifespan(warm=None, inner=None):
+    """FastAPI lifespan that warms the app (see module docstring) inside `inner`."""
+    @asynccontextmanager
+    async def _lifespan(app):
+        mode = os.getenv("AGENT_WARM", "background").lower()
+        async with (inner(app) if inner else _null()):
+            task = None
+            if mode in ("0", "false", "no", "off"):
+                startup.mark_ready()
+            elif mode == "blocking":
+                await _warm(warm)
+            else:
+                task = asyncio.create_task(_warm(warm), name="warm-up")
+            try:
+                yield
+            finally:
+                if task is not None and not task.done():
+                    task.cancel()
+    return _lifespan
+
+
+@asynccontextmanager
+async def _null():
+    yield
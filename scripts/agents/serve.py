@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+scripts/agents/serve.py
+
+Production server for the agents: preload once, prefork N uvicorn workers.
+
+The parent imports the app, loads the read-only heavy state (embedding model,
+BM25 segments, the numpy vector snapshot; see shared.preload), freezes the GC
+so those objects' pages are not dirtied by collection, binds the socket and
+forks the workers. Workers share the preloaded pages copy-on-write, open
+their own Chroma handle / LLM client / event loop, finish warming
+(AGENT_WARM=blocking) and only then accept connections, so no request lands
+on a cold worker. Dead workers are restarted; SIGTERM/SIGINT stop them all.
+
+    python -m scripts.agents.serve scripts.agents.host:app --port 9191 --workers 4
+
+Cold start (parent imports + preload, each worker's ready time, and the time
+until the first worker answers /ready) is logged; a worker's own breakdown is
+on GET /ready.
+
+Workers keep their own metrics registries; each is labelled with its slot
+(`worker="0"` .. N-1, kept by a restarted worker) and shared through
+AGENT_METRICS_DIR (a temp directory by default), so GET /metrics on any
+worker returns every worker's series (see tracing.share). A worker that dies
+is restarted after AGENT_RESTART_MIN_S (default 1s), doubling up to 60s while
+it keeps dying within a minute of starting.
+"""
+import gc
+import importlib
+import os
+import signal
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+# Tokenizers' thread pool does not survive fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+os.environ["AGENT_WARM"] = "blocking"
+
+
+def _load_app(target: str):
+    module, _, attr = target.partition(":")
+    return getattr(importlib.import_module(module), attr or "app")
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, log_level: str, slot: int,
+                metrics_dir: Path) -> None:
+    import uvicorn
+    from scripts import tracing
+    from scripts.agents.readiness import startup
+
+    startup.reset()
+    tracing.share(metrics_dir, str(slot))
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+@click.command()
+@click.argument("target", default="scripts.agents.host:app")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=9191, show_default=True)
+@click.option("--workers", default=lambda: int(os.getenv("AGENT_WORKERS", "2")),
+              show_default="AGENT_WORKERS or 2")
+@click.option("--backlog", default=2048, show_default=True)
+@click.option("--log-level", default="info", show_default=True)
+def main(target, host, port, workers, backlog, log_level):
+    from scripts.logconf import logging
+
+    t0 = time.perf_counter()
+    app = _load_app(target)
+    import_s = time.perf_counter() - t0
+    if "scripts.agents.shared" in sys.modules:  # super alone has nothing to preload
+        from scripts.agents import shared
+        shared.preload()
+        logging.info(f"📦 {target}: imports {import_s:.2f}s, preload "
+                     f"{time.perf_counter() - t0 - import_s:.2f}s ("
+                     f"{', '.join(f'{k} {v:.0f} ms' for k, v in shared.startup.phases_ms.items())})")
+
+    sock = _bind(host, port, backlog)
+    # Objects that exist now are never collected, so GC passes in the workers
+    # do not touch (and copy) the preloaded pages
+    gc.collect()
+    gc.freeze()
+
+    own_dir = not os.getenv("AGENT_METRICS_DIR")
+    metrics_dir = Path(os.getenv("AGENT_METRICS_DIR") or tempfile.mkdtemp(prefix="agent-metrics-"))
+    for stale in metrics_dir.glob("worker-*.json"):
+        stale.unlink(missing_ok=True)
+    min_restart = float(os.getenv("AGENT_RESTART_MIN_S", "1"))
+
+    children: dict[int, tuple[int, float]] = {}  # pid → (slot, started)
+    backoff: dict[int, float] = {}               # slot → next restart delay
+    pending: list[tuple[float, int]] = []        # (due, slot) restarts
+    stopping = False
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock, log_level, slot, metrics_dir)
+            finally:
+                os._exit(0)
+        children[pid] = (slot, time.perf_counter())
+
+    def stop(sig, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+    logging.info(f"🚀 {workers} workers on http://{host}:{port} (pids {sorted(children)})")
+
+    reported = False
+    while children or (pending and not stopping):
+        pid = status = 0
+        if children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                children.clear()
+                continue
+            except InterruptedError:
+                continue
+        if pid == 0:
+            now = time.perf_counter()
+            for due, slot in [p for p in pending if p[0] <= now]:
+                pending.remove((due, slot))
+                if not stopping:
+                    spawn(slot)
+            if not reported and not stopping:
+                reported = _ready(host, port, workers, t0)
+            time.sleep(0.2 if not reported or pending else 1.0)
+            continue
+        info = children.pop(pid, None)
+        if info is None or stopping:
+            continue
+        slot, started = info
+        lived = time.perf_counter() - started
+        # Crash loops back off; a worker that ran for a while restarts promptly
+        delay = min_restart if lived > 60 else backoff.get(slot, min_restart)
+        backoff[slot] = min(60.0, delay * 2)
+        code = os.waitstatus_to_exitcode(status)
+        logging.warning(f"⚠️ Worker {pid} (slot {slot}) exited ({code}) after {lived:.0f}s; "
+                        f"restarting in {delay:.0f}s")
+        pending.append((time.perf_counter() + delay, slot))
+    if own_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    logging.info("🛑 All workers stopped")
+    sys.exit(0)
+
+
+def _ready(host: str, port: int, workers: int, t0: float) -> bool:
+    """Probe /ready once; on the first 200 log the parent-to-serving cold start.
+
+    Workers share one socket, so this proves that some worker is ready; each
+    one logs its own ready time.
+    """
+    import httpx
+    from scripts.logconf import logging
+
+    try:
+        res = httpx.get(f"http://{host}:{port}/ready", timeout=2)
+    except httpx.HTTPError:
+        return False
+    if res.status_code != 200:
+        return False
+    info = res.json()
+    logging.info(f"🟢 Serving after {time.perf_counter() - t0:.2f}s cold start "
+                 f"({workers} workers; worker {info.get('pid')} ready in {info.get('ready_s')}s)")
+    return True
+
+
+if __name__ == "__main__":
+    main()
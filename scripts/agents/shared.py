@@ -1,14 +1,452 @@
 from pathlib import Path
+import asyncio
+import functools
+import hashlib
+import json
 import os
-from openai import OpenAI
-from langchain_community.vectorstores import Chroma
+import threading
+import time
+from collections import defaultdict
+import httpx
+from fastapi import HTTPException
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from scripts.logconf import logging
+from scripts.agents.cache import TTLCache, CachedEmbeddings, CachedVectorStore
+from scripts.agents.answer_cache import AnswerCache, context_hash  # noqa: F401
+from scripts.lexical_index import LexicalIndex
+from scripts import tracing
+from scripts.agents.readiness import startup
 
 BASE = Path(__file__).resolve().parent.parent.parent
 VECTOR_DIR = BASE / "vector_store"
+# Must match the model embed.py stores vectors with
+EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-base-en")
 
-vectordb = Chroma(
-    persist_directory=str(VECTOR_DIR),
-    collection_name="knowledge_base"
+# Heavy state (embedding model, vector store, OpenAI client) is built on first
+# use, so importing an agent is cheap; warm() / preload() build it up front.
+
+class LazyEmbeddings(Embeddings):
+    """HuggingFaceEmbeddings for EMBED_MODEL, loaded on first use."""
+
+    def __init__(self):
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=EMBED_MODEL,
+                        encode_kwargs={"normalize_embeddings": True},
+                    )
+        return self._model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.model.embed_query(text)
+
+# Query-embedding LRU and retrieval-result cache; both reset when ingestion
+# changes the collection (see scripts/index_generation.py)
+embeddings = CachedEmbeddings(
+    LazyEmbeddings(),
+    model_name=EMBED_MODEL,
+    cache=TTLCache(
+        maxsize=int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+        ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+    ),
+)
+
+# chroma = query the live collection; numpy = read-only mmap snapshot written
+# by scripts/export_vectors.py, shared by every agent process via the page cache
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+def _vector_store():
+    if VECTOR_BACKEND == "numpy":
+        from scripts.agents.numpy_store import NumpyVectorStore
+        return NumpyVectorStore(embeddings)
+    from langchain_community.vectorstores import Chroma
+    return Chroma(
+        persist_directory=str(VECTOR_DIR),
+        collection_name="knowledge_base",
+        embedding_function=embeddings,
+    )
+
+vectordb = CachedVectorStore(
+    _vector_store,
+    results=TTLCache(
+        maxsize=int(os.getenv("RESULT_CACHE_SIZE", "512")),
+        ttl=float(os.getenv("RESULT_CACHE_TTL", "300")),
+    ),
+    embeddings=embeddings,
 )
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# BM25 index written by embed.py next to the vectors (scripts/lexical_index.py)
+lexical = LexicalIndex()
+
+# dense = vectors only; hybrid = vectors + BM25 queried concurrently and fused
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "8"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_stage_ms = defaultdict(float)
+_retrievals = 0
+
+
+def chunk_id(doc) -> str:
+    """Rebuild embed.py's `{doc_id}:{md5(chunk)}` id for a retrieved Document."""
+    return f"{doc.metadata.get('doc_id')}:{hashlib.md5(doc.page_content.encode()).hexdigest()}"
+
+
+async def _timed(name: str, timings: dict, aw):
+    t0 = time.perf_counter()
+    try:
+        return await aw
+    finally:
+        timings[name] = round((time.perf_counter() - t0) * 1000, 2)
+
+
+async def retrieve(query: str, k: int = RETRIEVAL_K, mode: str | None = None):
+    """Top-`k` chunks for `query` and per-stage timings in ms.
+
+    Hybrid mode asks the vector store and the BM25 index for 2k candidates each
+    in parallel and merges them with reciprocal rank fusion, so exact
+    identifiers that dense search misses still make the cut.
+    """
+    global _retrievals
+    with tracing.stage("retrieval"):
+        docs, timings = await _retrieve(query, k, mode)
+    _retrievals += 1
+    for stage, ms in timings.items():
+        _stage_ms[stage] += ms
+    return docs, timings
+
+
+async def _retrieve(query: str, k: int, mode: str | None):
+    timings = {}
+    t0 = time.perf_counter()
+    if (mode or RETRIEVAL_MODE) == "dense":
+        docs = await _timed("dense_ms", timings, vectordb.asimilarity_search(query, k=k))
+    else:
+        dense, lex = await asyncio.gather(
+            _timed("dense_ms", timings, vectordb.asimilarity_search(query, k=2 * k)),
+            _timed("lexical_ms", timings, asyncio.to_thread(lexical.search, query, 2 * k)),
+        )
+        t1 = time.perf_counter()
+        scores, by_id = defaultdict(float), {}
+        for rank, d in enumerate(dense):
+            cid = chunk_id(d)
+            by_id.setdefault(cid, d)
+            scores[cid] += 1 / (RRF_K + rank + 1)
+        for rank, (cid, _, text, meta) in enumerate(lex):
+            by_id.setdefault(cid, Document(page_content=text, metadata=meta))
+            scores[cid] += 1 / (RRF_K + rank + 1)
+        docs = [by_id[c] for c in sorted(scores, key=scores.get, reverse=True)[:k]]
+        timings["fuse_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+    timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return docs, timings
+
+
+class FilterError(ValueError):
+    """A metadata filter that is not a flat field → scalar equality map."""
+
+
+def check_filter(flt: dict | None) -> dict | None:
+    """Validate a metadata equality filter ({"src": ..., "page": 3}).
+
+    Both vector backends support exactly this: every field must equal its
+    value. Operators ("$in", ...) and nested values are rejected rather than
+    passed to Chroma, which the NumPy snapshot could not match.
+    """
+    if not flt:
+        return None
+    for field, value in flt.items():
+        if not isinstance(field, str) or not field or field.startswith("$"):
+            raise FilterError(f"unsupported filter field {field!r}: only metadata fields")
+        if not isinstance(value, (str, int, float, bool)):
+            raise FilterError(f"unsupported filter value for {field!r}: only str/int/float/bool equality")
+    return flt
+
+
+def chroma_where(flt: dict | None) -> dict | None:
+    """Chroma's `where` for a checked filter: several fields must be wrapped in $and."""
+    if not flt:
+        return None
+    if len(flt) == 1:
+        return flt
+    return {"$and": [{field: value} for field, value in flt.items()]}
+
+
+def batch_search(queries: list[str], ks: list[int], filters: list[dict | None]):
+    """Dense top-k for many queries: one embedding call, grouped store calls.
+
+    Returns a list of [(Document, score)] per query (score = cosine similarity)
+    and timings in ms. Blocking; call via asyncio.to_thread. Raises FilterError
+    for filters `check_filter` rejects, before any search runs.
+    """
+    filters = [check_filter(f) for f in filters]
+    timings = {}
+    t0 = time.perf_counter()
+    vecs = embeddings.embed_queries(queries)
+    t1 = time.perf_counter()
+    timings["embed_ms"] = round((t1 - t0) * 1000, 2)
+
+    store = vectordb.store
+    if hasattr(store, "batch_search"):
+        results = store.batch_search(vecs, ks, filters)
+    else:
+        # Chroma takes many query vectors per call but one k / filter, so
+        # group queries that share them
+        groups = defaultdict(list)
+        for i, (k, flt) in enumerate(zip(ks, filters)):
+            groups[(k, json.dumps(flt, sort_keys=True))].append(i)
+        results = [None] * len(queries)
+        for (k, _), idx in groups.items():
+            res = store._collection.query(
+                query_embeddings=[list(map(float, vecs[i])) for i in idx], n_results=k,
+                where=chroma_where(filters[idx[0]]),
+                include=["documents", "metadatas", "distances"],
+            )
+            for j, i in enumerate(idx):
+                results[i] = [
+                    # Squared L2 between unit vectors: d = 2 − 2·cos
+                    (Document(page_content=text, metadata=meta or {}), 1 - dist / 2)
+                    for text, meta, dist in zip(res["documents"][j], res["metadatas"][j],
+                                                res["distances"][j])
+                ]
+    timings["search_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+    return results, timings
+
+
+def retrieval_stats() -> dict:
+    return {
+        "mode": RETRIEVAL_MODE,
+        "k": RETRIEVAL_K,
+        "requests": _retrievals,
+        "avg_ms": {s: round(ms / _retrievals, 2) for s, ms in _stage_ms.items()} if _retrievals else {},
+        "lexical": lexical.stats(),
+    }
+
+WARM_QUERY = os.getenv("AGENT_WARM_QUERY", "service restart procedure")
+
+
+def preload() -> None:
+    """Load the read-only heavy state: embedding model, BM25 segments and, for
+    VECTOR_BACKEND=numpy, the mmap'd snapshot.
+
+    Safe to call before forking workers (scripts/agents/serve.py), which then
+    share these pages copy-on-write. Chroma is left to `warm()`: its SQLite
+    handle must be opened in the process that uses it.
+    """
+    with startup.phase("embedding_model"):
+        _ = embeddings.inner.model
+    with startup.phase("lexical_index"):
+        lexical.reload_if_changed()
+    if VECTOR_BACKEND == "numpy":
+        with startup.phase("vector_store"):
+            vectordb.store
+    if os.getenv("RERANK_MODEL"):
+        from scripts.agents.context import reranker
+        with startup.phase("reranker"):
+            reranker()
+
+
+def _warm_query() -> None:
+    """One uncached dense + lexical lookup so first-request lazy init happens now."""
+    vec = embeddings.inner.embed_query(WARM_QUERY)
+    vectordb.store.similarity_search_by_vector(vec, k=RETRIEVAL_K)
+    lexical.search(WARM_QUERY, RETRIEVAL_K)
+
+
+async def warm() -> None:
+    """Startup warm-up for readiness.lifespan: preload, open the vector store,
+    create the LLM client and run a dummy query."""
+    await asyncio.to_thread(preload)
+    with startup.phase("vector_store"):
+        await asyncio.to_thread(lambda: vectordb.store)
+    with startup.phase("llm_client"):
+        openai_client()
+    with startup.phase("warm_query"):
+        await asyncio.to_thread(_warm_query)
+
+# Finished answers keyed on (mode, question, retrieved-context hash), with
+# near-duplicate matching; persisted so repeats survive restarts
+answers = AnswerCache(
+    embeddings,
+    db_path=Path(os.getenv("ANSWER_CACHE_DB", str(BASE / "state" / "answers.sqlite3"))),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    enabled=os.getenv("ANSWER_CACHE", "1").lower() not in ("0", "false", "no"),
+)
+
+_client = None
+
+
+def openai_client():
+    """One async client per process with a shared keep-alive pool, so hundreds of
+    in-flight completions reuse connections instead of tying up threads.
+
+    Created on first use: it binds to the running event loop's connections, so
+    a preforked worker must not inherit one from the parent.
+    """
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "512")),
+                    max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "128")),
+                ),
+                timeout=httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT", "120")), connect=10.0),
+            ),
+        )
+    return _client
+
+NDJSON = "application/x-ndjson"
+
+
+async def complete(prompt: str, model: str = "gpt-4") -> str:
+    """One buffered completion, timed as the `llm` stage with token usage recorded."""
+    with tracing.stage("llm"):
+        res = await openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "system", "content": prompt}],
+        )
+    if res.usage:
+        tracing.tokens(model, res.usage.prompt_tokens, res.usage.completion_tokens)
+    return res.choices[0].message.content.strip()
+
+
+async def stream_tokens(prompt: str, model: str = "gpt-4"):
+    """Yield completion tokens as the model produces them.
+
+    Timed as `llm_first_token` and `llm`; token usage comes from the final
+    usage chunk, or a chunk count if the server does not send one.
+    """
+    t0 = time.perf_counter()
+    chunks, usage = 0, None
+    try:
+        stream = await openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "system", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not chunks:
+                    tracing.record("llm_first_token", time.perf_counter() - t0)
+                chunks += 1
+                yield chunk.choices[0].delta.content
+    finally:
+        tracing.record("llm", time.perf_counter() - t0)
+        if usage:
+            tracing.tokens(model, usage.prompt_tokens, usage.completion_tokens)
+        else:
+            tracing.tokens(model, completion=chunks)
+
+
+async def ndjson_lines(key: str, tokens, error: str):
+    """Frame a token stream as NDJSON (`{key: token}` per line) ending in `[DONE]`.
+
+    This is the wire format /super relays and backend/routes/chat.py:chat_stream
+    reads. A failure mid-stream sends `{key: error}` before the sentinel.
+    """
+    try:
+        async for token in tokens:
+            yield json.dumps({key: token}) + "\n"
+    except Exception:
+        logging.exception(f"{key} stream failed")
+        yield json.dumps({key: error}) + "\n"
+    yield "[DONE]\n"
+
+
+RETRY_AFTER_S = os.getenv("AGENT_RETRY_AFTER_S", "1")
+LIMITERS: dict[str, "ConcurrencyLimiter"] = {}
+
+
+def limiter_stats() -> dict:
+    """Load-shedding counters of every limiter in this process, by agent name."""
+    return {name: limiter.stats() for name, limiter in sorted(LIMITERS.items())}
+
+
+class ConcurrencyLimiter:
+    """Bound in-flight work per agent and reject once the wait queue is full.
+
+    Limits come from <NAME>_MAX_CONCURRENCY / <NAME>_MAX_QUEUE, falling back to
+    AGENT_MAX_CONCURRENCY / AGENT_MAX_QUEUE. A full queue answers 503 right
+    away, with Retry-After: AGENT_RETRY_AFTER_S (default 1), instead of
+    letting requests pile up behind slow LLM calls. Every limiter registers
+    itself, so /cache/stats reports all of them via `limiter_stats()`.
+
+        limiter = ConcurrencyLimiter("rca")
+
+        @router.post("/rca")
+        @limiter
+        async def root_cause_analysis(req: RCARequest): ...
+    """
+
+    def __init__(self, name: str):
+        prefix = name.upper()
+        self.name = name
+        self.max_concurrency = int(os.getenv(f"{prefix}_MAX_CONCURRENCY",
+                                             os.getenv("AGENT_MAX_CONCURRENCY", "256")))
+        self.max_queue = int(os.getenv(f"{prefix}_MAX_QUEUE",
+                                       os.getenv("AGENT_MAX_QUEUE", "1024")))
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        LIMITERS[name] = self
+
+    def admit(self) -> None:
+        """Raise 503 if the wait queue is full.
+
+        Streaming endpoints call this before returning their response, so a
+        rejection is still a plain 503 rather than an error inside the stream.
+        """
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            logging.warning(f"🚦 {self.name} agent saturated: {self.waiting} queued, rejecting")
+            raise HTTPException(503, f"{self.name} agent is busy, retry shortly",
+                                headers={"Retry-After": RETRY_AFTER_S})
+
+    async def __aenter__(self):
+        self.admit()
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._sem.release()
+
+    def __call__(self, handler):
+        """Use as a decorator on an async endpoint."""
+        @functools.wraps(handler)
+        async def limited(*args, **kwargs):
+            async with self:
+                return await handler(*args, **kwargs)
+        return limited
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
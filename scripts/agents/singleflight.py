@@ -0,0 +1,120 @@
+"""
+scripts/agents/singleflight.py
+
+In-flight request coalescing for /super.
+
+Concurrent identical requests (same mode and payload) share one upstream
+call: the first caller starts it as a task and everyone awaits that task, so a
+burst of N identical questions costs one retrieval and one completion.
+Streams are fanned out: the first caller opens the stream, which is pumped
+into a replay buffer that every subscriber, early or late, reads from the
+first line.
+
+The upstream task is shielded from its callers, so a leader whose client
+disconnects does not cancel the answer the others are waiting for.
+"""
+
+import asyncio
+import json
+from collections import defaultdict
+
+from scripts.logconf import logging
+
+
+def flight_key(mode: str, payload: dict, stream: bool = False) -> tuple:
+    return (mode, stream, json.dumps(payload, sort_keys=True, default=str))
+
+
+class _Broadcast:
+    """Pump one async line iterator into a buffer that many subscribers replay."""
+
+    def __init__(self, source):
+        self.lines: list[str] = []
+        self.done = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source) -> None:
+        try:
+            async for line in source:
+                self.lines.append(line)
+                self._notify()
+        except Exception:
+            logging.exception("Coalesced stream failed")
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self):
+        i = 0
+        while True:
+            while i < len(self.lines):
+                yield self.lines[i]
+                i += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Deduplicate concurrent identical calls, with per-mode counters."""
+
+    def __init__(self):
+        self._calls: dict[tuple, asyncio.Future] = {}
+        self._streams: dict[tuple, _Broadcast] = {}
+        self.leaders: dict[str, int] = defaultdict(int)
+        self.coalesced: dict[str, int] = defaultdict(int)
+
+    async def do(self, key: tuple, fn):
+        """Await `fn()` once for all concurrent callers with the same `key`."""
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders[key[0]] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced[key[0]] += 1
+            logging.info(f"🧲 Coalesced {key[0]} request onto in-flight call")
+        return await asyncio.shield(task)
+
+    async def stream(self, key: tuple, open_fn):
+        """Subscribe to the in-flight stream for `key`, opening one with `await open_fn()` if there is none.
+
+        The leader opens the source before anyone subscribes, so an error raised
+        while opening (an upstream 503) reaches the leader as an exception rather
+        than inside a stream the followers share.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            source = await open_fn()
+            if key in self._streams:
+                # Another leader opened the same stream meanwhile: relay ours alone
+                return source
+            self.leaders[key[0]] += 1
+            flight = _Broadcast(source)
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._streams.pop(key, None))
+        else:
+            self.coalesced[key[0]] += 1
+            logging.info(f"🧲 Coalesced {key[0]} stream onto in-flight stream")
+        return flight.subscribe()
+
+    def stats(self) -> dict:
+        modes = set(self.leaders) | set(self.coalesced)
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "modes": {
+                m: {
+                    "upstream_calls": self.leaders[m],
+                    "coalesced": self.coalesced[m],
+                    "saved_ratio": round(self.coalesced[m] / (self.leaders[m] + self.coalesced[m]), 4)
+                    if self.leaders[m] + self.coalesced[m] else 0.0,
+                }
+                for m in sorted(modes)
+            },
+        }
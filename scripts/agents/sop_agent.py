@@ -1,7 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from scripts.logconf import logging
-from scripts.agents.shared import vectordb, client
+from scripts import tracing
+from scripts.agents import readiness
+from scripts.agents.context import assemble, stats as context_stats
+from scripts.agents.shared import (vectordb, complete, ConcurrencyLimiter, NDJSON,
+                                   stream_tokens, ndjson_lines, answers, context_hash,
+                                   retrieve, retrieval_stats, limiter_stats, warm)
 import signal
 import sys
 
@@ -11,29 +17,62 @@ def handle_shutdown(sig, frame):
 
 signal.signal(signal.SIGTERM, handle_shutdown)
 
-app = FastAPI()
+app = FastAPI(lifespan=readiness.lifespan(warm))
+router = APIRouter(route_class=tracing.TimedRoute)
+limiter = ConcurrencyLimiter("sop")
 
 class SOPRequest(BaseModel):
     topic: str
 
-@app.post("/sop")
-def sop_generation(req: SOPRequest):
-    logging.info(f"🔥 Received SOP request: {req.topic}")
-    try:
-        docs = vectordb.similarity_search(req.topic, k=8)
-        context = "\n---\n".join([d.page_content for d in docs])
-        prompt = f"""You're a knowledge assistant. Draft a step-by-step SOP from the below context.
+async def _prompt(topic: str) -> tuple[str, str]:
+    """Retrieve context for `topic`; returns (context hash for the answer cache, prompt)."""
+    docs, _ = await retrieve(topic)
+    context = await assemble(topic, docs)
+    return context_hash(docs), f"""You're a knowledge assistant. Draft a step-by-step SOP from the below context.
         
 Context:
 {context}
 
 Output in markdown-style numbered steps. **When you answer, ALWAYS use markdown lists or sub-lists with numbered or bulleted steps.**
 """
-        res = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        return {"sop": res.choices[0].message.content.strip()}
+
+@router.post("/sop")
+@limiter
+async def sop_generation(req: SOPRequest):
+    logging.info(f"🔥 Received SOP request: {req.topic}")
+    try:
+        ctx, prompt = await _prompt(req.topic)
+        cached = await answers.get("sop", req.topic, ctx)
+        if cached is not None:
+            return {"sop": cached, "cache": "hit"}
+        answer = await complete(prompt)
+        await answers.put("sop", req.topic, ctx, answer)
+        return {"sop": answer, "cache": "miss"}
     except Exception as e:
         logging.exception("SOP agent failed")
         return {"sop": "Error generating SOP"}
+
+async def _sop_tokens(req: SOPRequest):
+    async with limiter:
+        logging.info(f"🔥 Received SOP stream request: {req.topic}")
+        ctx, prompt = await _prompt(req.topic)
+        async for token in answers.stream("sop", req.topic, ctx, stream_tokens(prompt)):
+            yield token
+
+def sop_stream(req: SOPRequest):
+    """NDJSON lines `{"sop": token}` … `[DONE]`; also used by /super in-process."""
+    return ndjson_lines("sop", _sop_tokens(req), "Error generating SOP")
+
+@router.post("/sop/stream")
+async def sop_generation_stream(req: SOPRequest):
+    limiter.admit()
+    return StreamingResponse(sop_stream(req), media_type=NDJSON)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**vectordb.stats(), "answers": answers.stats(), "retrieval": retrieval_stats(),
+            "context": context_stats.snapshot(), "limiters": limiter_stats()}
+
+app.include_router(router)
+app.include_router(readiness.router)
+tracing.instrument(app, "sop")
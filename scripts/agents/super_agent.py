@@ -1,7 +1,17 @@
 # scripts/agents/super_agent.py
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+import asyncio
+import json
+import os
 import httpx
 from scripts.logconf import logging
+from scripts import http_pool, tracing
+from scripts.http_pool import PooledClient
+from scripts.agents.singleflight import SingleFlight, flight_key
+from scripts.agents import readiness
 import signal
 import sys
 
@@ -19,26 +29,161 @@ AGENTS = {
     "ticket": "http://127.0.0.1:9133/ticket"
 }
 
-app = FastAPI()
+# One long-lived pool per downstream agent; <MODE>_UDS (e.g. RCA_UDS) routes it
+# over a Unix socket when the agent runs with `uvicorn --uds`
+AGENT_CLIENTS = {
+    mode: PooledClient(f"super→{mode}", timeout=90.0, uds_env=f"{mode.upper()}_UDS")
+    for mode in AGENTS
+}
+
+# Modes whose identical concurrent requests share one upstream call
+# (COALESCE_MODES="" turns coalescing off)
+COALESCE_MODES = {m.strip() for m in os.getenv("COALESCE_MODES", "rca,sop,ticket").split(",")
+                  if m.strip()}
+flights = SingleFlight()
+
+# mode → (handler, request model, stream fn, admit fn) for agents mounted in this
+# process (see host.py). Modes listed here are dispatched in-process instead of
+# over HTTP; `admit` (the agent's ConcurrencyLimiter.admit) sheds load before a
+# stream starts, as the agent's own /stream endpoint does.
+LOCAL_AGENTS = {}
+
+def register_local(mode: str, handler, model, stream=None, admit=None) -> None:
+    LOCAL_AGENTS[mode] = (handler, model, stream, admit)
+
+# No local index to warm: ready once the downstream pools are open
+app = FastAPI(lifespan=readiness.lifespan(inner=http_pool.lifespan(*AGENT_CLIENTS.values())))
+router = APIRouter(route_class=tracing.TimedRoute)
+
+async def _call_local(mode: str, payload: dict):
+    handler, model, *_ = LOCAL_AGENTS[mode]
+    try:
+        req = model(**payload)
+    except ValidationError as e:
+        return {"error": f"Invalid payload for {mode} agent", "detail": e.errors()}
+    logging.info(f"🔁 Dispatching to in-process {mode} agent...")
+    if asyncio.iscoroutinefunction(handler):
+        return await handler(req)
+    return await run_in_threadpool(handler, req)
+
+def _error_line(error: str, **detail) -> str:
+    return json.dumps({"error": error, **detail}) + "\n"
+
+def _overloaded(mode: str, res: httpx.Response) -> HTTPException:
+    """Relay an agent's load-shedding 503 to our caller, Retry-After included."""
+    try:
+        detail = res.json().get("detail", res.text)
+    except ValueError:
+        detail = res.text
+    return HTTPException(503, detail or f"{mode} agent is busy, retry shortly",
+                         headers={"Retry-After": res.headers.get("retry-after", "1")})
+
+async def _error_stream(error: str, **detail):
+    yield _error_line(error, **detail)
+    yield "[DONE]\n"
+
+async def _relay(mode: str, upstream, res: httpx.Response):
+    """Relay an opened agent NDJSON stream line by line, without buffering."""
+    try:
+        if res.is_error:
+            await res.aread()
+            yield _error_line(f"{mode} agent returned HTTP error",
+                              status_code=res.status_code, detail=res.text)
+            yield "[DONE]\n"
+            return
+        async for line in res.aiter_lines():
+            if line:
+                yield line + "\n"
+    except Exception as e:
+        logging.exception("Super agent stream failed")
+        yield _error_line(f"Failed to contact {mode} agent", detail=str(e))
+        yield "[DONE]\n"
+    finally:
+        await upstream.__aexit__(None, None, None)
 
-@app.post("/super")
+async def _local_stream(mode: str, stream, req):
+    try:
+        async for line in stream(req):
+            yield line
+    except Exception as e:
+        logging.exception("Super agent stream failed")
+        yield _error_line(f"Failed to contact {mode} agent", detail=str(e))
+        yield "[DONE]\n"
+
+async def _open_stream(mode: str, payload: dict):
+    """Start an agent's NDJSON token stream and return its lines.
+
+    Raises HTTPException(503) when the agent sheds load, before any response
+    is sent; every other failure becomes an error line in the stream.
+    """
+    local = LOCAL_AGENTS.get(mode)
+    if local and local[2]:
+        _, model, stream, admit = local
+        try:
+            req = model(**payload)
+        except ValidationError as e:
+            return _error_stream(f"Invalid payload for {mode} agent", detail=e.errors())
+        if admit:
+            admit()
+        logging.info(f"🔁 Streaming from in-process {mode} agent...")
+        return _local_stream(mode, stream, req)
+
+    if mode not in AGENTS:
+        return _error_stream(f"Invalid mode '{mode}'")
+
+    logging.info(f"🔁 Streaming from {mode} agent...")
+    upstream = AGENT_CLIENTS[mode].stream("POST", f"{AGENTS[mode]}/stream", json=payload,
+                                          timeout=None)
+    try:
+        res = await upstream.__aenter__()
+    except Exception as e:
+        logging.exception("Super agent stream failed")
+        return _error_stream(f"Failed to contact {mode} agent", detail=str(e))
+    if res.status_code == 503:
+        await res.aread()
+        await upstream.__aexit__(None, None, None)
+        raise _overloaded(mode, res)
+    return _relay(mode, upstream, res)
+
+async def _forward(mode: str, payload: dict):
+    if mode in LOCAL_AGENTS:
+        return await _call_local(mode, payload)
+
+    if mode not in AGENTS:
+        return {"error": f"Invalid mode '{mode}'"}
+
+    logging.info(f"🔁 Forwarding to {mode} agent...")
+    res = await AGENT_CLIENTS[mode].post(AGENTS[mode], json=payload)
+    if res.status_code == 503:
+        raise _overloaded(mode, res)
+    res.raise_for_status()
+    return res.json()  # ✅ FIXED HERE — no await
+
+@router.post("/super")
 async def super_agent(request: Request):
     try:
         data = await request.json()
         mode = data.get("mode")
         payload = data.get("payload", {})
+        coalesce = mode in COALESCE_MODES
 
-        if mode not in AGENTS:
-            return {"error": f"Invalid mode '{mode}'"}
+        if data.get("stream"):
+            lines = (await flights.stream(flight_key(mode, payload, stream=True),
+                                          lambda: _open_stream(mode, payload))
+                     if coalesce else await _open_stream(mode, payload))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
 
-        async with httpx.AsyncClient(timeout=90.0) as client:
-            logging.info(f"🔁 Forwarding to {mode} agent...")
-            res = await client.post(AGENTS[mode], json=payload)
-            res.raise_for_status()
-            response_json = res.json()  # ✅ FIXED HERE — no await
-            logging.info(f"✅ Response from {mode} agent: {response_json}")
-            return response_json
+        if coalesce:
+            response_json = await flights.do(flight_key(mode, payload),
+                                             lambda: _forward(mode, payload))
+        else:
+            response_json = await _forward(mode, payload)
+        logging.info(f"✅ Response from {mode} agent: {response_json}")
+        return response_json
 
+    except HTTPException:
+        # Load shedding (ConcurrencyLimiter): callers get the 503 and Retry-After
+        raise
     except httpx.HTTPStatusError as e:
         return {
             "error": f"{mode} agent returned HTTP error",
@@ -49,4 +194,16 @@ async def super_agent(request: Request):
         logging.exception("Super agent failed")
         return {"error": f"Failed to contact {mode} agent", "detail": str(e)}
 
+@router.get("/http/stats")
+async def http_stats():
+    """Per-hop connection reuse and connect vs. request time."""
+    return http_pool.stats(*AGENT_CLIENTS.values())
+
+@router.get("/coalesce/stats")
+async def coalesce_stats():
+    """Upstream calls vs. requests served from an in-flight call, per mode."""
+    return {"modes_enabled": sorted(COALESCE_MODES), **flights.stats()}
 
+app.include_router(router)
+app.include_router(readiness.router)
+tracing.instrument(app, "super")
@@ -1,7 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from scripts.logconf import logging
-from scripts.agents.shared import vectordb, client
+from scripts import tracing
+from scripts.agents import readiness
+from scripts.agents.context import assemble, stats as context_stats
+from scripts.agents.shared import (vectordb, complete, ConcurrencyLimiter, NDJSON,
+                                   stream_tokens, ndjson_lines, answers, context_hash,
+                                   retrieve, retrieval_stats, limiter_stats, warm)
 import signal
 import sys
 
@@ -11,32 +17,65 @@ def handle_shutdown(sig, frame):
 
 signal.signal(signal.SIGTERM, handle_shutdown)
 
-app = FastAPI()
+app = FastAPI(lifespan=readiness.lifespan(warm))
+router = APIRouter(route_class=tracing.TimedRoute)
+limiter = ConcurrencyLimiter("ticket")
 
 class TicketRequest(BaseModel):
     topic: str  # 🎯 Change from `title` & `notes` to a unified `topic`
 
-@app.post("/ticket")
-def resolve_ticket(req: TicketRequest):
-    try:
-        logging.info(f"🎫 Ticket received: {req.topic}")
-        docs = vectordb.similarity_search(req.topic, k=8)
-        context = "\n---\n".join([d.page_content for d in docs])
-        prompt = f"""You're a support engineer. Draft a suggested resolution for the below ticket using past case knowledge.
+async def _prompt(topic: str) -> tuple[str, str]:
+    """Retrieve context for `topic`; returns (context hash for the answer cache, prompt)."""
+    docs, _ = await retrieve(topic)
+    context = await assemble(topic, docs)
+    return context_hash(docs), f"""You're a support engineer. Draft a suggested resolution for the below ticket using past case knowledge.
 
 Context:
 {context}
 
 Ticket:
-{req.topic}
+{topic}
 
 Output a one-paragraph summary and a ready-to-send ticket reply. **When you answer, ALWAYS use markdown lists or sub-lists with numbered or bulleted steps.**
 """
-        res = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        return {"resolution": res.choices[0].message.content.strip()}
+
+@router.post("/ticket")
+@limiter
+async def resolve_ticket(req: TicketRequest):
+    try:
+        logging.info(f"🎫 Ticket received: {req.topic}")
+        ctx, prompt = await _prompt(req.topic)
+        cached = await answers.get("ticket", req.topic, ctx)
+        if cached is not None:
+            return {"resolution": cached, "cache": "hit"}
+        answer = await complete(prompt)
+        await answers.put("ticket", req.topic, ctx, answer)
+        return {"resolution": answer, "cache": "miss"}
     except Exception:
         logging.exception("Ticket agent failed")
         return {"resolution": "Error resolving ticket"}
+
+async def _ticket_tokens(req: TicketRequest):
+    async with limiter:
+        logging.info(f"🎫 Ticket stream received: {req.topic}")
+        ctx, prompt = await _prompt(req.topic)
+        async for token in answers.stream("ticket", req.topic, ctx, stream_tokens(prompt)):
+            yield token
+
+def ticket_stream(req: TicketRequest):
+    """NDJSON lines `{"resolution": token}` … `[DONE]`; also used by /super in-process."""
+    return ndjson_lines("resolution", _ticket_tokens(req), "Error resolving ticket")
+
+@router.post("/ticket/stream")
+async def resolve_ticket_stream(req: TicketRequest):
+    limiter.admit()
+    return StreamingResponse(ticket_stream(req), media_type=NDJSON)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**vectordb.stats(), "answers": answers.stats(), "retrieval": retrieval_stats(),
+            "context": context_stats.snapshot(), "limiters": limiter_stats()}
+
+app.include_router(router)
+app.include_router(readiness.router)
+tracing.instrument(app, "ticket")
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+"""
+scripts/bench/loadtest.py
+
+Offline end-to-end load test for chat → super → agent → retrieval → LLM.
+
+Optionally starts the whole stack locally (stub LLM, combined agent host,
+backend) with the agents pointed at scripts/bench/stub_openai.py, then replays
+questions at a target rate and concurrency against each hop in turn:
+
+    chat   backend  POST /chat        (stream: GET /chat/stream, SSE)
+    super  agents   POST /super       (stream: "stream": true, NDJSON)
+    agent  agents   POST /<mode>      (stream: POST /<mode>/stream)
+
+Questions come from backend/logs/chat.log (and its rotated .gz segments) or a
+synthetic set. For every hop it reports p50/p95/p99 latency, time to first
+token (streaming) and error rate, and writes everything to a JSON file
+(bench_results/<time>-<commit>.json) that `--compare` diffs against a
+previous run.
+
+    python -m scripts.bench.loadtest --start-stack --rps 20 --concurrency 32 --requests 300
+    python -m scripts.bench.loadtest --stream --compare bench_results/old.json
+"""
+import asyncio
+import datetime as dt
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import click
+import httpx
+
+BASE = Path(__file__).resolve().parent.parent.parent
+CHAT_LOG = Path(os.getenv("CHAT_LOG", BASE / "backend" / "logs" / "chat.log"))
+RESULTS = BASE / "bench_results"
+
+SYNTHETIC = [
+    ("rca", "Checkout API latency spiked to 5s after the 14:00 deploy"),
+    ("rca", "Database connections exhausted on db01.prod, ERR-504 from gateway"),
+    ("sop", "How do I rotate the TLS certificate on the ingress controller?"),
+    ("sop", "Steps to fail over the primary Postgres cluster"),
+    ("ticket", "Customer cannot log in after password reset, error AUTH-401"),
+    ("ticket", "Nightly export job failed with disk quota exceeded"),
+]
+
+
+# ---- questions ----------------------------------------------------------------
+
+def load_questions(path: Path, limit: int) -> list[tuple[str, str]]:
+    """(mode, question) pairs from the chat log and its gzip segments."""
+    files = sorted(path.parent.glob(f"{path.stem}-*{path.suffix}.gz")) + [path]
+    out = []
+    for f in files:
+        if not f.exists():
+            continue
+        opener = gzip.open if f.suffix == ".gz" else open
+        with opener(f, "rt", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if rec.get("question") and rec.get("mode") in ("rca", "sop", "ticket"):
+                    out.append((rec["mode"], rec["question"]))
+    return out[-limit:] if limit else out
+
+
+# ---- stack ------------------------------------------------------------------
+
+def _wait(url: str, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise click.ClickException(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def stack(stub_port: int, agents_port: int, backend_port: int, keep_caches: bool,
+          workers: int):
+    """Start stub LLM, combined agent host and backend; stop them on exit."""
+    env = dict(os.environ,
+               OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+               OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "stub"),
+               SUPER_URL=f"http://127.0.0.1:{agents_port}/super",
+               # Keep replayed traffic out of the real chat log
+               CHAT_LOG=str(RESULTS / "stack-chat.log"))
+    if not keep_caches:
+        # Measure the chain, not the answer cache / request coalescing
+        env.update(ANSWER_CACHE="0", COALESCE_MODES="")
+    uv = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    procs = [
+        subprocess.Popen([sys.executable, "-m", "scripts.bench.stub_openai",
+                          "--port", str(stub_port)], cwd=BASE, env=env),
+        subprocess.Popen(uv + ["scripts.agents.host:app", "--port", str(agents_port),
+                               "--workers", str(workers)], cwd=BASE, env=env),
+        subprocess.Popen(uv + ["backend.main:app", "--port", str(backend_port)],
+                         cwd=BASE, env=env),
+    ]
+    try:
+        _wait(f"http://127.0.0.1:{stub_port}/health")
+        _wait(f"http://127.0.0.1:{agents_port}/ready")
+        _wait(f"http://127.0.0.1:{backend_port}/openapi.json")
+        yield
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+# ---- requests -----------------------------------------------------------------
+
+def _request(hop: str, mode: str, question: str, stream: bool, urls: dict):
+    """(method, url, kwargs) for one request against `hop`."""
+    payload = {"topic": question}
+    if hop == "chat":
+        if stream:
+            return "GET", f"{urls['chat']}/chat/stream", {"params": {"text": question, "mode": mode}}
+        return "POST", f"{urls['chat']}/chat", {"json": {"text": question, "mode": mode}}
+    if hop == "super":
+        body = {"mode": mode, "payload": payload}
+        if stream:
+            body["stream"] = True
+        return "POST", f"{urls['agents']}/super", {"json": body}
+    return "POST", f"{urls['agents']}/{mode}{'/stream' if stream else ''}", {"json": payload}
+
+
+def _is_error(body) -> bool:
+    if isinstance(body, dict):
+        if "error" in body:
+            return True
+        return any(isinstance(v, str) and v.startswith("Error ") for v in body.values())
+    return False
+
+
+async def one(client: httpx.AsyncClient, hop: str, mode: str, question: str, stream: bool,
+              urls: dict) -> dict:
+    method, url, kwargs = _request(hop, mode, question, stream, urls)
+    t0 = time.perf_counter()
+    ttft = None
+    try:
+        if not stream:
+            res = await client.request(method, url, **kwargs)
+            ok = res.status_code < 400 and not _is_error(res.json())
+        else:
+            ok = True
+            async with client.stream(method, url, **kwargs) as res:
+                ok = res.status_code < 400
+                async for line in res.aiter_lines():
+                    if not line.strip() or line.startswith((":", "event:")):
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    if '"error"' in line:
+                        ok = False
+        return {"ok": ok, "latency": time.perf_counter() - t0, "ttft": ttft}
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - t0, "ttft": None, "exc": repr(e)}
+
+
+async def run_hop(hop: str, questions: list, rps: float, concurrency: int, n: int,
+                  stream: bool, urls: dict, timeout: float) -> dict:
+    """Open-loop replay: request i is due at i / rps, capped at `concurrency` in flight."""
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+
+        async def fire(i: int):
+            await asyncio.sleep(max(0.0, start + i / rps - time.perf_counter()))
+            async with sem:
+                mode, q = questions[i % len(questions)]
+                return await one(client, hop, mode, q, stream, urls)
+
+        results = await asyncio.gather(*(fire(i) for i in range(n)))
+        wall = time.perf_counter() - start
+    return summarize(results, wall)
+
+
+def pct(values: list[float], p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] * 1000, 1)
+
+
+def summarize(results: list[dict], wall: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    lat = [r["latency"] for r in ok]
+    ttft = [r["ttft"] for r in ok if r["ttft"] is not None]
+    errors = [r.get("exc") for r in results if not r["ok"] and r.get("exc")]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0.0,
+        "achieved_rps": round(len(results) / wall, 2) if wall else 0.0,
+        "latency_ms": {"p50": pct(lat, 50), "p95": pct(lat, 95), "p99": pct(lat, 99)},
+        "ttft_ms": {"p50": pct(ttft, 50), "p95": pct(ttft, 95), "p99": pct(ttft, 99)},
+        "sample_errors": errors[:5],
+    }
+
+
+# ---- reporting ----------------------------------------------------------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(hops: dict, baseline: dict | None) -> None:
+    for hop, r in hops.items():
+        line = (f"{hop:>6}: {r['requests']} req, {r['error_rate'] * 100:.1f}% errors, "
+                f"{r['achieved_rps']} rps | latency p50/p95/p99 "
+                f"{r['latency_ms']['p50']}/{r['latency_ms']['p95']}/{r['latency_ms']['p99']} ms")
+        if r["ttft_ms"]["p50"] is not None:
+            line += f" | TTFT p50/p95 {r['ttft_ms']['p50']}/{r['ttft_ms']['p95']} ms"
+        click.echo(line)
+        old = (baseline or {}).get("hops", {}).get(hop)
+        if old:
+            for metric in ("latency_ms", "ttft_ms"):
+                for p in ("p50", "p95", "p99"):
+                    a, b = old[metric][p], r[metric][p]
+                    if a and b:
+                        click.echo(f"        {metric} {p}: {a} → {b} ms ({(b - a) / a * 100:+.1f}%)")
+            click.echo(f"        error_rate: {old['error_rate']} → {r['error_rate']}")
+
+
+@click.command()
+@click.option("--hops", default="chat,super,agent", show_default=True,
+              help="Comma-separated entry points to load")
+@click.option("--rps", default=10.0, show_default=True, help="Target request rate per hop")
+@click.option("--concurrency", default=32, show_default=True, help="Max requests in flight")
+@click.option("--requests", "n", default=200, show_default=True, help="Requests per hop")
+@click.option("--stream", is_flag=True, help="Use the streaming endpoints and measure TTFT")
+@click.option("--questions", type=click.Path(path_type=Path), default=CHAT_LOG,
+              show_default=True, help="Chat log to replay (falls back to synthetic questions)")
+@click.option("--synthetic", is_flag=True, help="Ignore the chat log")
+@click.option("--start-stack", is_flag=True,
+              help="Start stub LLM + agent host + backend locally for the run")
+@click.option("--keep-caches", is_flag=True,
+              help="[stack] Leave the answer cache and request coalescing on")
+@click.option("--agent-workers", default=1, show_default=True, help="[stack] uvicorn workers")
+@click.option("--chat-url", default="http://127.0.0.1:8000", show_default=True)
+@click.option("--agents-url", default="http://127.0.0.1:9191", show_default=True)
+@click.option("--stub-port", default=9300, show_default=True)
+@click.option("--timeout", default=120.0, show_default=True, help="Per-request timeout (s)")
+@click.option("--out", type=click.Path(path_type=Path), help="Results JSON (default bench_results/)")
+@click.option("--compare", type=click.Path(exists=True, path_type=Path),
+              help="Previous results JSON to diff against")
+@click.option("--seed", default=0, show_default=True)
+def main(hops, rps, concurrency, n, stream, questions, synthetic, start_stack, keep_caches,
+         agent_workers, chat_url, agents_url, stub_port, timeout, out, compare, seed):
+    random.seed(seed)
+    qs = [] if synthetic else load_questions(questions, limit=10_000)
+    source = str(questions) if qs else "synthetic"
+    if not qs:
+        qs = SYNTHETIC
+    random.shuffle(qs)
+    urls = {"chat": chat_url.rstrip("/"), "agents": agents_url.rstrip("/")}
+    hop_list = [h.strip() for h in hops.split(",") if h.strip()]
+    for h in hop_list:
+        if h not in ("chat", "super", "agent"):
+            raise click.BadParameter(f"unknown hop '{h}'", param_hint="--hops")
+
+    def run():
+        return {h: asyncio.run(run_hop(h, qs, rps, concurrency, n, stream, urls, timeout))
+                for h in hop_list}
+
+    click.echo(f"🔥 {n} requests/hop at {rps} rps, concurrency {concurrency}, "
+               f"{'streaming' if stream else 'buffered'}, {len(qs)} questions ({source})")
+    if start_stack:
+        RESULTS.mkdir(exist_ok=True)
+        with stack(stub_port, int(agents_url.rsplit(":", 1)[1]),
+                   int(chat_url.rsplit(":", 1)[1]), keep_caches, agent_workers):
+            results = run()
+    else:
+        results = run()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": dt.datetime.utcnow().isoformat(),
+        "config": {"hops": hop_list, "rps": rps, "concurrency": concurrency, "requests": n,
+                   "stream": stream, "questions": source, "stack": start_stack,
+                   "keep_caches": keep_caches},
+        "hops": results,
+    }
+    baseline = json.loads(compare.read_text()) if compare else None
+    print_report(results, baseline)
+
+    if out is None:
+        RESULTS.mkdir(exist_ok=True)
+        out = RESULTS / f"{dt.datetime.utcnow():%Y%m%d-%H%M%S}-{commit}.json"
+    out.write_text(json.dumps(report, indent=2))
+    click.echo(f"💾 Results → {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+scripts/bench/stub_openai.py
+
+OpenAI-compatible stub for load tests: `POST /v1/chat/completions`, buffered
+or streamed (SSE), with a configurable time to first token, token rate,
+answer length and error rate. Point the agents at it with
+OPENAI_BASE_URL=http://127.0.0.1:9300/v1 (any OPENAI_API_KEY works).
+
+    python -m scripts.bench.stub_openai --ttft-ms 400 --tokens-per-s 40
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import click
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="stub-openai")
+
+CONFIG = {
+    "ttft_ms": float(os.getenv("STUB_TTFT_MS", "400")),
+    "tokens_per_s": float(os.getenv("STUB_TOKENS_PER_S", "40")),
+    "tokens": int(os.getenv("STUB_TOKENS", "120")),
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+}
+WORDS = ("restart", "the", "service", "check", "logs", "for", "timeouts", "then", "roll",
+         "back", "config", "and", "verify", "health", "1.", "2.", "3.", "-")
+
+
+def _tokens(n: int) -> list[str]:
+    return [random.choice(WORDS) + " " for _ in range(n)]
+
+
+def _chunk(cid: str, model: str, delta: dict, finish: str | None = None) -> str:
+    return "data: " + json.dumps({
+        "id": cid, "object": "chat.completion.chunk", "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }) + "\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+    if random.random() < CONFIG["error_rate"]:
+        raise HTTPException(500, "stub: injected error")
+    tokens = _tokens(CONFIG["tokens"])
+    gap = 1 / CONFIG["tokens_per_s"] if CONFIG["tokens_per_s"] > 0 else 0
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    if body.get("stream"):
+        async def events():
+            await asyncio.sleep(CONFIG["ttft_ms"] / 1000)
+            yield _chunk(cid, model, {"role": "assistant", "content": ""})
+            for tok in tokens:
+                yield _chunk(cid, model, {"content": tok})
+                await asyncio.sleep(gap)
+            yield _chunk(cid, model, {}, "stop")
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(CONFIG["ttft_ms"] / 1000 + gap * len(tokens))
+    return {
+        "id": cid, "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "".join(tokens).strip()}}],
+        "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(tokens),
+                  "total_tokens": prompt_chars // 4 + len(tokens)},
+    }
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", **CONFIG}
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=9300, show_default=True)
+@click.option("--ttft-ms", type=float, help="Delay before the first token")
+@click.option("--tokens-per-s", type=float, help="Streaming token rate")
+@click.option("--tokens", type=int, help="Tokens per answer")
+@click.option("--error-rate", type=float, help="Fraction of requests answered with HTTP 500")
+def main(host, port, **overrides):
+    import uvicorn
+    CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
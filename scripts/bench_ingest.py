@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+"""
+scripts/bench_ingest.py
+
+Ingestion micro-benchmark: partition, chunking, embedding and Chroma writes,
+each timed on its own so hardware can be sized per stage.
+
+The corpus is synthetic (seeded markdown with headings, lists and tables,
+`--docs` × `--doc-words`) or sampled from the corpus store with `--sample`.
+Partitioning runs `unstructured.partition.auto.partition` on the corpus written out as
+.md / .docx files (or on files sampled from raw/ with `--raw`). Chunking times
+the structure-aware chunker (chunker.py, what embed.py stores) against the
+plain 800-character splitter it replaced, as a baseline. Embedding encodes the first
+`--embed-chunks` chunks for every batch size × torch thread count; Chroma
+writes go to a throwaway persistent store in a temp directory, timing `add`
+and then `upsert` of the same ids for every write batch size.
+
+Everything runs on CPU and offline (HF_HUB_OFFLINE=1 unless --online): pass a
+locally cached model with --model, or `--model hash` for deterministic
+pseudo-embeddings when only chunking and store writes matter.
+
+Results (docs/s, chunks/s, peak RSS after each stage) go to
+bench_results/ingest-<time>-<commit>.json; `--compare` prints the change
+against a previous report. Peak RSS is the process high-water mark, so it
+only grows from stage to stage.
+
+    python scripts/pipeline.py bench --docs 500 --batch-sizes 16,64 --threads 1,4
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+BASE = Path(__file__).resolve().parent.parent
+RAW = BASE / "raw"
+RESULTS = BASE / "bench_results"
+
+WORDS = ("service", "restart", "latency", "database", "cluster", "certificate", "deploy",
+         "rollback", "incident", "ticket", "customer", "gateway", "timeout", "config",
+         "node", "replica", "queue", "backup", "alert", "dashboard", "kubernetes", "proxy",
+         "error", "disk", "memory", "thread", "pool", "token", "release", "runbook")
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+# ---- corpus ---------------------------------------------------------------------
+
+def synthetic_doc(rng: random.Random, i: int, words: int) -> dict:
+    """One markdown document shaped like extracted slides/docs: headings, prose, lists, tables."""
+    out, n = [f"# Runbook {i}: {rng.choice(WORDS)} {rng.choice(WORDS)}"], 0
+    while n < words:
+        kind = rng.random()
+        if kind < 0.15:
+            out.append(f"## {rng.choice(WORDS).title()} {rng.choice(WORDS)}")
+            n += 2
+        elif kind < 0.35:
+            items = [" ".join(rng.choices(WORDS, k=rng.randint(4, 10))) for _ in range(rng.randint(2, 6))]
+            out.extend(f"{j + 1}. {item}" for j, item in enumerate(items))
+            n += sum(len(it.split()) for it in items)
+        elif kind < 0.45:
+            out.append("| host | status | errors |\n|---|---|---|")
+            out.extend(f"| {rng.choice(WORDS)}{rng.randint(1, 99)} | {rng.choice(WORDS)} | "
+                       f"{rng.randint(0, 500)} |" for _ in range(rng.randint(2, 5)))
+            n += 12
+        else:
+            k = rng.randint(30, 90)
+            out.append(" ".join(rng.choices(WORDS, k=k)).capitalize() + ".")
+            n += k
+    body = "\n\n".join(out)
+    return {"id": hashlib.sha1(f"synthetic-{i}".encode()).hexdigest(),
+            "source": f"synthetic/doc-{i}.md", "body": body}
+
+
+def load_corpus(docs: int, words: int, sample: bool, seed: int) -> list[dict]:
+    if sample:
+        from corpus import Corpus, CORPUS_DIR
+        corpus = Corpus()
+        if not len(corpus):
+            raise click.ClickException(f"--sample: no documents in {CORPUS_DIR}")
+        return corpus.sample(docs, seed)
+    rng = random.Random(seed)
+    return [synthetic_doc(rng, i, words) for i in range(docs)]
+
+
+def write_files(corpus: list[dict], formats: list[str], out: Path) -> list[Path]:
+    """Write documents as partitionable files, cycling through `formats`."""
+    files = []
+    for i, doc in enumerate(corpus):
+        fmt = formats[i % len(formats)]
+        fp = out / f"doc-{i}.{fmt}"
+        if fmt == "docx":
+            import docx
+            d = docx.Document()
+            for para in doc["body"].split("\n\n"):
+                if para.startswith("#"):
+                    d.add_heading(para.lstrip("# "), level=min(para.count("#", 0, 3), 3))
+                else:
+                    d.add_paragraph(para)
+            d.save(fp)
+        else:
+            fp.write_text(doc["body"], encoding="utf-8")
+        files.append(fp)
+    return files
+
+
+# ---- stages ---------------------------------------------------------------------
+
+def bench_partition(files: list[Path]) -> dict:
+    from unstructured.partition.auto import partition
+    t0 = time.perf_counter()
+    elements = sum(len(partition(str(fp))) for fp in files)
+    took = time.perf_counter() - t0
+    return {"files": len(files), "elements": elements, "seconds": round(took, 3),
+            "docs_per_s": round(len(files) / took, 2), "peak_rss_mb": round(rss_mb())}
+
+
+def bench_chunking(corpus: list[dict]) -> tuple[dict, list]:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from chunker import chunk_document
+    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=80)
+    chars = sum(len(d["body"]) for d in corpus)
+
+    t0 = time.perf_counter()
+    n_split = sum(len(splitter.split_text(d["body"])) for d in corpus)
+    split_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    chunks = [c for d in corpus for c in chunk_document(d)]
+    doc_s = time.perf_counter() - t0
+    return {
+        "docs": len(corpus),
+        "chunks": len(chunks),
+        "mb": round(chars / 2**20, 2),
+        "splitter": {"seconds": round(split_s, 3), "docs_per_s": round(len(corpus) / split_s, 1),
+                     "chunks_per_s": round(n_split / split_s, 1),
+                     "mb_per_s": round(chars / 2**20 / split_s, 2)},
+        # Token-sized, structure-aware, with ids, offsets and token counts
+        "chunker": {"seconds": round(doc_s, 3), "docs_per_s": round(len(corpus) / doc_s, 1),
+                      "chunks_per_s": round(len(chunks) / doc_s, 1)},
+        "peak_rss_mb": round(rss_mb()),
+    }, chunks
+
+
+class HashEmbedder:
+    """Deterministic unit vectors from a text hash; no model, for store-only runs."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, texts, batch_size=32, **_):
+        import numpy as np
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), "little")
+            out[i] = np.random.default_rng(seed).standard_normal(self.dim)
+        return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+def bench_embedding(texts: list[str], model_name: str, dim: int, batch_sizes: list[int],
+                    threads: list[int]):
+    if model_name == "hash":
+        model, set_threads = HashEmbedder(dim), lambda n: None
+    else:
+        import torch
+        from sentence_transformers import SentenceTransformer
+        set_threads = torch.set_num_threads
+        t0 = time.perf_counter()
+        try:
+            model = SentenceTransformer(model_name, device="cpu")
+        except Exception as e:
+            raise click.ClickException(
+                f"Cannot load '{model_name}' offline ({e}); use a cached model, --online "
+                f"or --model hash")
+        load_s = time.perf_counter() - t0
+
+    runs, vecs = [], None
+    for n_threads in threads:
+        set_threads(n_threads)
+        for bs in batch_sizes:
+            model.encode(texts[:bs], batch_size=bs, normalize_embeddings=True)  # warm-up
+            t0 = time.perf_counter()
+            vecs = model.encode(texts, batch_size=bs, normalize_embeddings=True,
+                                convert_to_numpy=True, show_progress_bar=False)
+            took = time.perf_counter() - t0
+            runs.append({"threads": n_threads, "batch_size": bs, "seconds": round(took, 3),
+                         "chunks_per_s": round(len(texts) / took, 1)})
+            click.echo(f"   🧠 threads={n_threads} batch={bs}: {len(texts) / took:.1f} chunks/s")
+    best = max(runs, key=lambda r: r["chunks_per_s"])
+    report = {"model": model_name, "chunks": len(texts), "dim": int(vecs.shape[1]),
+              "runs": runs, "best": best, "peak_rss_mb": round(rss_mb())}
+    if model_name != "hash":
+        report["load_s"] = round(load_s, 2)
+    return report, vecs
+
+
+def bench_chroma(chunks: list, vecs, batch_sizes: list[int], workdir: Path) -> dict:
+    import chromadb
+    embeddings = vecs.tolist()
+    # Chroma rejects duplicate ids within one call, as in Embedder.write
+    unique = list({cid: (text, meta) for cid, text, meta in chunks}.items())
+    runs = []
+    for bs in batch_sizes:
+        path = workdir / f"chroma-{bs}"
+        client = chromadb.PersistentClient(path=str(path))
+        collection = client.create_collection("bench")
+        timings = {}
+        for op in ("add", "upsert"):
+            write = getattr(collection, op)
+            t0 = time.perf_counter()
+            for lo in range(0, len(unique), bs):
+                part = unique[lo:lo + bs]
+                write(ids=[cid for cid, _ in part],
+                      documents=[text for _, (text, _) in part],
+                      metadatas=[meta for _, (_, meta) in part],
+                      embeddings=[embeddings[(lo + j) % len(embeddings)] for j in range(len(part))])
+            timings[op] = time.perf_counter() - t0
+        size = sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+        runs.append({"batch_size": bs,
+                     "add_chunks_per_s": round(len(unique) / timings["add"], 1),
+                     "upsert_chunks_per_s": round(len(unique) / timings["upsert"], 1),
+                     "store_mb": round(size / 2**20, 1)})
+        click.echo(f"   💾 batch={bs}: add {runs[-1]['add_chunks_per_s']} chunks/s, "
+                   f"upsert {runs[-1]['upsert_chunks_per_s']} chunks/s")
+        del collection, client
+    return {"chunks": len(unique), "runs": runs, "peak_rss_mb": round(rss_mb())}
+
+
+# ---- report ---------------------------------------------------------------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(obj, prefix: str = "") -> dict:
+    """Numeric leaves keyed by path; lists of runs are keyed by their parameters."""
+    out = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(flatten(v, f"{prefix}{k}."))
+    elif isinstance(obj, list):
+        for run in obj:
+            if isinstance(run, dict):
+                tag = ",".join(f"{k}={run[k]}" for k in ("threads", "batch_size") if k in run)
+                out.update(flatten(run, f"{prefix}[{tag}]."))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix[:-1]] = obj
+    return out
+
+
+def compare(old: dict, new: dict) -> None:
+    a, b = flatten(old["stages"]), flatten(new["stages"])
+    click.echo(f"📊 vs {old.get('commit')} ({old.get('timestamp', '')[:19]}):")
+    for key in sorted(a.keys() & b.keys()):
+        if key.endswith(("_per_s", "peak_rss_mb")) and a[key]:
+            click.echo(f"   {key}: {a[key]} → {b[key]} ({(b[key] - a[key]) / a[key] * 100:+.1f}%)")
+
+
+@click.command()
+@click.option("--docs", default=200, show_default=True, help="Documents in the corpus")
+@click.option("--doc-words", default=1500, show_default=True, help="[synthetic] Words per document")
+@click.option("--sample", is_flag=True, help="Sample documents from the corpus store instead of generating")
+@click.option("--raw", "raw_dir", type=click.Path(exists=True, file_okay=False, path_type=Path),
+              help="Partition files sampled from this directory instead of the corpus")
+@click.option("--formats", default="md,docx", show_default=True,
+              help="File types the corpus is written as for partitioning")
+@click.option("--stages", default="partition,chunk,embed,store", show_default=True)
+@click.option("--model", default=lambda: os.getenv("EMBED_MODEL", "BAAI/bge-base-en"),
+              show_default="EMBED_MODEL", help="Cached SentenceTransformer name/path, or 'hash'")
+@click.option("--dim", default=768, show_default=True, help="[hash] Vector dimension")
+@click.option("--embed-chunks", default=512, show_default=True, help="Chunks encoded per run")
+@click.option("--batch-sizes", default="16,64,256", show_default=True, help="Encode batch sizes")
+@click.option("--threads", default=lambda: f"1,{os.cpu_count() or 1}",
+              show_default="1,<cpus>", help="torch thread counts")
+@click.option("--upsert-sizes", default="64,256,1024", show_default=True,
+              help="Chroma write batch sizes")
+@click.option("--online", is_flag=True, help="Allow downloading the embedding model")
+@click.option("--workdir", type=click.Path(file_okay=False, path_type=Path),
+              help="Scratch directory (default: a temp dir, removed afterwards)")
+@click.option("--out", type=click.Path(path_type=Path), help="Report JSON (default bench_results/)")
+@click.option("--compare", "baseline", type=click.Path(exists=True, path_type=Path),
+              help="Previous report to diff against")
+@click.option("--seed", default=0, show_default=True)
+def main(docs, doc_words, sample, raw_dir, formats, stages, model, dim, embed_chunks,
+         batch_sizes, threads, upsert_sizes, online, workdir, out, baseline, seed):
+    if not online:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    stages = [s.strip() for s in stages.split(",") if s.strip()]
+    scratch = workdir or Path(tempfile.mkdtemp(prefix="bench-ingest-"))
+    scratch.mkdir(parents=True, exist_ok=True)
+    results, chunks, vecs = {}, None, None
+    try:
+        t0 = time.perf_counter()
+        corpus = load_corpus(docs, doc_words, sample, seed)
+        click.echo(f"📚 {len(corpus)} {'sampled' if sample else 'synthetic'} docs, "
+                   f"{sum(len(d['body']) for d in corpus) / 2**20:.1f} MB "
+                   f"({time.perf_counter() - t0:.1f}s)")
+
+        if "partition" in stages:
+            if raw_dir:
+                files = [f for f in sorted(raw_dir.rglob("*")) if f.is_file()]
+                files = random.Random(seed).sample(files, min(docs, len(files)))
+            else:
+                (scratch / "files").mkdir(exist_ok=True)
+                files = write_files(corpus, [f.strip() for f in formats.split(",")],
+                                    scratch / "files")
+            results["partition"] = bench_partition(files)
+            click.echo(f"✂️ partition: {results['partition']['docs_per_s']} docs/s")
+
+        if stages and set(stages) - {"partition"}:
+            results["chunk"], chunks = bench_chunking(corpus)
+            click.echo(f"🔪 chunk: {results['chunk']['chunker']['docs_per_s']} docs/s, "
+                       f"{results['chunk']['chunker']['chunks_per_s']} chunks/s")
+
+        if "embed" in stages or "store" in stages:
+            texts = [text for _, text, _ in chunks[:embed_chunks]]
+            if "embed" in stages:
+                results["embed"], vecs = bench_embedding(texts, model, dim, ints(batch_sizes),
+                                                         ints(threads))
+            else:
+                vecs = HashEmbedder(dim).encode(texts)
+
+        if "store" in stages:
+            results["store"] = bench_chroma(chunks, vecs, ints(upsert_sizes), scratch)
+    finally:
+        if workdir is None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": dt.datetime.utcnow().isoformat(),
+        "host": {"cpus": os.cpu_count(), "platform": os.uname().sysname + " " + os.uname().machine},
+        "config": {"docs": len(corpus), "doc_words": doc_words, "sample": sample,
+                   "raw": str(raw_dir) if raw_dir else None, "formats": formats,
+                   "model": model, "embed_chunks": embed_chunks, "batch_sizes": ints(batch_sizes),
+                   "threads": ints(threads), "upsert_sizes": ints(upsert_sizes), "seed": seed},
+        "stages": results,
+    }
+    if baseline:
+        compare(json.loads(baseline.read_text()), report)
+    if out is None:
+        RESULTS.mkdir(exist_ok=True)
+        out = RESULTS / f"ingest-{dt.datetime.utcnow():%Y%m%d-%H%M%S}-{commit}.json"
+    out.write_text(json.dumps(report, indent=2))
+    click.echo(f"💾 Report → {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+scripts/bench_vectors.py
+
+Benchmark the mmap'd NumPy snapshot (numpy_index.py) against Chroma on the
+same query vectors.
+
+Queries are rows sampled from the export (so no embedding model is loaded and
+both backends see identical inputs). Reports open time, peak RSS, per-query
+latency percentiles, single and batched throughput, and recall@k of the
+snapshot against Chroma's results. NumPy runs first, so Chroma's peak RSS
+includes it; run with --skip-chroma for a clean NumPy figure.
+"""
+import resource
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+from rich import print
+
+from numpy_index import NumpyIndex, EXPORT_DIR
+
+# Not imported from embed.py, which would load the embedding model into RSS
+DBPATH = Path(__file__).resolve().parent.parent / "vector_store"
+COLLECTION = "knowledge_base"
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def pct(samples: list[float], p: float) -> float:
+    return float(np.percentile(samples, p)) * 1000
+
+def report(name: str, open_s: float, lat: list[float], rss: float) -> None:
+    print(f"[bold]{name}[/bold]: open {open_s * 1000:.0f} ms | "
+          f"p50 {pct(lat, 50):.2f} ms | p95 {pct(lat, 95):.2f} ms | p99 {pct(lat, 99):.2f} ms | "
+          f"{len(lat) / sum(lat):.0f} q/s | peak RSS {rss:.0f} MB")
+
+@click.command()
+@click.option("--queries", "n_queries", default=200, show_default=True)
+@click.option("-k", default=8, show_default=True)
+@click.option("--batch-size", default=64, show_default=True,
+              help="Queries per batched NumPy search")
+@click.option("--skip-chroma", is_flag=True, help="Only time the NumPy backend")
+def main(n_queries, k, batch_size, skip_chroma):
+    t0 = time.perf_counter()
+    index = NumpyIndex(EXPORT_DIR)
+    open_np = time.perf_counter() - t0
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(index), size=min(n_queries, len(index)), replace=False)
+    queries = np.asarray(index.vectors[rows], dtype=np.float32)
+    if index.scales is not None:
+        queries *= np.asarray(index.scales[rows], dtype=np.float32)[:, None]
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    lat, np_ids = [], []
+    for q in queries:
+        t = time.perf_counter()
+        hits = index.search(q, [k])[0]
+        lat.append(time.perf_counter() - t)
+        np_ids.append({h[0] for h in hits})
+    report(f"numpy ({index.info['dtype']}, {len(index)} rows)", open_np, lat, rss_mb())
+
+    t = time.perf_counter()
+    for lo in range(0, len(queries), batch_size):
+        part = queries[lo:lo + batch_size]
+        index.search(part, [k] * len(part))
+    batched = time.perf_counter() - t
+    print(f"   batched ×{batch_size}: {len(queries) / batched:.0f} q/s")
+
+    if skip_chroma:
+        return
+
+    import chromadb
+    t0 = time.perf_counter()
+    collection = chromadb.PersistentClient(path=str(DBPATH)).get_collection(COLLECTION)
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=k)  # load the HNSW index
+    open_chroma = time.perf_counter() - t0
+
+    lat, recall = [], []
+    for q, expected in zip(queries, np_ids):
+        t = time.perf_counter()
+        res = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+        lat.append(time.perf_counter() - t)
+        got = set(res["ids"][0])
+        recall.append(len(got & expected) / max(1, len(got)))
+    report("chroma", open_chroma, lat, rss_mb())
+    print(f"🎯 recall@{k} numpy vs chroma: {np.mean(recall):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+scripts/captioner.py
+
+Batched, hash-deduplicated image captioning for the extraction stage.
+
+Images are stored once in raw_imgs/ under their sha256, queued, and captioned
+with BLIP in batches on an auto-detected device. Captions are kept in a
+persistent hash → caption cache (state/ingest.sqlite3), so an image that was
+seen before — the corporate logo on every slide — is never captioned again.
+
+Because an image file may be shared by many documents, the same database
+records which documents reference each hash (`image_refs`). Extraction keeps
+it current and compact.py deletes images, and their captions, that no live
+document references any more.
+"""
+
+import hashlib
+import io
+import logging
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from devices import pick_device, pick_dtype
+from manifest import DB_PATH
+
+BLIP_MODEL = "Salesforce/blip-image-captioning-base"
+FALLBACK   = "image"
+NO_IMAGES  = ""  # image_refs hash of a document that references no image
+
+
+class CaptionCache:
+    """SQLite-backed sha256 → caption map, plus the sha256 ↔ doc_id references."""
+
+    def __init__(self, db_path: Path = DB_PATH):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS captions (
+                sha256     TEXT PRIMARY KEY,
+                caption    TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS image_refs (
+                sha256 TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                PRIMARY KEY (sha256, doc_id)
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS image_refs_doc ON image_refs (doc_id)")
+        self.db.commit()
+
+    def get(self, sha: str) -> str | None:
+        row = self.db.execute("SELECT caption FROM captions WHERE sha256 = ?", (sha,)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, items: dict[str, str]) -> None:
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO captions (sha256, caption, created_at) VALUES (?, ?, ?)",
+            [(sha, cap, now) for sha, cap in items.items()],
+        )
+        self.db.commit()
+
+    # ---- references ------------------------------------------------------------
+
+    def set_refs(self, doc_id: str, shas: list[str]) -> None:
+        """Record that doc_id's current version references exactly `shas`.
+
+        A document without images gets one NO_IMAGES row, so it is known to be
+        recorded and collect_images never has to scan its body.
+        """
+        with self.db:
+            self.db.execute("DELETE FROM image_refs WHERE doc_id = ?", (doc_id,))
+            self.db.executemany("INSERT OR IGNORE INTO image_refs (sha256, doc_id) VALUES (?, ?)",
+                                [(sha, doc_id) for sha in shas or [NO_IMAGES]])
+
+    def drop_refs(self, doc_id: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM image_refs WHERE doc_id = ?", (doc_id,))
+
+    def forget(self, shas: list[str]) -> None:
+        """Drop cached captions of images that were deleted."""
+        with self.db:
+            self.db.executemany("DELETE FROM captions WHERE sha256 = ?", [(sha,) for sha in shas])
+
+    def close(self) -> None:
+        self.db.close()
+
+
+SHA256 = re.compile(r"[0-9a-f]{64}")
+IMAGE_LINK = re.compile(r"([0-9a-f]{64})\.png\)")  # as written by extraction's render()
+
+
+def collect_images(img_dir: Path, corpus, live: set[str], dry_run: bool = False) -> tuple[int, int]:
+    """Delete content-addressed images that no live document references.
+
+    Corpus documents with no image_refs rows (extracted before references were
+    tracked) are backfilled once from the image links in their bodies, an
+    image-less one with a NO_IMAGES row. References of documents outside
+    `live` are dropped, and every `<sha256>.png` left unreferenced is removed
+    with its cached caption. Legacy per-document `{doc_id}_{idx}.png` files
+    are not touched. Returns (images, bytes) removed, or that would be with
+    dry_run.
+    """
+    cache = CaptionCache()
+    refs: dict[str, set[str]] = {}
+    for sha, doc_id in cache.db.execute("SELECT sha256, doc_id FROM image_refs"):
+        refs.setdefault(doc_id, set()).add(sha)
+    for doc_id in corpus.doc_ids() - refs.keys():
+        doc = corpus.get(doc_id)
+        if doc is None:
+            continue
+        shas = IMAGE_LINK.findall(doc["body"])
+        refs[doc_id] = set(shas)
+        if not dry_run:
+            cache.set_refs(doc_id, shas)
+    for doc_id in refs.keys() - live:
+        del refs[doc_id]
+        if not dry_run:
+            cache.drop_refs(doc_id)
+
+    keep = set().union(*refs.values()) - {NO_IMAGES}
+    gone, freed = [], 0
+    for img in img_dir.glob("*.png"):
+        if not SHA256.fullmatch(img.stem) or img.stem in keep:
+            continue
+        gone.append(img.stem)
+        freed += img.stat().st_size
+        if not dry_run:
+            img.unlink(missing_ok=True)
+    if not dry_run:
+        cache.forget(gone)
+    cache.close()
+    return len(gone), freed
+
+
+class CaptionService:
+    """Dedup → queue → batch-caption images.
+
+    `add()` stores the image and returns its hash; captions become available
+    through `get()` once a batch containing the hash has been flushed.
+    """
+
+    def __init__(self, img_dir: Path, batch_size: int = 16,
+                 device: str | None = None, dtype: str | None = None,
+                 enabled: bool = True):
+        self.img_dir = img_dir
+        self.batch_size = max(1, batch_size)
+        self.device = pick_device(device)
+        self.dtype = pick_dtype(self.device, dtype)
+        self.enabled = enabled
+        self.cache = CaptionCache()
+        self.captions: dict[str, str] = {}
+        self.pending: dict[str, Path] = {}
+        self.stats = {"images": 0, "unique": 0, "cached": 0, "captioned": 0, "failed": 0}
+        self._model = None
+
+    def path_for(self, sha: str) -> Path:
+        return self.img_dir / f"{sha}.png"
+
+    def add(self, blob: bytes) -> str:
+        self.stats["images"] += 1
+        sha = hashlib.sha256(blob).hexdigest()
+        if sha in self.captions or sha in self.pending:
+            return sha
+
+        img = self.path_for(sha)
+        if not img.exists():
+            img.write_bytes(blob)
+        self.stats["unique"] += 1
+
+        cached = self.cache.get(sha)
+        if cached is not None:
+            self.stats["cached"] += 1
+            self.captions[sha] = cached
+        elif not self.enabled:
+            self.captions[sha] = FALLBACK
+        else:
+            self.pending[sha] = img
+        return sha
+
+    def is_ready(self, sha: str) -> bool:
+        return sha in self.captions
+
+    def get(self, sha: str) -> str:
+        return self.captions.get(sha, FALLBACK)
+
+    def set_refs(self, doc_id: str, shas: list[str]) -> None:
+        self.cache.set_refs(doc_id, shas)
+
+    def drop_refs(self, doc_id: str) -> None:
+        self.cache.drop_refs(doc_id)
+
+    def flush(self, force: bool = False) -> None:
+        """Caption full batches from the queue (all of it when force=True)."""
+        while self.pending and (force or len(self.pending) >= self.batch_size):
+            batch = list(self.pending.items())[: self.batch_size]
+            for sha, _ in batch:
+                del self.pending[sha]
+            self._caption_batch(batch)
+
+    def close(self) -> None:
+        self.flush(force=True)
+        self.cache.close()
+        logging.info(
+            "🖼️ Captions: {images} images, {unique} unique, {cached} cached, "
+            "{captioned} captioned, {failed} failed".format(**self.stats)
+        )
+
+    def _load(self):
+        if self._model is None:
+            from transformers import BlipProcessor, BlipForConditionalGeneration
+            proc  = BlipProcessor.from_pretrained(BLIP_MODEL)
+            model = BlipForConditionalGeneration.from_pretrained(
+                BLIP_MODEL, torch_dtype=self.dtype
+            ).to(self.device).eval()
+            logging.info(f"🔍 BLIP loaded on {self.device} ({self.dtype})")
+            self._model = (proc, model)
+        return self._model
+
+    def _generate(self, images: list[Image.Image]) -> list[str]:
+        import torch
+        proc, model = self._load()
+        inputs = proc(images=images, return_tensors="pt").to(self.device)
+        inputs["pixel_values"] = inputs["pixel_values"].to(self.dtype)
+        with torch.inference_mode():
+            ids = model.generate(**inputs, max_new_tokens=25)
+        return [c.strip() or FALLBACK for c in proc.batch_decode(ids, skip_special_tokens=True)]
+
+    def _caption_batch(self, batch: list[tuple[str, Path]]) -> None:
+        loaded, done = [], {}
+        for sha, img in batch:
+            try:
+                loaded.append((sha, Image.open(io.BytesIO(img.read_bytes())).convert("RGB")))
+            except Exception:
+                logging.warning(f"⚠️ Unreadable image {img}")
+                self.captions[sha] = FALLBACK
+                self.stats["failed"] += 1
+
+        try:
+            caps = self._generate([im for _, im in loaded]) if loaded else []
+            done = dict(zip((sha for sha, _ in loaded), caps))
+        except Exception:
+            # One bad image should not cost the whole batch: retry one by one
+            logging.exception("⚠️ Batch caption failed, retrying per image")
+            for sha, im in loaded:
+                try:
+                    done[sha] = self._generate([im])[0]
+                except Exception:
+                    logging.exception(f"⚠️ Caption failed for {self.path_for(sha)}")
+                    self.captions[sha] = FALLBACK
+                    self.stats["failed"] += 1
+
+        if done:
+            self.cache.put_many(done)
+            self.captions.update(done)
+            self.stats["captioned"] += len(done)
@@ -1,53 +1,80 @@
-
 """
 scripts/check_embedding_progress.py
 
-Counts how many embedding chunks *should* exist versus how many are actually stored in Chroma,
-and prints a progress percentage.
+Reports how many embedding chunks *should* exist versus how many are already stored,
+with throughput, ETA, per-stage backlog and failed sources.
+
+Everything is read from the ingestion ledger (state/ingest.sqlite3) that the
+extract/embed stages keep up to date, so the check is instant and safe to run —
+or `--watch` — while embedding is in flight. Use `--verify` to also ask Chroma
+for its live chunk count.
 """
 
-import os
-import json
+import sys
+import time
+from datetime import timedelta
 from pathlib import Path
 
-import chromadb
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from ledger import Ledger  # noqa: E402
 
-# === Configuration (must match your embed.py) ===
-CLEAN_DIR = Path(__file__).resolve().parent.parent / "clean"
 VECTOR_DB = Path(__file__).resolve().parent.parent / "vector_store"
 COLLECTION_NAME = "knowledge_base"
-CHUNK_SIZE = 800
-CHUNK_OVERLAP = 80
 
-def main():
-    # Initialize Chroma client & collection
+def chroma_count() -> int:
+    import chromadb
     client = chromadb.PersistentClient(path=str(VECTOR_DB))
-    col = client.get_or_create_collection(COLLECTION_NAME)
-
-    # Initialize splitter (must match your embed.py settings)
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-    )
-
-    # Count expected chunks
-    total_chunks = 0
-    for fn in CLEAN_DIR.glob("*.json"):
-        with open(fn, "r") as f:
-            doc = json.load(f)
-        total_chunks += len(splitter.split_text(doc["body"]))
-
-    # Count actual embeddings
-    try:
-        done = col.count()
-    except Exception:
-        # Fallback if count() not available
-        done = len(col.get()["ids"])
+    return client.get_or_create_collection(COLLECTION_NAME).count()
+
+def report(ledger: Ledger, failed_limit: int, verify: bool) -> None:
+    totals = ledger.totals()
+    total_chunks = sum(t["expected"] for t in totals.values())
+    done = sum(t["embedded"] for t in totals.values())
 
-    # Print progress
     pct = (done / total_chunks * 100) if total_chunks > 0 else 0
     print(f"{done}/{total_chunks} → {pct:.1f}% complete")
 
+    rate = ledger.rate()
+    last = ledger.last_sample_ts()
+    remaining = total_chunks - done
+    if rate > 0 and remaining > 0:
+        eta = timedelta(seconds=int(remaining / rate))
+        print(f"⚡ {rate:.1f} chunks/s → ETA {eta}")
+    elif last:
+        print(f"⏸️  idle — last batch {timedelta(seconds=int(time.time() - last))} ago")
+
+    print("📦 Backlog: " + ", ".join(
+        f"{stage} {totals[stage]['docs']}" for stage in ("queued", "extracted", "chunked")
+    ) + f" | embedded {totals['embedded']['docs']} | failed {totals['failed']['docs']}")
+
+    if verify:
+        print(f"🔢 Chroma reports {chroma_count()} stored chunks")
+
+    failures = ledger.failures(failed_limit) if failed_limit else []
+    for source, error in failures:
+        print(f"❌ {source}: {error}")
+
+@click.command()
+@click.option("--watch", type=float, metavar="SECONDS", help="Refresh every N seconds")
+@click.option("--failed", "failed_limit", default=10, show_default=True,
+              help="Failed sources to list (0 = none)")
+@click.option("--verify", is_flag=True, help="Also count stored chunks in Chroma (slower)")
+def main(watch, failed_limit, verify):
+    ledger = Ledger()
+    try:
+        while True:
+            if watch:
+                click.clear()
+            report(ledger, failed_limit, verify)
+            if not watch:
+                break
+            time.sleep(watch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ledger.close()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
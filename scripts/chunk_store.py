@@ -0,0 +1,225 @@
+"""
+scripts/chunk_store.py
+
+Append-only store of chunked documents (chunker.py output), so chunks are
+computed once per document version and every downstream tool reads them
+instead of re-splitting bodies.
+
+Layout under chunk_store/:
+
+    seg-000001.jsonl   append-only; one line per stored document version:
+                       {"doc_id", "fp", "chunks": [[id, text, metadata], ...]}
+    index.sqlite3      doc_id → live version: fingerprint, segment, byte
+                       offset/length, chunk and token counts
+
+`fp` fingerprints the body, the element spans and chunker.VERSION, so
+`chunks_for(doc)` returns the stored chunks while a document is unchanged and
+re-chunks (appending a new line) when it or the chunker settings change.
+Superseded and forgotten versions stay in the segments until `compact()`
+rewrites the live ones. Segments roll at CHUNK_SEGMENT_BYTES (default 64 MB).
+
+One process writes at a time: the writer (the embed stage) holds an exclusive
+flock on chunk_store/LOCK (locks.py) from its first `put` or `acquire()` until
+`close()`, and `compact()` fails at once with LockHeld while another process
+holds it, so no writer is left appending to a segment compaction removed.
+Any number of processes may read without locking.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import chunker
+from locks import LockHeld, WriterLock
+
+CHUNK_DIR = Path(os.getenv("CHUNK_STORE_DIR",
+                           Path(__file__).resolve().parent.parent / "chunk_store"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id   TEXT PRIMARY KEY,
+    source   TEXT,
+    fp       TEXT NOT NULL,
+    segment  INTEGER NOT NULL,
+    offset   INTEGER NOT NULL,
+    length   INTEGER NOT NULL,
+    n_chunks INTEGER NOT NULL,
+    tokens   INTEGER NOT NULL
+);
+"""
+
+
+def fingerprint(doc: dict) -> str:
+    h = hashlib.md5(chunker.VERSION.encode())
+    h.update(doc["body"].encode())
+    h.update(json.dumps(doc.get("elements") or []).encode())
+    return h.hexdigest()
+
+
+class ChunkStore:
+    def __init__(self, root: Path = CHUNK_DIR, segment_bytes: int | None = None):
+        self.root = root
+        self.segment_bytes = segment_bytes or int(os.getenv("CHUNK_SEGMENT_BYTES", str(64 << 20)))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.root / "index.sqlite3"), timeout=30,
+                                  check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.lock = WriterLock(self.root / "LOCK")
+        self._readers: dict[int, int] = {}
+        self._writer = None
+        self._segment = max(self._segments(), default=0) or 1
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Become the writer (held until close()); False if busy and not blocking."""
+        if self.lock.held:
+            return True
+        if not self.lock.acquire(blocking):
+            return False
+        # A compaction may have replaced the segments since we were opened
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._segment = max(self._segments(), default=0) or 1
+        return True
+
+    # ---- segments --------------------------------------------------------------
+
+    def _path(self, seg: int) -> Path:
+        return self.root / f"seg-{seg:06d}.jsonl"
+
+    def _segments(self) -> list[int]:
+        return sorted(int(p.stem[4:]) for p in self.root.glob("seg-*.jsonl"))
+
+    def _fd(self, seg: int) -> int:
+        fd = self._readers.get(seg)
+        if fd is None:
+            fd = self._readers[seg] = os.open(self._path(seg), os.O_RDONLY)
+        return fd
+
+    def _append(self, line: bytes) -> tuple[int, int]:
+        """Write one record; returns (segment, offset)."""
+        if self._writer is None or self._writer.tell() >= self.segment_bytes:
+            if self._writer is not None:
+                self._writer.close()
+                if self._path(self._segment).stat().st_size >= self.segment_bytes:
+                    self._segment += 1
+            self._writer = open(self._path(self._segment), "ab")
+        offset = self._writer.tell()
+        self._writer.write(line)
+        self._writer.flush()
+        return self._segment, offset
+
+    # ---- reads -----------------------------------------------------------------
+
+    def _row(self, doc_id: str):
+        return self.db.execute("SELECT fp, segment, offset, length FROM docs WHERE doc_id = ?",
+                               (doc_id,)).fetchone()
+
+    def _read(self, seg: int, offset: int, length: int) -> list[tuple[str, str, dict]]:
+        with self._lock:
+            raw = os.pread(self._fd(seg), length, offset)
+        return [tuple(c) for c in json.loads(raw)["chunks"]]
+
+    def get(self, doc_id: str) -> list[tuple[str, str, dict]] | None:
+        """Stored chunks of `doc_id`'s live version, or None."""
+        row = self._row(doc_id)
+        return self._read(*row[1:]) if row else None
+
+    def doc_ids(self) -> set[str]:
+        return {r[0] for r in self.db.execute("SELECT doc_id FROM docs")}
+
+    def iter_docs(self):
+        """Yield (doc_id, chunks) for every live document in file order."""
+        rows = self.db.execute(
+            "SELECT doc_id, segment, offset, length FROM docs ORDER BY segment, offset").fetchall()
+        for doc_id, *loc in rows:
+            yield doc_id, self._read(*loc)
+
+    # ---- writes ----------------------------------------------------------------
+
+    def put(self, doc: dict, fp: str, chunks: list[tuple[str, str, dict]]) -> None:
+        self.acquire()
+        line = (json.dumps({"doc_id": doc["id"], "fp": fp, "chunks": chunks},
+                           ensure_ascii=False) + "\n").encode()
+        with self._lock:
+            seg, offset = self._append(line)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc["id"], doc.get("source"), fp, seg, offset, len(line), len(chunks),
+                 sum(m.get("tokens", 0) for _, _, m in chunks)))
+
+    def chunks_for(self, doc: dict) -> list[tuple[str, str, dict]]:
+        """Chunks of `doc`: stored if this version was chunked before, else chunk and store."""
+        fp = fingerprint(doc)
+        row = self._row(doc["id"])
+        if row and row[0] == fp:
+            return self._read(*row[1:])
+        chunks = chunker.chunk_document(doc)
+        self.put(doc, fp, chunks)
+        return chunks
+
+    def forget(self, doc_id: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+
+    def compact(self) -> int:
+        """Rewrite live versions into fresh segments and drop the old ones; returns bytes freed.
+
+        Raises LockHeld if another process is writing.
+        """
+        if not self.acquire(blocking=False):
+            raise LockHeld(f"{self.root} is being written by another process")
+        old = self._segments()
+        before = sum(self._path(s).stat().st_size for s in old)
+        rows = self.db.execute(
+            "SELECT doc_id, segment, offset, length FROM docs ORDER BY segment, offset").fetchall()
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._segment = (old[-1] if old else 0) + 1
+            moved = []
+            for doc_id, seg, offset, length in rows:
+                line = os.pread(self._fd(seg), length, offset)
+                moved.append((*self._append(line), doc_id))
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self.db:
+            self.db.executemany("UPDATE docs SET segment = ?, offset = ? WHERE doc_id = ?", moved)
+        with self._lock:
+            for seg in old:
+                fd = self._readers.pop(seg, None)
+                if fd is not None:
+                    os.close(fd)
+                self._path(seg).unlink(missing_ok=True)
+        after = sum(self._path(s).stat().st_size for s in self._segments())
+        logging.info(f"🗜️ Chunk store: {len(rows)} live docs, {before - after} bytes freed")
+        return before - after
+
+    def stats(self) -> dict:
+        docs, chunks, tokens, live = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(n_chunks), 0), COALESCE(SUM(tokens), 0), "
+            "COALESCE(SUM(length), 0) FROM docs").fetchone()
+        total = sum(self._path(s).stat().st_size for s in self._segments())
+        return {"docs": docs, "chunks": chunks, "tokens": tokens, "segments": len(self._segments()),
+                "live_bytes": live, "total_bytes": total, "chunker": chunker.VERSION}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for fd in self._readers.values():
+                os.close(fd)
+            self._readers.clear()
+        self.db.close()
+        self.lock.release()
@@ -0,0 +1,56 @@
+"""
+scripts/chunk_tracker.py
+
+Per-source chunk sets for the `knowledge_base` collection.
+
+Every chunk id written by embed.py is recorded against the doc_id it came from
+(state/ingest.sqlite3), so a re-ingested source can drop exactly the chunks it
+no longer produces and a deleted source can be purged without scanning Chroma.
+"""
+
+import sqlite3
+from pathlib import Path
+
+from manifest import DB_PATH
+
+
+class ChunkTracker:
+    """SQLite-backed doc_id → {chunk_id} map."""
+
+    def __init__(self, db_path: Path = DB_PATH):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc_id   TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (doc_id, chunk_id)
+            )
+        """)
+        self.db.commit()
+
+    def ids(self, doc_id: str) -> set[str]:
+        rows = self.db.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))
+        return {r[0] for r in rows}
+
+    def doc_ids(self) -> set[str]:
+        return {r[0] for r in self.db.execute("SELECT DISTINCT doc_id FROM chunks")}
+
+    def all_ids(self) -> set[str]:
+        return {r[0] for r in self.db.execute("SELECT chunk_id FROM chunks")}
+
+    def replace(self, doc_id: str, ids: set[str]) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self.db.executemany(
+                "INSERT INTO chunks (doc_id, chunk_id) VALUES (?, ?)",
+                [(doc_id, cid) for cid in ids],
+            )
+
+    def forget(self, doc_id: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+
+    def close(self) -> None:
+        self.db.close()
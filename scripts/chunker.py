@@ -0,0 +1,190 @@
+"""
+scripts/chunker.py
+
+Structure-aware chunking over the element stream written by extraction.
+
+extract_and_caption.py stores, next to each document's markdown body, the
+spans of the elements `partition` produced: `[type, start, end, page]` per
+Title / NarrativeText / ListItem / Table / Image caption, with `page` the
+slide or page number. Chunks are built from those spans:
+
+* a new section starts at every Title and every page (slide) change, and no
+  chunk crosses a section boundary;
+* tables are never packed together with prose; a table that does not fit is
+  split between rows;
+* consecutive elements of a section are packed up to CHUNK_TOKENS tokens
+  (default 200), carrying trailing elements of up to CHUNK_OVERLAP_TOKENS
+  (default 30) into the next chunk; an element larger than the budget is
+  split at sentence, then word, then character boundaries.
+
+Every chunk is an exact slice of the body, so `start` + `len(text)` locate it
+for prompt packing (scripts/agents/context.py), and its id is the usual
+`{doc_id}:{md5(text)}`. Documents without element spans (extracted before
+they were recorded) are segmented from their markdown: `#` headings are
+titles, runs of `|` lines are tables, other lines are text.
+"""
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+
+from tokens import count_tokens
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP_TOKENS", "30"))
+# Part of every stored chunk set's fingerprint (chunk_store.py); bump when the
+# output for the same input changes so documents are re-chunked
+VERSION = f"structure-2/{CHUNK_TOKENS}/{CHUNK_OVERLAP}"
+
+TITLES = {"Title"}
+TABLES = {"Table"}
+
+_SENTENCE = re.compile(r"(?<=[.!?:;])\s+|\n+")
+_SPACE = re.compile(r"\s+")
+_LEVELS = ("lines", "sentences", "words", "chars")
+
+
+@dataclass
+class Element:
+    kind: str
+    start: int
+    end: int
+    page: int | None = None
+
+
+def markdown_elements(body: str) -> list[Element]:
+    """Approximate element spans for a body that has none recorded."""
+    out, pos = [], 0
+    for line in body.splitlines(keepends=True):
+        start, end = pos, pos + len(line.rstrip("\r\n"))
+        pos += len(line)
+        text = body[start:end].strip()
+        if not text:
+            continue
+        if text.startswith("#"):
+            out.append(Element("Title", start, end))
+        elif text.startswith("|") and out and out[-1].kind == "Table" \
+                and not body[out[-1].end:start].strip():
+            out[-1].end = end
+        elif text.startswith("|"):
+            out.append(Element("Table", start, end))
+        else:
+            out.append(Element("NarrativeText", start, end))
+    return out
+
+
+def elements_of(doc: dict) -> list[Element]:
+    spans = doc.get("elements")
+    if not spans:
+        return markdown_elements(doc["body"])
+    return [Element(kind, start, end, page) for kind, start, end, page in spans if end > start]
+
+
+def sections(elements: list[Element]) -> list[list[Element]]:
+    out = []
+    for el in elements:
+        if not out or el.kind in TITLES or el.page != out[-1][-1].page:
+            out.append([el])
+        else:
+            out[-1].append(el)
+    return out
+
+
+def _split(body: str, start: int, end: int, level: int) -> list[tuple[int, int]]:
+    """Finer units covering body[start:end] at `_LEVELS[level]`."""
+    name = _LEVELS[level]
+    if name == "chars":
+        step = max(1, CHUNK_TOKENS * 4)
+        return [(s, min(end, s + step)) for s in range(start, end, step)]
+    pattern = {"lines": re.compile(r"\n"), "sentences": _SENTENCE, "words": _SPACE}[name]
+    units, pos = [], start
+    for m in pattern.finditer(body, start, end):
+        if m.start() > pos:
+            units.append((pos, m.start()))
+        pos = m.end()
+    if pos < end:
+        units.append((pos, end))
+    return units
+
+
+def pack(body: str, units: list[tuple[int, int]], level: int = 0,
+         budget: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> list[tuple[int, int]]:
+    """Greedily join consecutive units into spans of ≤ `budget` tokens with unit-level overlap.
+
+    A unit over budget is replaced in place by its pieces at the next finer
+    level of `_LEVELS` (prose elements, level 0, into sentences; tables,
+    level -1, into rows), so it still packs together with its neighbours.
+    """
+    out, cur, fresh = [], [], 0
+    stack = [(s, e, level) for s, e in reversed(units)]
+
+    def flush():
+        if fresh:
+            out.append((cur[0][0][0], cur[-1][0][1]))
+
+    while stack:
+        start, end, lvl = stack.pop()
+        tokens = count_tokens(body[start:end])
+        if tokens > budget and lvl + 1 < len(_LEVELS):
+            finer = _split(body, start, end, lvl + 1)
+            stack.extend((s, e, lvl + 1) for s, e in reversed(finer or [(start, end)]))
+            continue
+        # Count the candidate span itself (separators included): it is the exact
+        # slice that gets stored
+        if cur and count_tokens(body[cur[0][0][0]:end]) > budget:
+            flush()
+            keep, kept = [], 0
+            for u, t in reversed(cur):
+                if kept + t > overlap:
+                    break
+                keep.insert(0, (u, t))
+                kept += t
+            if keep and count_tokens(body[keep[0][0][0]:end]) > budget:
+                keep = []
+            cur, fresh = keep, 0
+        cur.append(((start, end), tokens))
+        fresh += 1
+    flush()
+    return out
+
+
+def _section_spans(body: str, section: list[Element]):
+    """(start, end, kind) for one section: prose runs packed by element, tables by row.
+
+    A heading directly above a table is packed with the table, not on its own.
+    """
+    run = []
+    for el in section + [None]:
+        if el is None or el.kind in TABLES:
+            lead = []
+            if run and el is not None and all(x.kind in TITLES for x in run):
+                lead, run = run, []
+            if run:
+                for s, e in pack(body, [(x.start, x.end) for x in run]):
+                    yield s, e, "text"
+                run = []
+            if el is not None:
+                for s, e in pack(body, [(x.start, x.end) for x in lead + [el]], level=-1):
+                    yield s, e, "table"
+        else:
+            run.append(el)
+
+
+def chunk_document(doc: dict) -> list[tuple[str, str, dict]]:
+    """Return (id, text, metadata) for every chunk of one corpus document (corpus.py)."""
+    body, out = doc["body"], []
+    for section in sections(elements_of(doc)):
+        title = next((body[e.start:e.end].strip("# \n") for e in section if e.kind in TITLES), None)
+        for start, end, kind in _section_spans(body, section):
+            text = body[start:end]
+            if not text.strip():
+                continue
+            meta = {"src": doc["source"], "doc_id": doc["id"], "tokens": count_tokens(text),
+                    "start": start, "kind": kind, "seq": len(out)}
+            if title:
+                meta["section"] = title[:200]
+            if section[0].page is not None:
+                meta["page"] = section[0].page
+            out.append((f"{doc['id']}:{hashlib.md5(text.encode()).hexdigest()}", text, meta))
+    return out
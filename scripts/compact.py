@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+scripts/compact.py
+
+Purge orphaned chunks from the `knowledge_base` collection.
+
+A chunk is orphaned when its source is gone (not in the manifest or the corpus),
+when it carries no doc_id (legacy md5-only ids from before chunk tracking), or
+when no source's tracked chunk set claims it (left behind by an interrupted
+run). Reports how many chunks were removed and how much disk was reclaimed.
+The same chunks are tombstoned in the BM25 index, whose segments are then
+merged into one; the chunk store drops deleted sources, and it and the corpus
+store (corpus.py) are rewritten without superseded versions. Slide images in
+raw_imgs/ that no live document references are deleted with their cached
+captions (captioner.collect_images).
+
+Each store's writer lock (locks.py, and the BM25 index's own LOCK) is taken
+up front; if extraction or embedding is writing one, nothing is touched and
+the run fails.
+"""
+from pathlib import Path
+from logconf import logging
+import click, chromadb
+from rich import print
+from chunk_tracker import ChunkTracker
+from lexical_index import LexicalIndex
+from chunk_store import ChunkStore
+from corpus import Corpus
+from captioner import collect_images
+from locks import LockHeld
+import index_generation
+from embed import DBPATH, COLLECTION, DELETE_BATCH, batched, live_doc_ids
+
+PAGE = 5000
+RAW_IMG = Path(__file__).resolve().parent.parent / "raw_imgs"
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def fmt_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+def find_orphans(collection, live: set[str], tracked: set[str]) -> list[str]:
+    orphans, offset = [], 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=PAGE, offset=offset)
+        if not page["ids"]:
+            return orphans
+        for cid, meta in zip(page["ids"], page["metadatas"]):
+            doc_id = (meta or {}).get("doc_id")
+            if doc_id not in live or cid not in tracked:
+                orphans.append(cid)
+        offset += len(page["ids"])
+
+@click.command()
+@click.option("--dry-run", is_flag=True, help="Report orphans without deleting them")
+@click.option("--vacuum", is_flag=True,
+              help="VACUUM chroma.sqlite3 afterwards to return freed pages to the OS")
+def main(dry_run, vacuum):
+    corpus, chunks, lexical = Corpus(), ChunkStore(), LexicalIndex()
+    if not dry_run:
+        try:
+            corpus.compact_lock()
+            if not chunks.acquire(blocking=False):
+                raise LockHeld(f"{chunks.root} is being written by another process")
+            if not lexical.acquire(blocking=False):
+                raise LockHeld(f"{lexical.root} is being written by another process")
+        except LockHeld as e:
+            raise click.ClickException(f"{e}; retry once ingestion has finished")
+    before = dir_size(DBPATH)
+    client = chromadb.PersistentClient(path=str(DBPATH))
+    collection = client.get_or_create_collection(COLLECTION)
+    tracker = ChunkTracker()
+    count_before = collection.count()
+
+    live = live_doc_ids()
+    dead_docs = tracker.doc_ids() - live
+    if not dry_run:
+        for doc_id in dead_docs:
+            tracker.forget(doc_id)
+
+    orphans = find_orphans(collection, live, tracker.all_ids())
+    logging.info(f"🔎 {len(orphans)} orphaned chunks ({len(dead_docs)} deleted sources)")
+
+    if not dry_run:
+        for part in batched(orphans, DELETE_BATCH):
+            collection.delete(ids=part)
+        if orphans:
+            index_generation.bump()
+        lexical.delete(orphans)
+        lexical.merge()
+        print(f"🔤 lexical index: {lexical.stats()}")
+        for doc_id in chunks.doc_ids() - live:
+            chunks.forget(doc_id)
+        freed = chunks.compact()
+        print(f"🧩 chunk store: {chunks.stats()} (reclaimed {fmt_bytes(freed)})")
+        freed = corpus.compact()
+        print(f"📚 corpus: {corpus.stats()} (reclaimed {fmt_bytes(freed)})")
+        if vacuum:
+            import sqlite3
+            con = sqlite3.connect(str(DBPATH / "chroma.sqlite3"))
+            con.execute("VACUUM")
+            con.close()
+    images, freed = collect_images(RAW_IMG, corpus, live, dry_run)
+    print(f"🖼️ raw_imgs: {'would remove' if dry_run else 'removed'} {images} unreferenced images "
+          f"({fmt_bytes(freed)})")
+    tracker.close()
+    lexical.close()
+    chunks.close()
+    corpus.close()
+
+    after = dir_size(DBPATH)
+    count_after = collection.count()
+    print(f"[bold]{'Would remove' if dry_run else 'Removed'} {len(orphans)} chunks[/bold] "
+          f"({count_before} → {count_after} live)")
+    print(f"💾 vector_store: {fmt_bytes(before)} → {fmt_bytes(after)} "
+          f"(reclaimed {fmt_bytes(before - after)})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+"""
+scripts/corpus.py
+
+Sharded, compressed, append-only store for extracted documents, replacing
+one JSON file per source in clean/.
+
+Layout under corpus/ (CORPUS_DIR to override):
+
+    corpus.json        {"version": 1, "shards": N}, fixed when the store is created
+    shard-007.dat      12-byte header ("CDT1", generation u64), then compressed
+                       document JSON records back to back
+    shard-007.idx      12-byte header ("CIX1", generation u64), then an
+                       append-only offset index; one record per write:
+                       offset u64, length u32 (0 = deleted), raw length u32,
+                       codec u8, id length u16, then the UTF-8 doc id
+
+A document lives in shard `blake2b(doc_id) % N` (CORPUS_SHARDS, default 16,
+for new stores). Records are compressed one by one (zstd when `zstandard` is
+installed, zlib otherwise; the codec is per record), so a single document is
+read with one dict lookup and one `pread` + decompress, and full scans stream
+each shard's live records in file order. Index files are memory-mapped and
+scanned incrementally (a `stat` per lookup picks up another process's
+writes); later records for a doc id supersede earlier ones.
+
+Updates and deletes only append; `compact()` rewrites each shard's live
+records and drops superseded ones. One process writes at a time: writes take
+an exclusive flock on corpus/LOCK (locks.py) and keep it until `close()`,
+`compact()` fails at once if another process holds it, and crash recovery of
+an interrupted compaction only runs while holding it. Any number of processes
+may read without locking: compaction gives both rewritten files the next
+generation, so a reader that pairs an index with a data file from another
+generation (the two are renamed one after the other) notices, rescans the
+shard and reads again, and every read checks the decoded document's id.
+Files written before the header existed read as generation 0.
+
+    python scripts/corpus.py import [--remove]   # move a legacy clean/ into the store
+    python scripts/corpus.py stats | compact | get DOC_ID
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import zlib
+from pathlib import Path
+
+import click
+
+from locks import LockHeld, WriterLock
+
+BASE = Path(__file__).resolve().parent.parent
+CORPUS_DIR = Path(os.getenv("CORPUS_DIR", str(BASE / "corpus")))
+CLEAN = BASE / "clean"  # legacy one-JSON-per-document layout, read by `import`
+
+CODEC_ZLIB, CODEC_ZSTD = 0, 1
+LEVEL = int(os.getenv("CORPUS_LEVEL", "6"))
+_HEAD = struct.Struct("<QIIBH")
+_GEN = struct.Struct("<4sQ")
+DAT_MAGIC, IDX_MAGIC = b"CDT1", b"CIX1"
+
+
+class _Stale(Exception):
+    """A shard's data file is not from the generation its index was read from."""
+
+
+def _generation(head: bytes, magic: bytes) -> tuple[int, int]:
+    """(generation, header size) from a file's first bytes; headerless files are generation 0."""
+    if len(head) >= _GEN.size and head[:4] == magic:
+        return _GEN.unpack_from(head)[1], _GEN.size
+    return 0, 0
+
+
+@functools.lru_cache(maxsize=1)
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard.ZstdCompressor(level=LEVEL), zstandard.ZstdDecompressor()
+
+
+def _compress(raw: bytes) -> tuple[int, bytes]:
+    z = _zstd()
+    if z is None:
+        return CODEC_ZLIB, zlib.compress(raw, LEVEL)
+    return CODEC_ZSTD, z[0].compress(raw)
+
+
+def _decompress(codec: int, blob: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        z = _zstd()
+        if z is None:
+            raise RuntimeError("corpus record is zstd-compressed; install zstandard to read it")
+        return z[1].decompress(blob)
+    return zlib.decompress(blob)
+
+
+def _decode_errors() -> tuple:
+    """Exceptions a record read from the wrong offset can raise."""
+    z = _zstd()
+    errors = (zlib.error, ValueError, UnicodeDecodeError)
+    if z is not None:
+        import zstandard
+        errors += (zstandard.ZstdError,)
+    return errors
+
+
+class _Shard:
+    """One data file plus its offset index."""
+
+    def __init__(self, root: Path, n: int):
+        self.data_path = root / f"shard-{n:03d}.dat"
+        self.idx_path = root / f"shard-{n:03d}.idx"
+        self._reset()
+
+    def _reset(self) -> None:
+        self.live: dict[str, tuple[int, int, int, int]] = {}  # offset, length, raw, codec
+        self.scanned = 0
+        self.inode = None
+        self.gen = None  # from the index header; None until the index has one
+        self._fd = None
+        self._data = self._idx = None
+
+    def recover(self) -> None:
+        """Finish or roll back a compaction interrupted between its two renames.
+
+        Only safe under the writer lock: a live compaction looks the same.
+        """
+        new_data, new_idx = (p.with_name(p.name + ".new") for p in (self.data_path, self.idx_path))
+        if new_idx.exists() and not new_data.exists():
+            os.replace(new_idx, self.idx_path)
+        else:
+            new_data.unlink(missing_ok=True)
+            new_idx.unlink(missing_ok=True)
+
+    def refresh(self) -> None:
+        """Apply index records appended since the last scan."""
+        try:
+            st = self.idx_path.stat()
+        except FileNotFoundError:
+            return
+        if st.st_ino != self.inode:  # first scan, or rewritten by compact()
+            self.close()
+            self._reset()
+            self.inode = st.st_ino
+        if self.gen is None:
+            if st.st_size == 0:
+                return
+            with open(self.idx_path, "rb") as fp:
+                self.gen, self.scanned = _generation(fp.read(_GEN.size), IDX_MAGIC)
+        if st.st_size <= self.scanned:
+            return
+        with open(self.idx_path, "rb") as fp, \
+                mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size, pos = len(mm), self.scanned
+            while pos + _HEAD.size <= size:
+                offset, length, raw, codec, n = _HEAD.unpack_from(mm, pos)
+                end = pos + _HEAD.size + n
+                if end > size:  # torn tail of an interrupted write
+                    break
+                doc_id = mm[pos + _HEAD.size:end].decode()
+                if length:
+                    self.live[doc_id] = (offset, length, raw, codec)
+                else:
+                    self.live.pop(doc_id, None)
+                pos = end
+            self.scanned = pos
+
+    def read(self, loc: tuple[int, int, int, int]) -> dict:
+        """Decode one record; raises _Stale if the data file is from another generation."""
+        offset, length, _, codec = loc
+        if self._fd is None:
+            fd = os.open(self.data_path, os.O_RDONLY)
+            if _generation(os.pread(fd, _GEN.size, 0), DAT_MAGIC)[0] != self.gen:
+                os.close(fd)
+                raise _Stale(self.data_path)
+            self._fd = fd
+        return json.loads(_decompress(codec, os.pread(self._fd, length, offset)))
+
+    def rescan(self) -> None:
+        self.close()
+        self._reset()
+        self.refresh()
+
+    def append(self, doc_id: str, blob: bytes = b"", raw: int = 0, codec: int = 0) -> None:
+        if self._idx is None:
+            self.refresh()
+            # Drop a torn index tail so new records stay aligned
+            if self.idx_path.exists() and self.idx_path.stat().st_size > self.scanned:
+                os.truncate(self.idx_path, self.scanned)
+                if not self.scanned:
+                    self.gen = None  # not even a whole header: start the shard afresh
+            self._data = open(self.data_path, "ab")
+            self._idx = open(self.idx_path, "ab")
+            self.inode = os.fstat(self._idx.fileno()).st_ino
+            if self.gen is None:
+                # New shard: no index record points into the data file yet
+                self._data.truncate(0)
+                self._data.write(_GEN.pack(DAT_MAGIC, 1))
+                self._data.flush()
+                self._idx.write(_GEN.pack(IDX_MAGIC, 1))
+                self._idx.flush()
+                self.gen, self.scanned = 1, _GEN.size
+        offset = self._data.tell()
+        if blob:
+            self._data.write(blob)
+            self._data.flush()
+        key = doc_id.encode()
+        self._idx.write(_HEAD.pack(offset, len(blob), raw, codec, len(key)) + key)
+        self._idx.flush()
+        self.scanned = self._idx.tell()
+        if blob:
+            self.live[doc_id] = (offset, len(blob), raw, codec)
+        else:
+            self.live.pop(doc_id, None)
+
+    def compact(self) -> int:
+        """Rewrite live records into fresh files; returns bytes freed."""
+        self.refresh()
+        if not self.data_path.exists():
+            return 0
+        before = self.data_path.stat().st_size + self.idx_path.stat().st_size
+        new_data, new_idx = (p.with_name(p.name + ".new") for p in (self.data_path, self.idx_path))
+        gen = (self.gen or 0) + 1
+        with open(self.data_path, "rb") as src, open(new_data, "wb") as data, \
+                open(new_idx, "wb") as idx:
+            data.write(_GEN.pack(DAT_MAGIC, gen))
+            idx.write(_GEN.pack(IDX_MAGIC, gen))
+            for doc_id, (offset, length, raw, codec) in sorted(self.live.items(),
+                                                                key=lambda kv: kv[1][0]):
+                src.seek(offset)
+                pos = data.tell()
+                data.write(src.read(length))
+                key = doc_id.encode()
+                idx.write(_HEAD.pack(pos, length, raw, codec, len(key)) + key)
+            data.flush()
+            os.fsync(data.fileno())
+            idx.flush()
+            os.fsync(idx.fileno())
+        self.close()
+        os.replace(new_data, self.data_path)
+        os.replace(new_idx, self.idx_path)
+        self._reset()
+        self.refresh()
+        return before - self.data_path.stat().st_size - self.idx_path.stat().st_size
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        for fp in (self._data, self._idx):
+            if fp is not None:
+                fp.close()
+        self._data = self._idx = None
+
+
+class Corpus:
+    def __init__(self, root: Path = CORPUS_DIR, shards: int | None = None):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.lock = WriterLock(self.root / "LOCK")
+        meta = self.root / "corpus.json"
+        if not meta.exists():
+            self.lock.acquire()
+            try:
+                if not meta.exists():
+                    tmp = meta.with_name(f".{meta.name}.tmp")
+                    tmp.write_text(json.dumps({"version": 1, "shards": shards
+                                               or int(os.getenv("CORPUS_SHARDS", "16"))}))
+                    os.replace(tmp, meta)
+            finally:
+                self.lock.release()
+        self.n_shards = json.loads(meta.read_text())["shards"]
+        self.shards = [_Shard(self.root, n) for n in range(self.n_shards)]
+        # Recovery renames/deletes files, so only when no writer is active
+        if self.lock.acquire(blocking=False):
+            try:
+                for shard in self.shards:
+                    shard.recover()
+            finally:
+                self.lock.release()
+        for shard in self.shards:
+            shard.refresh()
+
+    def _shard(self, doc_id: str) -> _Shard:
+        h = int.from_bytes(hashlib.blake2b(doc_id.encode(), digest_size=8).digest(), "little")
+        return self.shards[h % self.n_shards]
+
+    # ---- reads -----------------------------------------------------------------
+
+    def _read(self, shard: _Shard, doc_id: str, loc) -> dict | None:
+        """Read doc_id at loc, rescanning the shard if another process compacted it."""
+        for _ in range(3):
+            try:
+                doc = shard.read(loc)
+                if doc.get("id") == doc_id:
+                    return doc
+            except (_Stale, *_decode_errors()):
+                pass
+            # Shard rewritten by compact() between our scan and read
+            shard.rescan()
+            loc = shard.live.get(doc_id)
+            if loc is None:
+                return None
+        raise RuntimeError(f"{shard.data_path}: could not read {doc_id} consistently")
+
+    def get(self, doc_id: str) -> dict | None:
+        shard = self._shard(doc_id)
+        shard.refresh()
+        loc = shard.live.get(doc_id)
+        return self._read(shard, doc_id, loc) if loc else None
+
+    def __contains__(self, doc_id: str) -> bool:
+        shard = self._shard(doc_id)
+        shard.refresh()
+        return doc_id in shard.live
+
+    def __len__(self) -> int:
+        self.refresh()
+        return sum(len(s.live) for s in self.shards)
+
+    def __iter__(self):
+        return self.iter_docs()
+
+    def refresh(self) -> None:
+        for shard in self.shards:
+            shard.refresh()
+
+    def doc_ids(self) -> set[str]:
+        self.refresh()
+        return {doc_id for s in self.shards for doc_id in s.live}
+
+    def iter_docs(self):
+        """Stream every live document, shard by shard in file order."""
+        self.refresh()
+        for shard in self.shards:
+            for doc_id, _ in sorted(shard.live.items(), key=lambda kv: kv[1]):
+                # Current location: a rescan during the loop moves every record
+                loc = shard.live.get(doc_id)
+                doc = self._read(shard, doc_id, loc) if loc else None
+                if doc is not None:
+                    yield doc
+
+    def sample(self, n: int, seed: int = 0) -> list[dict]:
+        ids = sorted(self.doc_ids())
+        return [self.get(i) for i in random.Random(seed).sample(ids, min(n, len(ids)))]
+
+    def stats(self) -> dict:
+        self.refresh()
+        live = [loc for s in self.shards for loc in s.live.values()]
+        files = [p for s in self.shards for p in (s.data_path, s.idx_path) if p.exists()]
+        return {"docs": len(live), "shards": self.n_shards,
+                "raw_bytes": sum(loc[2] for loc in live),
+                "live_bytes": sum(loc[1] for loc in live),
+                "total_bytes": sum(p.stat().st_size for p in files)}
+
+    # ---- writes ----------------------------------------------------------------
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Become the writer (held until close()); False if busy and not blocking."""
+        if self.lock.held:
+            return True
+        if not self.lock.acquire(blocking):
+            return False
+        # Another writer may have appended or compacted since we last looked
+        for shard in self.shards:
+            shard.close()
+            shard.recover()
+            shard.rescan()
+        return True
+
+    def put(self, doc: dict) -> None:
+        self.acquire()
+        raw = json.dumps(doc, ensure_ascii=False).encode()
+        codec, blob = _compress(raw)
+        self._shard(doc["id"]).append(doc["id"], blob, len(raw), codec)
+
+    def delete(self, doc_id: str) -> None:
+        self.acquire()
+        if doc_id in self:
+            self._shard(doc_id).append(doc_id)
+
+    def compact_lock(self) -> None:
+        """Become the writer without waiting; raises LockHeld if another process writes."""
+        if not self.acquire(blocking=False):
+            raise LockHeld(f"{self.root} is being written by another process")
+
+    def compact(self) -> int:
+        """Rewrite every shard without dead records (see compact_lock)."""
+        self.compact_lock()
+        freed = sum(shard.compact() for shard in self.shards)
+        logging.info(f"🗜️ Corpus: {len(self)} live docs, {freed} bytes freed")
+        return freed
+
+    def import_clean(self, src: Path = CLEAN, remove: bool = False) -> int:
+        """Copy legacy `src/*.json` documents not yet in the store; returns how many."""
+        if not src.is_dir():
+            return 0
+        n = 0
+        with os.scandir(src) as it:
+            for entry in it:
+                if not entry.name.endswith(".json") or entry.name.startswith("."):
+                    continue
+                path = Path(entry.path)
+                if path.stem not in self:
+                    self.put(json.loads(path.read_text()))
+                    n += 1
+                if remove:
+                    path.unlink(missing_ok=True)
+        return n
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+        self.lock.release()
+
+
+@click.group()
+def cli():
+    """Inspect and maintain the corpus store."""
+
+
+@cli.command("import")
+@click.option("--src", type=click.Path(file_okay=False, path_type=Path), default=CLEAN,
+              show_default=True, help="Directory of one-JSON-per-document files")
+@click.option("--remove", is_flag=True, help="Delete each JSON file once it is in the store")
+def import_cmd(src, remove):
+    """Import a legacy clean/ directory."""
+    corpus = Corpus()
+    n = corpus.import_clean(src, remove)
+    click.echo(f"📥 Imported {n} documents from {src}: {corpus.stats()}")
+    corpus.close()
+
+
+@cli.command()
+def stats():
+    """Document count and sizes."""
+    click.echo(json.dumps(Corpus().stats(), indent=2))
+
+
+@cli.command()
+def compact():
+    """Rewrite shards without superseded and deleted documents."""
+    corpus = Corpus()
+    try:
+        freed = corpus.compact()
+    except LockHeld as e:
+        raise click.ClickException(str(e))
+    click.echo(f"🗜️ Reclaimed {freed} bytes: {corpus.stats()}")
+    corpus.close()
+
+
+@cli.command()
+@click.argument("doc_id")
+def get(doc_id):
+    """Print one document as JSON."""
+    doc = Corpus().get(doc_id)
+    if doc is None:
+        raise click.ClickException(f"{doc_id}: not in the corpus")
+    click.echo(json.dumps(doc, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
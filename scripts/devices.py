@@ -0,0 +1,34 @@
+"""
+scripts/devices.py
+
+Pick the torch device and dtype for the ingestion models, so the same scripts
+run on Apple Silicon (mps), CUDA boxes and CPU-only Linux hosts.
+"""
+
+import os
+import torch
+
+DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+
+
+def pick_device(preferred: str | None = None) -> str:
+    """Return `preferred` (or $TORCH_DEVICE) if set, else cuda → mps → cpu."""
+    preferred = preferred or os.getenv("TORCH_DEVICE")
+    if preferred:
+        return preferred
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def pick_dtype(device: str, preferred: str | None = None) -> torch.dtype:
+    """Half precision on accelerators; float32 on CPU unless bfloat16 is asked for."""
+    if preferred:
+        return DTYPES[preferred]
+    return torch.float32 if device == "cpu" else torch.float16
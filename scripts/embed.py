@@ -1,34 +1,228 @@
 #!/usr/bin/env python
-"""Split cleaned markdown, embed with bge-base, store in Chroma."""
+"""Chunk cleaned documents, embed with bge-base, store in Chroma.
+
+Chunks come from `chunk_store.ChunkStore`: structure-aware chunks
+(chunker.py) computed once per document version and persisted, so re-runs and
+downstream tools read them instead of re-splitting bodies.
+
+Chunks from all documents are collected into fixed-size batches, encoded by
+the SentenceTransformer in one vectorized call per batch and written with a
+single `collection.upsert`, so Chroma never falls back to its own default
+embedding function and re-runs are idempotent.
+
+Chunk ids are `{doc_id}:{md5(chunk)}` and each source's chunk set is tracked
+by `chunk_tracker.ChunkTracker`. Once all of a source's new chunks are upserted
+its stale ones are deleted, sources whose chunk set is unchanged are skipped,
+and sources no longer in the corpus store (corpus.py) or the manifest are
+purged.
+
+Progress is written to `ledger.Ledger` as chunks land, for
+check_embedding_progress.py. The same chunks feed the BM25 index in
+lexical_index.py, which the agents query alongside the vectors.
+"""
 from pathlib import Path
 from logconf import logging
-import json, hashlib, chromadb
+from itertools import islice
+import os, click, chromadb
 from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from rich.progress import track
+from rich.progress import Progress
+from devices import pick_device
+from manifest import Manifest
+from chunk_tracker import ChunkTracker
+from ledger import Ledger
+from lexical_index import LexicalIndex
+from chunk_store import ChunkStore
+from corpus import Corpus
+from collections import Counter
+import index_generation
 
 BASE   = Path(__file__).resolve().parent.parent
-TXT    = BASE / "clean"
+RAW    = BASE / "raw"
 DBPATH = (BASE / "vector_store").expanduser()
 
-client = chromadb.PersistentClient(path=str(DBPATH))
-collection = client.get_or_create_collection("knowledge_base")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-base-en")
+COLLECTION  = "knowledge_base"
+DELETE_BATCH = 1000
+
+def expected_count(chunks: list) -> int:
+    return len({c[0] for c in chunks})
+
+def batched(it, n: int):
+    it = iter(it)
+    while batch := list(islice(it, n)):
+        yield batch
+
+class Batcher:
+    """Pack chunks of consecutive documents into fixed-size upsert batches.
+
+    Each emitted item is (chunks, finished) where `finished` lists the
+    (doc_id, chunk_ids, tag) of documents whose last chunk is in this batch or
+    an earlier one — i.e. documents that are complete once the batch lands.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.chunks, self.finished = [], []
+
+    def add(self, doc_id: str, chunks: list, tag=None) -> list:
+        out = []
+        for c in chunks:
+            self.chunks.append(c)
+            if len(self.chunks) >= self.size:
+                out.append((self.chunks, self.finished))
+                self.chunks, self.finished = [], []
+        self.finished.append((doc_id, {c[0] for c in chunks}, tag))
+        return out
+
+    def drain(self) -> list:
+        if not (self.chunks or self.finished):
+            return []
+        out = [(self.chunks, self.finished)]
+        self.chunks, self.finished = [], []
+        return out
 
+class Embedder:
+    """Encode chunk batches with the configured model and bulk-upsert them."""
 
-splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=80)
-model    = SentenceTransformer("BAAI/bge-base-en", device="mps")
+    def __init__(self, batch_size: int = 256, encode_batch_size: int = 64,
+                 device: str | None = None):
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.device = pick_device(device)
+        self.model = SentenceTransformer(EMBED_MODEL, device=self.device)
+        client = chromadb.PersistentClient(path=str(DBPATH))
+        self.collection = client.get_or_create_collection(COLLECTION)
+        self.tracker = ChunkTracker()
+        self.ledger = Ledger()
+        self.lexical = LexicalIndex()
+        self.lexical.acquire()  # BM25 writer for the embedder's lifetime (released by close)
+        self.chunks = ChunkStore()
+        logging.info(f"🧠 {EMBED_MODEL} on {self.device}, batch={batch_size}")
 
-for jf in track(TXT.glob("*.json"), description="Embedding chunks"):
-    doc = json.loads(jf.read_text())
-    for chunk in splitter.split_text(doc["body"]):
-        cid = hashlib.md5(chunk.encode()).hexdigest()
-        try:
-            collection.add(
-                documents=[chunk],
-                metadatas=[{"src": doc["source"]}],
-                ids=[cid],
+    def is_unchanged(self, doc_id: str, chunks: list) -> bool:
+        return {c[0] for c in chunks} == self.tracker.ids(doc_id)
+
+    def write(self, batch: list[tuple[str, str, dict]], finished: list = ()) -> int:
+        n = 0
+        if batch:
+            # Identical chunks of one doc share an id; Chroma rejects repeats within one call
+            unique = {cid: (chunk, meta) for cid, chunk, meta in batch}
+            ids = list(unique)
+            docs = [unique[i][0] for i in ids]
+            vecs = self.model.encode(
+                docs,
+                batch_size=self.encode_batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
             )
-        except ValueError:
-            logging.debug(f"↩️ Duplicate chunk skipped {cid}")
+            metas = [unique[i][1] for i in ids]
+            try:
+                self.collection.upsert(
+                    ids=ids,
+                    documents=docs,
+                    embeddings=vecs.tolist(),
+                    metadatas=metas,
+                )
+            except Exception as e:
+                self.ledger.failed_many(list({m["doc_id"] for m in metas}), f"upsert failed: {e}")
+                raise
+            index_generation.bump()
+            self.lexical.add([(i, unique[i][0], unique[i][1]) for i in ids])
+            self.ledger.add_embedded(Counter(m["doc_id"] for m in metas))
+            self.ledger.sample()
+            n = len(ids)
+        for doc_id, ids, _ in finished:
+            self.finalize(doc_id, ids)
+        if finished:
+            self.ledger.complete([doc_id for doc_id, _, _ in finished])
+        return n
+
+    def finalize(self, doc_id: str, ids: set[str]) -> None:
+        """Swap a source's chunk set: new ids are already upserted, drop the rest."""
+        stale = self.tracker.ids(doc_id) - ids
+        self.delete(stale)
+        self.tracker.replace(doc_id, ids)
+        if stale:
+            logging.info(f"♻️ {doc_id}: dropped {len(stale)} stale chunks")
+
+    def purge(self, live: set[str]) -> int:
+        """Delete all chunks of tracked sources that are no longer live."""
+        removed = 0
+        for doc_id in self.tracker.doc_ids() - live:
+            ids = self.tracker.ids(doc_id)
+            self.delete(ids)
+            self.tracker.forget(doc_id)
+            self.chunks.forget(doc_id)
+            self.ledger.forget(doc_id)
+            removed += len(ids)
+            logging.info(f"🗑️ {doc_id}: purged {len(ids)} chunks of deleted source")
+        return removed
+
+    def delete(self, ids) -> None:
+        ids = list(ids)
+        self.lexical.delete(ids)
+        for part in batched(ids, DELETE_BATCH):
+            self.collection.delete(ids=part)
+            index_generation.bump()
+
+    def close(self) -> None:
+        """Flush buffered rows of the lexical index and close the chunk store."""
+        self.lexical.close()
+        self.chunks.close()
+
+def live_doc_ids() -> set[str]:
+    """Sources that may keep chunks: everything in the manifest or the corpus."""
+    manifest = Manifest(RAW)
+    try:
+        live = {e.doc_id for e in manifest.entries()}
+    finally:
+        manifest.close()
+    return live | Corpus().doc_ids()
+
+@click.command()
+@click.option("--batch-size", default=256, show_default=True, envvar="EMBED_BATCH_SIZE",
+              help="Chunks per encode + upsert round trip")
+@click.option("--encode-batch-size", default=64, show_default=True,
+              envvar="EMBED_ENCODE_BATCH_SIZE", help="Model forward-pass batch size")
+@click.option("--device", envvar="EMBED_DEVICE", help="Force cuda/mps/cpu (default: auto-detect)")
+@click.option("--force", is_flag=True, help="Re-embed sources whose chunks are unchanged")
+def main(batch_size, encode_batch_size, device, force):
+    embedder = Embedder(batch_size, encode_batch_size, device)
+    embedder.chunks.acquire()  # chunk store writer for the whole run
+    corpus = Corpus()
+    if not len(corpus) and (imported := corpus.import_clean()):
+        logging.info(f"📦 Imported {imported} legacy clean/ documents into the corpus store")
+    batcher = Batcher(batch_size)
+
+    # Sources already embedded before the lexical index existed (or lost from it
+    # by an interrupted run) are backfilled from their chunks without re-encoding
+    indexed = embedder.lexical.doc_ids()
+
+    total = skipped = 0
+    with Progress() as bar:
+        task = bar.add_task("Embedding chunks", total=len(corpus))
+        for doc in corpus.iter_docs():
+            bar.advance(task)
+            chunks = embedder.chunks.chunks_for(doc)
+            if not force and embedder.is_unchanged(doc["id"], chunks):
+                embedder.ledger.embedded(doc["id"], doc["source"], expected_count(chunks))
+                if doc["id"] not in indexed:
+                    embedder.lexical.add(chunks)
+                skipped += 1
+                continue
+            embedder.ledger.chunked(doc["id"], doc["source"], expected_count(chunks))
+            for batch, finished in batcher.add(doc["id"], chunks):
+                total += embedder.write(batch, finished)
+        for batch, finished in batcher.drain():
+            total += embedder.write(batch, finished)
+
+    purged = embedder.purge(live_doc_ids())
+    embedder.close()
+    logging.info(
+        f"✅ Embedding complete ({total} chunks upserted, {skipped} unchanged sources, "
+        f"{purged} chunks purged)"
+    )
 
-logging.info("✅ Embedding complete")
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,330 @@
 #!/usr/bin/env python
-"""Robust extractor + captioner with MIME logging and rich progress."""
+"""Robust extractor + captioner with MIME logging and rich progress.
+
+Extraction is incremental: `manifest.Manifest` gives every source a stable
+doc_id, unchanged files are skipped, modified ones are re-extracted in place and
+outputs of deleted sources are removed from the corpus store (corpus.py).
+
+With `--workers N` (N > 1) partitioning runs in a process pool. Each file gets
+a `--timeout` budget, workers are recycled after `--max-tasks-per-child` files
+to cap their memory, and results are written to the corpus store in the same
+order the files were queued. A legacy clean/ directory is imported into the
+store on the first run.
+
+Captioning is its own stage (`captioner.CaptionService`): slide images are
+stored once per content hash in raw_imgs/, deduplicated, and captioned in
+batches; a document is written as soon as all of its images have captions,
+and the hashes it references are recorded so compact.py can delete images no
+document uses any more.
+"""
 from logconf import logging
 from pathlib import Path
 from itertools import chain
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from rich.progress import Progress
-import mimetypes, uuid, json, traceback, torch
+from manifest import Manifest
+from captioner import CaptionService
+from ledger import Ledger
+from corpus import Corpus
+import mimetypes, signal, threading, traceback, click
 
 from unstructured.partition.auto import partition
 from unstructured.documents.elements import Element
-from transformers import BlipProcessor, BlipForConditionalGeneration
 from pptx import Presentation
-from PIL import Image
 
 BASE      = Path(__file__).resolve().parent.parent
 RAW       = BASE / "raw"
 RAW_IMG   = BASE / "raw_imgs"
-CLEAN     = BASE / "clean"
 RAW_IMG.mkdir(exist_ok=True)
-CLEAN.mkdir(exist_ok=True)
 
-# 🔍 Captioning model (BLIP base)
-proc  = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-model = BlipForConditionalGeneration.from_pretrained(
-    "Salesforce/blip-image-captioning-base", torch_dtype=torch.float16
-).to("mps")
+SUFFIXES = ("*.pptx", "*.docx", "*.pdf", "*.xlsx", "*.vsdx")
+
+def textify(el: Element) -> str:
+    return getattr(el, "to_markdown", lambda: el.text)()
 
-def caption(img_path: Path) -> str:
+class FileTimeout(Exception):
+    pass
+
+def _on_alarm(signum, frame):
+    raise FileTimeout()
+
+def extract_file(fp: Path, timeout: int = 0) -> dict:
+    """Partition one file and pull its slide images. Safe to run in a worker.
+
+    Returns {"md", "elements", "images", "warnings"} on success or {"error"}
+    on failure, `elements` being the `[type, start, end, page]` span of every
+    element in `md` (read by chunker.py);
+    never raises, so one bad file cannot take down the pool. The timeout relies
+    on SIGALRM and is only armed on a process's main thread.
+    """
+    timeout = timeout if threading.current_thread() is threading.main_thread() else 0
+    if timeout:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(timeout)
     try:
-        inputs = proc(images=Image.open(img_path), return_tensors="pt").to("mps")
-        ids = model.generate(**inputs, max_new_tokens=25)
-        return proc.decode(ids[0], skip_special_tokens=True)
+        els = partition(str(fp))
+        parts, elements, pos = [], [], 0
+        for el in els:
+            text = textify(el)
+            parts.append(text)
+            elements.append([el.category, pos, pos + len(text),
+                             getattr(el.metadata, "page_number", None)])
+            pos += len(text) + 1
+        md = "\n".join(parts)
+
+        # 🎞️ Extract slide images for PPTX (captioned later in the parent)
+        images, warnings = [], []
+        if fp.suffix.lower() == ".pptx":
+            try:
+                pres = Presentation(fp)
+                for idx, slide in enumerate(pres.slides):
+                    for shp in slide.shapes:
+                        if shp.shape_type == 13:  # Picture
+                            images.append((idx + 1, shp.image.blob))
+            except FileTimeout:
+                raise
+            except Exception:
+                warnings.append(f"⚠️ Failed to extract images from {fp.name}")
+        return {"md": md, "elements": elements, "images": images, "warnings": warnings}
+    except FileTimeout:
+        return {"error": f"⏱️ Partition timed out after {timeout}s for {fp.name}"}
     except Exception:
-        logging.exception(f"⚠️ Caption failed for {img_path}")
-        return "image"
+        return {"error": f"❌ Partition failed for {fp.name}\n{traceback.format_exc()}"}
+    finally:
+        if timeout:
+            signal.alarm(0)
 
-def textify(el: Element) -> str:
-    return getattr(el, "to_markdown", lambda: el.text)()
+def ordered_results(fn, items: list, workers: int, max_tasks_per_child: int, **kw):
+    """Yield (item, fn(item)) in input order.
 
-docs = chain(
-    RAW.rglob("*.pptx"),
-    RAW.rglob("*.docx"),
-    RAW.rglob("*.pdf"),
-    RAW.rglob("*.xlsx"),
-    RAW.rglob("*.vsdx"),
-)
+    workers <= 1 runs inline. Otherwise a bounded window of futures is kept in
+    flight so a large backlog never sits in memory as pending results.
 
-with Progress() as bar:
-    for fp in bar.track(list(docs), description="📁 Extracting and captioning"):
-        if fp.name.startswith("~$"):
-            logging.warning(f"⏭️ Skipped temporary/system file: {fp.name}")
-            continue
+    A worker that dies (OOM kill, segfault in a parser) breaks the whole pool
+    and fails every pending future with it. The pool is then rebuilt and the
+    item at the head is re-run alone: if it breaks the new pool too it is the
+    culprit and is reported as failed, otherwise its result is used. The other
+    unfinished items are resubmitted.
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, fn(item, **kw)
+        return
 
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers,
+                                   max_tasks_per_child=max_tasks_per_child or None)
+
+    def submit(item) -> Future:
         try:
-            mimetype, _ = mimetypes.guess_type(fp)
-            logging.info(f"📄 Processing {fp.name} ({mimetype})")
+            return pool.submit(fn, item, **kw)
+        except BrokenProcessPool as e:
+            # Broke since the last result; handled once this item reaches the head
+            fut = Future()
+            fut.set_exception(e)
+            return fut
+
+    def crashed(item) -> dict:
+        return {"error": f"❌ Worker crashed on {item.name}\n{traceback.format_exc()}"}
+
+    def survived(fut: Future) -> bool:
+        return fut.done() and not fut.cancelled() and fut.exception() is None
 
-            doc_id = uuid.uuid4().hex
+    window = workers * 2
+    pool = new_pool()
+    try:
+        inflight = deque()
+        it = iter(items)
+        for item in it:
+            inflight.append((item, submit(item)))
+            if len(inflight) >= window:
+                break
+        while inflight:
+            item, fut = inflight.popleft()
             try:
-                els = partition(str(fp))
-                md = "\n".join(textify(e) for e in els)
+                res = fut.result()
+            except BrokenProcessPool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+                try:
+                    res = pool.submit(fn, item, **kw).result()
+                except BrokenProcessPool:
+                    res = crashed(item)
+                    logging.warning(f"♻️ {item.name} killed its worker; restarting the pool")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = new_pool()
+                except Exception:
+                    res = crashed(item)
+                inflight = deque((i, f if survived(f) else submit(i)) for i, f in inflight)
             except Exception:
-                logging.error(f"❌ Partition failed for {fp.name}\n{traceback.format_exc()}")
+                # fn never raises, so this is the executor itself failing the item
+                res = crashed(item)
+            yield item, res
+            nxt = next(it, None)
+            if nxt is not None:
+                inflight.append((nxt, submit(nxt)))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def remove_outputs(corpus: Corpus, captions: CaptionService, doc_id: str) -> None:
+    """Delete the corpus document written for doc_id and its image references.
+
+    Slide images are content-addressed and may be shared with other documents,
+    so only legacy per-document `{doc_id}_{idx}.png` files are removed here;
+    compact.py deletes hashed images once nothing references them.
+    """
+    corpus.delete(doc_id)
+    captions.drop_refs(doc_id)
+    for img in RAW_IMG.glob(f"{doc_id}_*.png"):
+        img.unlink(missing_ok=True)
+
+def render(pending: dict, captions: CaptionService) -> tuple[str, list]:
+    """Body with image captions appended, and its element spans."""
+    md, elements = pending["md"], list(pending["elements"])
+    for sha, slide in zip(pending["images"], pending["slides"]):
+        md += "\n\n"
+        caption = f"![{captions.get(sha)}]({captions.path_for(sha)})"
+        elements.append(["Image", len(md), len(md) + len(caption), slide])
+        md += caption
+    return md, elements
+
+def extract_documents(workers: int = 1, timeout: int = 600, max_tasks_per_child: int = 50,
+                      caption_batch_size: int = 16, caption_device: str | None = None,
+                      caption_dtype: str | None = None, captions_enabled: bool = True,
+                      write_clean: bool = True, record: bool = True):
+    """Run one incremental extraction pass, yielding (doc, entry) per finished document.
+
+    `doc` has the corpus document shape. With record=False the caller is
+    responsible for `Manifest.record(entry)` once the document is fully
+    processed downstream (the streaming pipeline does this after embedding).
+    """
+    docs = [
+        fp for fp in chain.from_iterable(RAW.rglob(s) for s in SUFFIXES)
+        if not fp.name.startswith("~$")
+    ]
+
+    manifest = Manifest(RAW)
+    ledger = Ledger()
+    corpus = Corpus()
+    if write_clean:
+        corpus.acquire()  # single writer for the whole run (compaction waits for us)
+    if write_clean and not len(corpus):
+        imported = corpus.import_clean()
+        if imported:
+            logging.info(f"📦 Imported {imported} legacy clean/ documents into the corpus store")
+    changes, deleted, unchanged = manifest.diff(docs)
+    logging.info(
+        f"🗂️ Manifest: {len(changes)} new/modified, {len(deleted)} deleted, {unchanged} unchanged"
+    )
+    ledger.queued([(c.entry.doc_id, str(c.fp)) for c in changes])
+
+    captions = CaptionService(RAW_IMG, caption_batch_size, caption_device,
+                              caption_dtype, enabled=captions_enabled)
+    for entry in deleted:
+        remove_outputs(corpus, captions, entry.doc_id)
+        manifest.forget(entry)
+        ledger.forget(entry.doc_id)
+        logging.info(f"🗑️ Removed outputs for deleted source {entry.path}")
+
+    by_fp = {c.fp: c for c in changes}
+    if workers > 1:
+        logging.info(f"🧵 Partitioning with {workers} workers (timeout={timeout}s)")
+
+    waiting = deque()  # extracted docs whose images still await a caption batch
+
+    def ready():
+        while waiting and all(captions.is_ready(sha) for sha in waiting[0]["images"]):
+            pending = waiting.popleft()
+            change = pending["change"]
+            body, elements = render(pending, captions)
+            doc = {
+                "id": change.entry.doc_id, "title": change.fp.stem,
+                "body": body, "source": str(change.fp), "elements": elements
+            }
+            try:
+                # 🧾 Save extracted content
+                if write_clean:
+                    corpus.put(doc)
+                captions.set_refs(doc["id"], pending["images"])
+                if record:
+                    manifest.record(change.entry)
+                ledger.extracted(doc["id"], doc["source"])
+                logging.info(f"📝 Extracted {change.fp.name}")
+            except Exception:
+                logging.error(f"❌ Skipped {change.fp.name}\n{traceback.format_exc()}")
+                ledger.failed(doc["id"], doc["source"], traceback.format_exc())
                 continue
+            yield doc, change.entry
 
-            # 🎞️ Extract slide images + caption for PPTX
-            if fp.suffix.lower() == ".pptx":
-                try:
-                    pres = Presentation(fp)
-                    for idx, slide in enumerate(pres.slides):
-                        for shp in slide.shapes:
-                            if shp.shape_type == 13:  # Picture
-                                img = RAW_IMG / f"{doc_id}_{idx}.png"
-                                with open(img, "wb") as f:
-                                    f.write(shp.image.blob)
-                                md += f"\n\n![{caption(img)}]({img})"
-                except Exception:
-                    logging.warning(f"⚠️ Failed to extract images from {fp.name}")
+    with Progress() as bar:
+        task = bar.add_task("📁 Extracting and captioning", total=len(changes))
+        results = ordered_results(extract_file, list(by_fp), workers,
+                                  max_tasks_per_child, timeout=timeout)
+        for fp, res in results:
+            bar.advance(task)
+            change = by_fp[fp]
+            try:
+                mimetype, _ = mimetypes.guess_type(fp)
+                logging.info(f"📄 Processing {fp.name} ({mimetype})")
+                if "error" in res:
+                    logging.error(res["error"])
+                    ledger.failed(change.entry.doc_id, str(fp), res["error"])
+                    continue
+                for w in res["warnings"]:
+                    logging.warning(w)
+
+                # ♻️ Modified source: drop stale outputs before writing new ones
+                if not change.is_new:
+                    remove_outputs(corpus, captions, change.entry.doc_id)
+
+                shas = [captions.add(blob) for _, blob in res["images"]]
+                waiting.append({"change": change, "md": res["md"], "elements": res["elements"],
+                                "images": shas, "slides": [idx for idx, _ in res["images"]]})
+            except Exception:
+                logging.error(f"❌ Skipped {fp.name}\n{traceback.format_exc()}")
+                ledger.failed(change.entry.doc_id, str(fp), traceback.format_exc())
+                continue
+
+            captions.flush()
+            yield from ready()
+
+        captions.flush(force=True)
+        yield from ready()
+    captions.close()
+
+    # 🧹 Drop corpus documents no longer backed by a manifest entry (e.g. legacy uuid ids)
+    if write_clean and record:
+        live = {e.doc_id for e in manifest.entries()}
+        for doc_id in corpus.doc_ids() - live:
+            corpus.delete(doc_id)
+            logging.info(f"🧹 Removed orphaned document {doc_id}")
+
+    corpus.close()
+    manifest.close()
+    ledger.close()
 
-            # 🧾 Save extracted content
-            (CLEAN / f"{doc_id}.json").write_text(json.dumps({
-                "id": doc_id, "title": fp.stem, "body": md, "source": str(fp)
-            }))
-            logging.info(f"📝 Extracted {fp.name}")
+@click.command()
+@click.option("--workers", default=1, show_default=True, envvar="EXTRACT_WORKERS",
+              help="Partitioning processes (1 = in-process)")
+@click.option("--timeout", default=600, show_default=True, envvar="EXTRACT_TIMEOUT",
+              help="Per-file partition timeout in seconds (0 = none)")
+@click.option("--max-tasks-per-child", default=50, show_default=True,
+              envvar="EXTRACT_MAX_TASKS_PER_CHILD",
+              help="Recycle a worker after this many files (0 = never)")
+@click.option("--caption-batch-size", default=16, show_default=True,
+              envvar="CAPTION_BATCH_SIZE", help="Images per BLIP generate call")
+@click.option("--caption-device", envvar="CAPTION_DEVICE",
+              help="Force cuda/mps/cpu (default: auto-detect)")
+@click.option("--caption-dtype", type=click.Choice(["float32", "float16", "bfloat16"]),
+              envvar="CAPTION_DTYPE", help="Model dtype (default: fp16 on GPU, fp32 on CPU)")
+@click.option("--no-captions", is_flag=True, help="Store images but skip captioning")
+def main(workers, timeout, max_tasks_per_child, caption_batch_size,
+         caption_device, caption_dtype, no_captions):
+    for _ in extract_documents(workers, timeout, max_tasks_per_child, caption_batch_size,
+                               caption_device, caption_dtype, not no_captions):
+        pass
 
-        except Exception:
-            logging.error(f"❌ Skipped {fp.name}\n{traceback.format_exc()}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+scripts/http_pool.py
+
+Long-lived httpx clients for the chat → super → agent hops.
+
+Each hop owns one `PooledClient` that is opened in the app's lifespan and kept
+for the life of the process, so requests reuse keep-alive connections instead
+of paying a TCP (and pool) setup per call. Pool limits, HTTP/2 and a Unix
+domain socket transport are configurable from the environment:
+
+    HTTP_MAX_CONNECTIONS   (default 100)
+    HTTP_MAX_KEEPALIVE     (default 20)
+    HTTP_KEEPALIVE_EXPIRY  (seconds, default 30)
+    HTTP2=1                (needs the `h2` package; ignored if missing)
+    <HOP>_UDS=/path.sock   per-client Unix socket, e.g. SUPER_UDS, RCA_UDS
+
+Every request is traced, so `stats()` reports per-hop request counts, how many
+needed a fresh connection, and mean connect vs. total request time. Requests
+also carry the caller's X-Request-ID and are timed as a stage named after the
+downstream service (scripts/tracing.py).
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+from scripts import tracing
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("HTTP2", "0").lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logging.warning("HTTP2=1 but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+class HopStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.new_connections = 0
+        self.connect_s = 0.0
+        self.request_s = 0.0
+
+    def record(self, connect_s: float | None, request_s: float, ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += not ok
+            self.request_s += request_s
+            if connect_s is not None:
+                self.new_connections += 1
+                self.connect_s += connect_s
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = self.requests or 1
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "new_connections": self.new_connections,
+                "reused_connections": self.requests - self.new_connections,
+                "avg_connect_ms": round(self.connect_s / (self.new_connections or 1) * 1000, 2),
+                "avg_request_ms": round(self.request_s / n * 1000, 2),
+            }
+
+
+class _Trace:
+    """httpx trace hook: time spent establishing a connection for one request."""
+
+    def __init__(self):
+        self.connect_started: float | None = None
+        self.connect_s: float | None = None
+
+    async def __call__(self, event: str, info: dict) -> None:
+        if event.startswith("connection.connect_") and event.endswith(".started"):
+            self.connect_started = time.perf_counter()
+        elif self.connect_started is not None and event.endswith(".complete") and (
+                event.startswith("connection.connect_") or event == "connection.start_tls.complete"):
+            # connect_tcp / connect_unix_socket plus start_tls all count as setup
+            self.connect_s = time.perf_counter() - self.connect_started
+
+
+class PooledClient:
+    """A named, lifespan-scoped `httpx.AsyncClient` with per-hop timing."""
+
+    def __init__(self, name: str, timeout: float | None, uds_env: str | None = None):
+        self.name = name
+        self.timeout = timeout
+        self.uds_env = uds_env
+        self.stats = HopStats()
+        # "chat→super" is reported as stage "super" in Server-Timing / metrics
+        self.stage = name.split("→")[-1]
+        self._client: httpx.AsyncClient | None = None
+
+    def _build(self) -> httpx.AsyncClient:
+        uds = os.getenv(self.uds_env) if self.uds_env else None
+        http2 = _http2_enabled()
+        limits = _limits()
+        transport = httpx.AsyncHTTPTransport(uds=uds, http2=http2, limits=limits) if uds else None
+        logging.info(f"🔌 {self.name}: pooled client (http2={http2}, uds={uds or '-'})")
+        return httpx.AsyncClient(timeout=self.timeout, limits=limits, http2=http2,
+                                 transport=transport)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Outside a lifespan (scripts, tests) the client is created on first use
+        if self._client is None or self._client.is_closed:
+            self._client = self._build()
+        return self._client
+
+    async def start(self) -> None:
+        _ = self.client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        trace = _Trace()
+        headers = {**tracing.outgoing_headers(), **(kwargs.pop("headers", None) or {})}
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            res = await self.client.request(method, url, headers=headers,
+                                            extensions={"trace": trace}, **kwargs)
+            ok = res.status_code < 500
+            tracing.merge_downstream(self.stage, res.headers.get("server-timing"))
+            return res
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.stats.record(trace.connect_s, elapsed, ok)
+            tracing.record(self.stage, elapsed)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        trace = _Trace()
+        headers = {**tracing.outgoing_headers(), **(kwargs.pop("headers", None) or {})}
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            async with self.client.stream(method, url, headers=headers,
+                                          extensions={"trace": trace}, **kwargs) as res:
+                ok = res.status_code < 500
+                yield res
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.stats.record(trace.connect_s, elapsed, ok)
+            tracing.record(self.stage, elapsed)
+
+
+def lifespan(*clients: PooledClient):
+    """FastAPI lifespan that opens `clients` at startup and closes them at shutdown."""
+    @asynccontextmanager
+    async def _lifespan(app):
+        for c in clients:
+            await c.start()
+        try:
+            yield
+        finally:
+            for c in clients:
+                await c.aclose()
+    return _lifespan
+
+
+def stats(*clients: PooledClient) -> dict:
+    return {c.name: c.stats.snapshot() for c in clients}
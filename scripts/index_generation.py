@@ -0,0 +1,51 @@
+"""
+scripts/index_generation.py
+
+A monotonically changing marker for the `knowledge_base` collection.
+
+Ingestion calls `bump()` after every write or delete; serving processes call
+`Watcher.changed()` (a throttled stat) to learn that cached retrieval results
+may be stale. Kept free of heavy imports so agents can use it on the hot path.
+"""
+
+import os
+import time
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent.parent
+GENERATION_FILE = BASE / "state" / "index_generation"
+
+
+def bump(path: Path = GENERATION_FILE) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(str(time.time_ns()))
+    os.replace(tmp, path)
+
+
+def read(path: Path = GENERATION_FILE) -> str:
+    try:
+        return path.read_text()
+    except FileNotFoundError:
+        return ""
+
+
+class Watcher:
+    """Report whether the generation moved, checking the file at most every `interval` s."""
+
+    def __init__(self, interval: float = 1.0, path: Path = GENERATION_FILE):
+        self.interval = interval
+        self.path = path
+        self.current = read(path)
+        self._next_check = 0.0
+
+    def changed(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.interval
+        gen = read(self.path)
+        if gen != self.current:
+            self.current = gen
+            return True
+        return False
@@ -0,0 +1,184 @@
+"""
+scripts/ledger.py
+
+Ingestion progress ledger.
+
+Every stage writes a tiny per-source row (stage, expected chunks, embedded
+chunks, last error) to state/ingest.sqlite3. SQLite triggers keep per-stage
+totals up to date, and the embedding stage appends throughput samples, so
+`check_embedding_progress.py` answers from a handful of rows instead of
+re-reading and re-splitting the corpus.
+
+Stages: queued → extracted → chunked → embedded, or failed.
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+
+from manifest import DB_PATH
+
+STAGES = ("queued", "extracted", "chunked", "embedded", "failed")
+SAMPLE_KEEP_S = 6 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    doc_id     TEXT PRIMARY KEY,
+    source     TEXT NOT NULL,
+    stage      TEXT NOT NULL,
+    expected   INTEGER NOT NULL DEFAULT 0,
+    embedded   INTEGER NOT NULL DEFAULT 0,
+    error      TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ledger_totals (
+    stage    TEXT PRIMARY KEY,
+    docs     INTEGER NOT NULL DEFAULT 0,
+    expected INTEGER NOT NULL DEFAULT 0,
+    embedded INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS ledger_samples (
+    ts       REAL PRIMARY KEY,
+    embedded INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS ledger_ins AFTER INSERT ON ledger BEGIN
+    INSERT OR IGNORE INTO ledger_totals (stage) VALUES (NEW.stage);
+    UPDATE ledger_totals SET docs = docs + 1, expected = expected + NEW.expected,
+        embedded = embedded + NEW.embedded WHERE stage = NEW.stage;
+END;
+CREATE TRIGGER IF NOT EXISTS ledger_del AFTER DELETE ON ledger BEGIN
+    UPDATE ledger_totals SET docs = docs - 1, expected = expected - OLD.expected,
+        embedded = embedded - OLD.embedded WHERE stage = OLD.stage;
+END;
+CREATE TRIGGER IF NOT EXISTS ledger_upd AFTER UPDATE ON ledger BEGIN
+    UPDATE ledger_totals SET docs = docs - 1, expected = expected - OLD.expected,
+        embedded = embedded - OLD.embedded WHERE stage = OLD.stage;
+    INSERT OR IGNORE INTO ledger_totals (stage) VALUES (NEW.stage);
+    UPDATE ledger_totals SET docs = docs + 1, expected = expected + NEW.expected,
+        embedded = embedded + NEW.embedded WHERE stage = NEW.stage;
+END;
+"""
+
+
+class Ledger:
+    def __init__(self, db_path: Path = DB_PATH):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path), timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+    # ---- writers -------------------------------------------------------------
+
+    def _set(self, doc_id: str, source: str, stage: str, expected: int | None = None,
+             embedded: int | None = None, error: str | None = None) -> None:
+        self.db.execute(
+            """
+            INSERT INTO ledger (doc_id, source, stage, expected, embedded, error, updated_at)
+            VALUES (?, ?, ?, COALESCE(?, 0), COALESCE(?, 0), ?, ?)
+            ON CONFLICT(doc_id) DO UPDATE SET
+                source = excluded.source, stage = excluded.stage,
+                expected = COALESCE(?, expected), embedded = COALESCE(?, embedded),
+                error = excluded.error, updated_at = excluded.updated_at
+            """,
+            (doc_id, source, stage, expected, embedded, error, time.time(), expected, embedded),
+        )
+
+    def queued(self, items: list[tuple[str, str]]) -> None:
+        with self.db:
+            for doc_id, source in items:
+                self._set(doc_id, source, "queued", 0, 0)
+
+    def extracted(self, doc_id: str, source: str) -> None:
+        with self.db:
+            self._set(doc_id, source, "extracted")
+
+    def chunked(self, doc_id: str, source: str, expected: int) -> None:
+        with self.db:
+            self._set(doc_id, source, "chunked", expected, 0)
+
+    def add_embedded(self, counts: dict[str, int]) -> None:
+        with self.db:
+            self.db.executemany(
+                "UPDATE ledger SET embedded = MIN(expected, embedded + ?), updated_at = ? "
+                "WHERE doc_id = ?",
+                [(n, time.time(), doc_id) for doc_id, n in counts.items()],
+            )
+
+    def embedded(self, doc_id: str, source: str, expected: int) -> None:
+        with self.db:
+            self._set(doc_id, source, "embedded", expected, expected)
+
+    def complete(self, doc_ids: list[str]) -> None:
+        """Mark already-chunked sources as fully embedded."""
+        with self.db:
+            self.db.executemany(
+                "UPDATE ledger SET stage = 'embedded', embedded = expected, error = NULL, "
+                "updated_at = ? WHERE doc_id = ?",
+                [(time.time(), d) for d in doc_ids],
+            )
+
+    def failed_many(self, doc_ids: list[str], error: str) -> None:
+        with self.db:
+            self.db.executemany(
+                "UPDATE ledger SET stage = 'failed', error = ?, updated_at = ? WHERE doc_id = ?",
+                [(error[:500], time.time(), d) for d in doc_ids],
+            )
+
+    def failed(self, doc_id: str, source: str, error: str) -> None:
+        with self.db:
+            last = (error.strip().splitlines() or ["unknown error"])[-1]
+            self._set(doc_id, source, "failed", error=last[:500])
+
+    def forget(self, doc_id: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM ledger WHERE doc_id = ?", (doc_id,))
+
+    def sample(self) -> None:
+        """Record the current embedded total for throughput / ETA."""
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO ledger_samples (ts, embedded) "
+                "SELECT ?, COALESCE(SUM(embedded), 0) FROM ledger_totals", (now,)
+            )
+            self.db.execute("DELETE FROM ledger_samples WHERE ts < ?", (now - SAMPLE_KEEP_S,))
+
+    # ---- readers -------------------------------------------------------------
+
+    def totals(self) -> dict[str, dict]:
+        rows = self.db.execute("SELECT stage, docs, expected, embedded FROM ledger_totals")
+        out = {s: {"docs": 0, "expected": 0, "embedded": 0} for s in STAGES}
+        for stage, docs, expected, embedded in rows:
+            out[stage] = {"docs": docs, "expected": expected, "embedded": embedded}
+        return out
+
+    def rate(self, window_s: float = 120.0) -> float:
+        """Embedded chunks per second over the last `window_s` seconds of samples."""
+        last = self.db.execute(
+            "SELECT ts, embedded FROM ledger_samples ORDER BY ts DESC LIMIT 1"
+        ).fetchone()
+        if not last:
+            return 0.0
+        first = self.db.execute(
+            "SELECT ts, embedded FROM ledger_samples WHERE ts >= ? ORDER BY ts LIMIT 1",
+            (last[0] - window_s,),
+        ).fetchone()
+        dt = last[0] - first[0]
+        # Re-queued sources reset their embedded count, so never report < 0
+        return max(0.0, (last[1] - first[1]) / dt) if dt > 0 else 0.0
+
+    def last_sample_ts(self) -> float | None:
+        row = self.db.execute("SELECT MAX(ts) FROM ledger_samples").fetchone()
+        return row[0]
+
+    def failures(self, limit: int = 20) -> list[tuple[str, str]]:
+        rows = self.db.execute(
+            "SELECT source, error FROM ledger WHERE stage = 'failed' "
+            "ORDER BY updated_at DESC LIMIT ?", (limit,)
+        )
+        return list(rows)
@@ -0,0 +1,411 @@
+"""
+scripts/lexical_index.py
+
+Persistent BM25 inverted index over the same chunks as `knowledge_base`.
+
+Dense retrieval often misses exact identifiers (error codes, hostnames, KB
+numbers); this index catches them. It is written by embed.py next to the
+vectors and read by the agents for hybrid retrieval.
+
+On-disk layout (lexical_index/ by default, LEXICAL_DIR to override) is a set of
+immutable segments plus two small JSON files:
+
+    segments.json        live segment numbers and the next one to assign
+    tombstones.json      chunk_id → segment number; rows with that id in any
+                         older segment are dead (deleted or superseded)
+    seg_000042/
+        terms.npy        uint64 term hashes, sorted
+        offsets.npy      int64 postings offsets, one per term (+1)
+        docs.npy         uint32 row numbers, per term
+        tfs.npy          uint16 term frequencies, per term
+        lens.npy         uint32 tokens per row
+        text.bin         UTF-8 chunk texts back to back
+        text_off.npy     int64 offsets into text.bin (+1)
+        rows.json        [chunk_id, metadata] per row
+
+Every array is opened with `np.load(mmap_mode="r")`, so readers page in only
+the postings a query touches. Updates are incremental: new chunks are buffered
+into a new segment, deletes only append tombstones, and `merge()` (run
+automatically past LEXICAL_MAX_SEGMENTS, and by compact.py) rewrites the live
+rows into a single segment.
+
+One process writes at a time: a writer holds an exclusive flock on LOCK from
+its first `add` / `delete` / `merge` (or `acquire()`) until `close()`, and
+reloads the on-disk state when it gets the lock, so a concurrent embed run and
+compact.py cannot interleave flushes, tombstones and merges. Readers do not
+lock. BM25 statistics (row count, document frequencies, average length) count
+live rows only. Kept free of sibling imports so both the scripts
+and the agents can use it.
+"""
+
+import hashlib
+import json
+import logging
+import fcntl
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent.parent
+LEXICAL_DIR = Path(os.getenv("LEXICAL_DIR", str(BASE / "lexical_index")))
+
+K1 = 1.2
+B = 0.75
+
+# Identifier-friendly tokens: "ERR-504", "db01.prod", "KB0012345" stay whole and
+# are also indexed by their parts
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._:/\-][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    out = []
+    for tok in _TOKEN.findall(text.lower()):
+        out.append(tok)
+        parts = _PART.findall(tok)
+        if len(parts) > 1:
+            out.extend(parts)
+    return out
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+
+
+def _write_json(path: Path, obj) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(obj))
+    os.replace(tmp, path)
+
+
+class Segment:
+    """One immutable, memory-mapped segment."""
+
+    def __init__(self, path: Path, seq: int):
+        self.path = path
+        self.seq = seq
+        load = lambda name: np.load(path / name, mmap_mode="r")  # noqa: E731
+        self.terms = load("terms.npy")
+        self.offsets = load("offsets.npy")
+        self.docs = load("docs.npy")
+        self.tfs = load("tfs.npy")
+        self.lens = load("lens.npy")
+        self.text_off = load("text_off.npy")
+        size = (path / "text.bin").stat().st_size
+        self.text = np.memmap(path / "text.bin", dtype=np.uint8, mode="r") if size else b""
+        self.rows = json.loads((path / "rows.json").read_text())
+        self.dead = np.zeros(len(self.rows), dtype=bool)
+        self.n_dead = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def apply_tombstones(self, tombstones: dict[str, int]) -> None:
+        self.dead = np.fromiter((tombstones.get(cid, -1) > self.seq for cid, _ in self.rows),
+                                dtype=bool, count=len(self.rows))
+        self.n_dead = int(self.dead.sum())
+
+    def live_count(self, docs) -> int:
+        """How many of the row numbers `docs` are not tombstoned."""
+        if not self.n_dead:
+            return len(docs)
+        return int(np.count_nonzero(~self.dead[np.asarray(docs, dtype=np.int64)]))
+
+    def postings(self, h: int):
+        # Compare as uint64: a plain int would be promoted to float64 and lose bits
+        i = int(np.searchsorted(self.terms, np.uint64(h)))
+        if i == len(self.terms) or int(self.terms[i]) != h:
+            return None
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.docs[lo:hi], self.tfs[lo:hi]
+
+    def text_of(self, row: int) -> str:
+        lo, hi = int(self.text_off[row]), int(self.text_off[row + 1])
+        return bytes(self.text[lo:hi]).decode("utf-8")
+
+    @staticmethod
+    def build(path: Path, rows: list[tuple[str, str, dict]]) -> None:
+        """Write `rows` (chunk_id, text, metadata) as a segment at `path`."""
+        postings = defaultdict(list)
+        lens = np.zeros(len(rows), dtype=np.uint32)
+        text_off = np.zeros(len(rows) + 1, dtype=np.int64)
+        blobs = []
+        for i, (_, text, _) in enumerate(rows):
+            counts = Counter(tokenize(text))
+            lens[i] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term_hash(term)].append((i, min(tf, 65535)))
+            blob = text.encode("utf-8")
+            blobs.append(blob)
+            text_off[i + 1] = text_off[i] + len(blob)
+
+        terms = np.array(sorted(postings), dtype=np.uint64)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        docs, tfs = [], []
+        for j, h in enumerate(terms):
+            plist = postings[int(h)]
+            offsets[j + 1] = offsets[j] + len(plist)
+            docs.extend(p[0] for p in plist)
+            tfs.extend(p[1] for p in plist)
+
+        tmp = path.with_name(f".{path.name}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "terms.npy", terms)
+        np.save(tmp / "offsets.npy", offsets)
+        np.save(tmp / "docs.npy", np.array(docs, dtype=np.uint32))
+        np.save(tmp / "tfs.npy", np.array(tfs, dtype=np.uint16))
+        np.save(tmp / "lens.npy", lens)
+        np.save(tmp / "text_off.npy", text_off)
+        (tmp / "text.bin").write_bytes(b"".join(blobs))
+        (tmp / "rows.json").write_text(json.dumps([[cid, meta] for cid, _, meta in rows]))
+        os.replace(tmp, path)
+
+
+class LexicalIndex:
+    """Segmented BM25 index: buffered incremental writes, mmap'd reads.
+
+    Writers (embed.py, compact.py) call `add` / `delete` and `close`; readers
+    call `search`, which reloads when the segment list on disk changes.
+    """
+
+    def __init__(self, root: Path = LEXICAL_DIR, segment_size: int | None = None,
+                 max_segments: int | None = None, flush_interval: float | None = None):
+        self.root = root
+        self.segment_size = segment_size or int(os.getenv("LEXICAL_SEGMENT_SIZE", "50000"))
+        self.max_segments = max_segments or int(os.getenv("LEXICAL_MAX_SEGMENTS", "8"))
+        self.flush_interval = flush_interval or float(os.getenv("LEXICAL_FLUSH_S", "30"))
+        self._lock = threading.Lock()
+        self._pending: dict[str, tuple[str, str, dict]] = {}
+        self._pending_since = 0.0
+        self._dirty = False
+        self._known: set[str] | None = None
+        self._loaded_mtime = None
+        self._writer_fd: int | None = None
+        self._load()
+
+    # ---- state -----------------------------------------------------------------
+
+    def _manifest_mtime(self):
+        try:
+            return (self.root / "segments.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> None:
+        mtime = self._manifest_mtime()
+        try:
+            manifest = json.loads((self.root / "segments.json").read_text())
+            tombstones = json.loads((self.root / "tombstones.json").read_text())
+        except FileNotFoundError:
+            manifest, tombstones = {"segments": [], "next": 0}, {}
+        segments = [Segment(self.root / f"seg_{seq:06d}", seq) for seq in manifest["segments"]]
+        for seg in segments:
+            seg.apply_tombstones(tombstones)
+        self.segments = segments
+        self.next_seq = manifest["next"]
+        self.tombstones = tombstones
+        self._known = None
+        self._loaded_mtime = mtime
+        self._stats()
+
+    def _stats(self) -> None:
+        self.n_rows = sum(len(s) for s in self.segments)
+        self.n_live = self.n_rows - sum(s.n_dead for s in self.segments)
+        total_len = sum(int(s.lens[~s.dead].sum()) for s in self.segments if len(s))
+        self.avgdl = (total_len / self.n_live if self.n_live else 0.0) or 1.0
+
+    def reload_if_changed(self) -> bool:
+        if self._manifest_mtime() == self._loaded_mtime:
+            return False
+        with self._lock:
+            try:
+                self._load()
+            except (OSError, ValueError):
+                # A merge may have removed a segment between reading the
+                # manifest and opening it; keep serving the old view
+                logging.warning("Lexical index changed while loading; retrying later")
+                return False
+        return True
+
+    def _save(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_json(self.root / "tombstones.json", self.tombstones)
+        _write_json(self.root / "segments.json",
+                    {"segments": [s.seq for s in self.segments], "next": self.next_seq})
+        self._loaded_mtime = self._manifest_mtime()
+
+    # ---- writers ---------------------------------------------------------------
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the writer lock (held until close()); False if busy and not blocking."""
+        if self._writer_fd is not None:
+            return True
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.root / "LOCK", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not blocking:
+                os.close(fd)
+                return False
+            logging.info(f"⏳ Waiting for the lexical index writer lock in {self.root}")
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        self._writer_fd = fd
+        # Another writer may have flushed or merged since we loaded
+        with self._lock:
+            if self._manifest_mtime() != self._loaded_mtime:
+                self._load()
+        return True
+
+    def release(self) -> None:
+        if self._writer_fd is not None:
+            fcntl.flock(self._writer_fd, fcntl.LOCK_UN)
+            os.close(self._writer_fd)
+            self._writer_fd = None
+
+    def doc_ids(self) -> set[str]:
+        """Sources with at least one live row (or buffered chunk)."""
+        live = {cid.split(":", 1)[0] for cid in self._pending}
+        for seg in self.segments:
+            live.update(cid.split(":", 1)[0]
+                        for (cid, _), dead in zip(seg.rows, seg.dead) if not dead)
+        return live
+
+    def _indexed(self, cid: str) -> bool:
+        if self._known is None:
+            self._known = {c for seg in self.segments for c, _ in seg.rows}
+        return cid in self._known
+
+    def add(self, chunks: list[tuple[str, str, dict]]) -> None:
+        """Buffer (chunk_id, text, metadata) rows; they supersede older copies."""
+        self.acquire()
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        for cid, text, meta in chunks:
+            self._pending[cid] = (cid, text, meta)
+            if self._indexed(cid):
+                self.tombstones[cid] = self.next_seq
+        self._dirty = True
+        if (len(self._pending) >= self.segment_size
+                or time.monotonic() - self._pending_since >= self.flush_interval):
+            self.flush()
+
+    def delete(self, ids) -> None:
+        self.acquire()
+        for cid in ids:
+            if self._pending.pop(cid, None) is not None or self._indexed(cid):
+                self.tombstones[cid] = self.next_seq
+                self._dirty = True
+
+    def flush(self) -> bool:
+        """Write buffered rows as a new segment and persist tombstones.
+
+        Returns True if anything changed on disk.
+        """
+        if not self._dirty:
+            return False
+        if self._pending:
+            seq = self.next_seq
+            Segment.build(self.root / f"seg_{seq:06d}", list(self._pending.values()))
+            self.segments.append(Segment(self.root / f"seg_{seq:06d}", seq))
+            if self._known is not None:
+                self._known.update(self._pending)
+            self.next_seq += 1
+            self._pending.clear()
+        for seg in self.segments:
+            seg.apply_tombstones(self.tombstones)
+        self._save()
+        self._dirty = False
+        self._stats()
+        if len(self.segments) > self.max_segments:
+            self.merge()
+        return True
+
+    def merge(self) -> int:
+        """Rewrite all live rows into one segment and drop tombstones. Returns rows kept."""
+        self.acquire()
+        self.flush()
+        if len(self.segments) <= 1 and not self.tombstones:
+            return self.n_rows
+        rows = []
+        for seg in self.segments:
+            for i, (cid, meta) in enumerate(seg.rows):
+                if not seg.dead[i]:
+                    rows.append((cid, seg.text_of(i), meta))
+        old = self.segments
+        seq = self.next_seq
+        self.next_seq += 1
+        if rows:
+            Segment.build(self.root / f"seg_{seq:06d}", rows)
+            self.segments = [Segment(self.root / f"seg_{seq:06d}", seq)]
+        else:
+            self.segments = []
+        self.tombstones = {}
+        self._known = None
+        self._save()
+        self._stats()
+        for seg in old:
+            shutil.rmtree(seg.path, ignore_errors=True)
+        logging.info(f"🗜️ Lexical index merged {len(old)} segments → {len(rows)} live rows")
+        return len(rows)
+
+    def close(self) -> None:
+        self.flush()
+        self.release()
+
+    # ---- readers ---------------------------------------------------------------
+
+    def search(self, query: str, k: int = 8) -> list[tuple[str, float, str, dict]]:
+        """Top-k BM25 rows as (chunk_id, score, text, metadata)."""
+        self.reload_if_changed()
+        with self._lock:
+            segments, n, avgdl = self.segments, self.n_live, self.avgdl
+        terms = {term_hash(t) for t in tokenize(query)}
+        if not n or not terms:
+            return []
+
+        per_seg = []
+        df = Counter()
+        for seg in segments:
+            hits = {h: p for h in terms if (p := seg.postings(h)) is not None}
+            for h, (docs, _) in hits.items():
+                df[h] += seg.live_count(docs)
+            per_seg.append(hits)
+
+        candidates = []
+        for seg, hits in zip(segments, per_seg):
+            if not hits:
+                continue
+            scores = np.zeros(len(seg), dtype=np.float32)
+            for h, (docs, tfs) in hits.items():
+                idf = math.log(1 + (n - df[h] + 0.5) / (df[h] + 0.5))
+                tf = np.asarray(tfs, dtype=np.float32)
+                docs = np.asarray(docs, dtype=np.int64)
+                dl = np.asarray(seg.lens[docs], dtype=np.float32)
+                scores[docs] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+            scores[seg.dead] = 0
+            top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+            candidates.extend((float(scores[i]), seg, int(i)) for i in top if scores[i] > 0)
+
+        candidates.sort(key=lambda c: -c[0])
+        out = []
+        for score, seg, i in candidates[:k]:
+            cid, meta = seg.rows[i]
+            out.append((cid, score, seg.text_of(i), meta))
+        return out
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self.segments),
+            "rows": self.n_rows,
+            "dead_rows": int(sum(s.dead.sum() for s in self.segments)),
+            "avg_len": round(self.avgdl, 1),
+        }
@@ -0,0 +1,58 @@
+"""
+scripts/locks.py
+
+Inter-process writer lock for the on-disk stores (corpus.py, chunk_store.py).
+
+Each store allows one writing process at a time; its writer holds an
+exclusive `flock` on the store's LOCK file for as long as it may append, and
+maintenance (compaction, crash recovery) takes the same lock. The kernel
+drops it when the process exits, so a crashed writer never leaves it stale.
+Readers do not lock.
+"""
+
+import fcntl
+import logging
+import os
+from pathlib import Path
+
+
+class LockHeld(RuntimeError):
+    """Another process holds the store's writer lock."""
+
+
+class WriterLock:
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock (no-op if this object holds it); False if busy and not blocking."""
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not blocking:
+                os.close(fd)
+                return False
+            logging.info(f"⏳ Waiting for the writer lock on {self.path.parent}")
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        self._fd = fd
+        return True
+
+    def require(self) -> None:
+        """Take the lock without waiting, or raise LockHeld."""
+        if not self.acquire(blocking=False):
+            raise LockHeld(f"{self.path.parent} is being written by another process")
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,144 @@
+"""
+scripts/manifest.py
+
+Persistent ingestion manifest for the extraction stage.
+
+Each source file under raw/ is tracked by its relative path together with its
+size, mtime and content hash. The manifest hands out a stable doc_id per source
+so re-running extraction only touches files that actually changed, and lets the
+caller clean up outputs of sources that disappeared from raw/.
+"""
+
+import hashlib
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+BASE      = Path(__file__).resolve().parent.parent
+STATE_DIR = BASE / "state"
+DB_PATH   = STATE_DIR / "ingest.sqlite3"
+
+HASH_BLOCK = 1 << 20
+
+
+def file_hash(fp: Path) -> str:
+    """Return the sha256 hex digest of a file, read in 1 MiB blocks."""
+    h = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def doc_id_for(rel_path: str) -> str:
+    """Stable doc_id for a source: derived from its path, not its content."""
+    return hashlib.sha1(rel_path.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Entry:
+    path: str
+    doc_id: str
+    size: int
+    mtime: float
+    sha256: str
+
+
+@dataclass
+class Change:
+    """A source that needs (re-)extraction."""
+    fp: Path
+    entry: Entry
+    is_new: bool
+
+
+class Manifest:
+    """SQLite-backed map of raw/ relative path → Entry."""
+
+    def __init__(self, root: Path, db_path: Path = DB_PATH):
+        self.root = root
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                path       TEXT PRIMARY KEY,
+                doc_id     TEXT NOT NULL UNIQUE,
+                size       INTEGER NOT NULL,
+                mtime      REAL NOT NULL,
+                sha256     TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def rel(self, fp: Path) -> str:
+        return fp.resolve().relative_to(self.root.resolve()).as_posix()
+
+    def get(self, rel_path: str) -> Entry | None:
+        row = self.db.execute(
+            "SELECT path, doc_id, size, mtime, sha256 FROM sources WHERE path = ?",
+            (rel_path,),
+        ).fetchone()
+        return Entry(*row) if row else None
+
+    def entries(self) -> list[Entry]:
+        rows = self.db.execute("SELECT path, doc_id, size, mtime, sha256 FROM sources")
+        return [Entry(*r) for r in rows]
+
+    def diff(self, files: list[Path]) -> tuple[list[Change], list[Entry], int]:
+        """Compare files on disk against the manifest.
+
+        Returns (changes, deleted, unchanged_count). Files whose size and mtime
+        match are trusted without hashing; otherwise the content hash decides,
+        so a touched-but-identical file only has its stat refreshed.
+        """
+        changes: list[Change] = []
+        unchanged = 0
+        seen: set[str] = set()
+
+        for fp in files:
+            rel = self.rel(fp)
+            seen.add(rel)
+            st = fp.stat()
+            old = self.get(rel)
+            if old and old.size == st.st_size and old.mtime == st.st_mtime:
+                unchanged += 1
+                continue
+
+            digest = file_hash(fp)
+            if old and old.sha256 == digest:
+                self._touch(rel, st.st_size, st.st_mtime)
+                unchanged += 1
+                continue
+
+            entry = Entry(rel, old.doc_id if old else doc_id_for(rel),
+                          st.st_size, st.st_mtime, digest)
+            changes.append(Change(fp, entry, is_new=old is None))
+
+        deleted = [e for e in self.entries() if e.path not in seen]
+        return changes, deleted, unchanged
+
+    def record(self, entry: Entry) -> None:
+        """Mark a source as successfully extracted."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO sources (path, doc_id, size, mtime, sha256, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (entry.path, entry.doc_id, entry.size, entry.mtime, entry.sha256, time.time()),
+        )
+        self.db.commit()
+
+    def forget(self, entry: Entry) -> None:
+        self.db.execute("DELETE FROM sources WHERE path = ?", (entry.path,))
+        self.db.commit()
+
+    def _touch(self, rel_path: str, size: int, mtime: float) -> None:
+        self.db.execute(
+            "UPDATE sources SET size = ?, mtime = ?, updated_at = ? WHERE path = ?",
+            (size, mtime, time.time(), rel_path),
+        )
+        self.db.commit()
@@ -0,0 +1,279 @@
+"""
+scripts/numpy_index.py
+
+Read-only, memory-mapped snapshot of the `knowledge_base` vectors for serving.
+
+export_vectors.py writes the snapshot; the agents search it through
+`scripts/agents/numpy_store.py` when VECTOR_BACKEND=numpy. Layout
+(vector_export/ by default, VECTOR_EXPORT_DIR to override):
+
+    info.json        model, dim, count, dtype, exported_at
+    vectors.npy      N×D float32, or int8 when quantized
+    scales.npy       per-row float32 scale (int8 only): v ≈ q * scale
+    rows.bin         JSON [chunk_id, metadata] per row, back to back
+    rows_off.npy     int64 offsets into rows.bin (+1)
+    text.bin         UTF-8 chunk texts back to back
+    text_off.npy     int64 offsets into text.bin (+1)
+
+Arrays and blobs are opened with `mmap_mode="r"`, so every agent process on a
+host shares the same physical pages through the OS page cache; a row's id and
+metadata are decoded only when it is returned or filtered on.
+
+Each export is written to its own directory under .vector_export.versions/
+and published by atomically replacing the vector_export symlink, so a reader
+resolves the link once and loads every file from one snapshot; it also
+checks that the files agree on the row count. Scoring is a dot
+product (vectors are normalized) done in row blocks, batched over queries,
+with `argpartition` for top-k. Kept free of sibling imports so both the
+scripts and the agents can use it.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent.parent
+EXPORT_DIR = Path(os.getenv("VECTOR_EXPORT_DIR", str(BASE / "vector_export")))
+BLOCK_ROWS = 65536
+KEEP_VERSIONS = 2  # the live snapshot and the one before it, for readers still loading it
+
+
+def _blob(path: Path):
+    return np.memmap(path, dtype=np.uint8, mode="r") if path.stat().st_size else b""
+
+
+class _Rows:
+    """[chunk_id, metadata] per row, decoded on access from the mmap'd rows.bin."""
+
+    def __init__(self, blob, offsets):
+        self.blob, self.offsets = blob, offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row) -> list:
+        lo, hi = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(bytes(self.blob[lo:hi]))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class ExportWriter:
+    """Stream rows into a new snapshot directory, then publish it with one symlink swap."""
+
+    def __init__(self, root: Path, count: int, dim: int, model: str, quantize: bool = False):
+        self.root = root
+        self.versions = root.with_name(f".{root.name}.versions")
+        self.version = self.versions / str(time.time_ns())
+        self.tmp = self.version.with_name(f"{self.version.name}.tmp")
+        for stale in self.versions.glob("*.tmp"):  # left by an interrupted export
+            shutil.rmtree(stale, ignore_errors=True)
+        self.tmp.mkdir(parents=True)
+        self.count, self.dim, self.model, self.quantize = count, dim, model, quantize
+        self.vectors = np.lib.format.open_memmap(
+            self.tmp / "vectors.npy", mode="w+", dtype=np.int8 if quantize else np.float32,
+            shape=(count, dim))
+        self.scales = np.ones(count, dtype=np.float32)
+        self.text_off = np.zeros(count + 1, dtype=np.int64)
+        self.text = (self.tmp / "text.bin").open("wb")
+        self.rows = (self.tmp / "rows.bin").open("wb")
+        self.rows_off = np.zeros(count + 1, dtype=np.int64)
+        self.n = 0
+
+    def add(self, ids, vectors, texts, metas) -> None:
+        i = self.n
+        # Rows added to the collection after count() was taken wait for the next export
+        n = min(len(ids), self.count - i)
+        ids, texts, metas = ids[:n], texts[:n], metas[:n]
+        vecs = np.asarray(vectors[:n], dtype=np.float32)
+        if not n:
+            return
+        if self.quantize:
+            scale = np.abs(vecs).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            self.vectors[i:i + n] = np.round(vecs / scale[:, None]).astype(np.int8)
+            self.scales[i:i + n] = scale
+        else:
+            self.vectors[i:i + n] = vecs
+        for j, (cid, text, meta) in enumerate(zip(ids, texts, metas)):
+            blob = (text or "").encode("utf-8")
+            self.text.write(blob)
+            self.text_off[i + j + 1] = self.text_off[i + j] + len(blob)
+            row = json.dumps([cid, meta or {}]).encode("utf-8")
+            self.rows.write(row)
+            self.rows_off[i + j + 1] = self.rows_off[i + j] + len(row)
+        self.n += n
+
+    def commit(self) -> int:
+        n = self.n
+        self.text.close()
+        self.rows.close()
+        self.vectors.flush()
+        del self.vectors
+        if n != self.count:
+            # The collection changed while paging; trim to what was read
+            full = np.load(self.tmp / "vectors.npy", mmap_mode="r")
+            np.save(self.tmp / "vectors.trim.npy", full[:n])
+            del full
+            os.replace(self.tmp / "vectors.trim.npy", self.tmp / "vectors.npy")
+        if self.quantize:
+            np.save(self.tmp / "scales.npy", self.scales[:n])
+        np.save(self.tmp / "text_off.npy", self.text_off[:n + 1])
+        np.save(self.tmp / "rows_off.npy", self.rows_off[:n + 1])
+        (self.tmp / "info.json").write_text(json.dumps({
+            "model": self.model, "dim": self.dim, "count": n,
+            "dtype": "int8" if self.quantize else "float32", "exported_at": time.time(),
+        }))
+        os.replace(self.tmp, self.version)
+        if self.root.exists() and not self.root.is_symlink():
+            # Snapshot from before versioned exports: becomes an old version
+            os.replace(self.root, self.versions / "0")
+        link = self.root.with_name(f".{self.root.name}.link")
+        link.unlink(missing_ok=True)
+        link.symlink_to(self.version.relative_to(self.root.parent))
+        os.replace(link, self.root)
+        live = sorted((p for p in self.versions.iterdir() if p.name.isdigit()),
+                      key=lambda p: int(p.name))
+        for old in live[:-KEEP_VERSIONS]:
+            shutil.rmtree(old, ignore_errors=True)
+        return n
+
+
+class NumpyIndex:
+    """Memory-mapped top-k over an exported snapshot; reloads when it is replaced."""
+
+    def __init__(self, root: Path = EXPORT_DIR, check_interval: float = 1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._masks: OrderedDict = OrderedDict()
+        self._next_check = 0.0
+        self._loaded = None
+        self._load()
+
+    def _version(self):
+        """(snapshot directory, info.json mtime) the export currently points to."""
+        path = Path(os.path.realpath(self.root))
+        try:
+            return path, (path / "info.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> None:
+        version = self._version()
+        if version is None:
+            raise FileNotFoundError(
+                f"No vector export at {self.root}; run scripts/export_vectors.py first")
+        d = version[0]
+        info = json.loads((d / "info.json").read_text())
+        vectors = np.load(d / "vectors.npy", mmap_mode="r")
+        scales = np.load(d / "scales.npy", mmap_mode="r") if info["dtype"] == "int8" else None
+        text_off = np.load(d / "text_off.npy", mmap_mode="r")
+        text = _blob(d / "text.bin")
+        if (d / "rows_off.npy").exists():
+            rows = _Rows(_blob(d / "rows.bin"), np.load(d / "rows_off.npy", mmap_mode="r"))
+        else:  # exported before rows.bin
+            rows = json.loads((d / "rows.json").read_text())
+        n = info["count"]
+        if not (n == vectors.shape[0] == len(rows) == len(text_off) - 1
+                and (scales is None or len(scales) == n)):
+            raise ValueError(f"Inconsistent vector export at {d}")
+        self.info, self.vectors, self.scales = info, vectors, scales
+        self.text_off, self.text, self.rows = text_off, text, rows
+        self._masks.clear()
+        self._loaded = version
+
+    def reload_if_changed(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        if self._version() in (None, self._loaded):
+            return False
+        with self._lock:
+            try:
+                self._load()
+            except (OSError, ValueError):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @staticmethod
+    def _text(text, text_off, row: int) -> str:
+        lo, hi = int(text_off[row]), int(text_off[row + 1])
+        return bytes(text[lo:hi]).decode("utf-8")
+
+    def _mask(self, filter: dict | None):
+        """Boolean row mask for an equality filter ({"src": ...}); cached per filter."""
+        if not filter:
+            return None
+        key = json.dumps(filter, sort_keys=True, default=str)
+        mask = self._masks.get(key)
+        if mask is None:
+            items = filter.items()
+            mask = np.fromiter((all(m.get(f) == v for f, v in items) for _, m in self.rows),
+                               dtype=bool, count=len(self.rows))
+            self._masks[key] = mask
+            while len(self._masks) > 64:
+                self._masks.popitem(last=False)
+        return mask
+
+    def search(self, queries, ks, filters=None) -> list[list[tuple[str, float, str, dict]]]:
+        """Top-k (chunk_id, score, text, metadata) per query; `ks` and `filters` are per query.
+
+        All queries are scored together one row block at a time, keeping only
+        each block's top-k, so memory stays at BLOCK_ROWS × len(queries).
+        """
+        self.reload_if_changed()
+        with self._lock:
+            vectors, scales, n = self.vectors, self.scales, len(self.rows)
+            table, text, text_off = self.rows, self.text, self.text_off
+            masks = [self._mask(f) for f in (filters or [None] * len(ks))]
+        q = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        if not n:
+            return [[] for _ in ks]
+        rows = [[] for _ in ks]
+        scores = [[] for _ in ks]
+        for lo in range(0, n, BLOCK_ROWS):
+            hi = min(lo + BLOCK_ROWS, n)
+            sims = np.asarray(vectors[lo:hi], dtype=np.float32) @ q.T
+            if scales is not None:
+                sims *= np.asarray(scales[lo:hi], dtype=np.float32)[:, None]
+            for j, k in enumerate(ks):
+                col = sims[:, j]
+                if masks[j] is not None:
+                    col = np.where(masks[j][lo:hi], col, -np.inf)
+                k = min(k, hi - lo)
+                top = np.argpartition(-col, k - 1)[:k]
+                rows[j].append(top + lo)
+                scores[j].append(col[top])
+        results = []
+        for j, k in enumerate(ks):
+            r, sc = np.concatenate(rows[j]), np.concatenate(scores[j])
+            order = np.argsort(-sc)[:k]
+            hits = []
+            for i in order:
+                if np.isfinite(sc[i]):
+                    cid, meta = table[r[i]]
+                    hits.append((cid, float(sc[i]), self._text(text, text_off, r[i]), meta))
+            results.append(hits)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "backend": "numpy",
+            "rows": len(self.rows),
+            "dtype": self.info["dtype"],
+            "dim": self.info["dim"],
+            "exported_at": self.info["exported_at"],
+            "bytes": int(self.vectors.nbytes),
+        }
@@ -6,9 +6,15 @@ This script provides CLI commands to run document extraction and embedding in st
 
 🔧 Usage:
     python scripts/pipeline.py extract        # Run only document extraction
+    python scripts/pipeline.py extract -w 16  # Partition with a 16-process pool
     python scripts/pipeline.py embed          # Run only vector embedding
+    python scripts/pipeline.py embed -b 512   # Embed + upsert 512 chunks per batch
     python scripts/pipeline.py all            # Run full pipeline end-to-end
     python scripts/pipeline.py all --silent   # Run pipeline quietly (logs only)
+    python scripts/pipeline.py all --stream   # Extract → chunk → embed concurrently, in-process
+    python scripts/pipeline.py compact        # Purge orphaned chunks from the vector store
+    python scripts/pipeline.py export --int8  # Snapshot vectors for VECTOR_BACKEND=numpy
+    python scripts/pipeline.py bench --docs 500 --model hash  # Ingestion micro-benchmark
 
 🧾 Logs:
     Output is written to: logs/pipeline-run.log
@@ -21,18 +27,23 @@ from pathlib import Path
 from datetime import datetime
 
 BASE = Path(__file__).resolve().parent.parent
+# Stage modules live next to this file and import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent))
 EXTRACT = BASE / "scripts" / "extract_and_caption.py"
 EMBED   = BASE / "scripts" / "embed.py"
+COMPACT = BASE / "scripts" / "compact.py"
+EXPORT  = BASE / "scripts" / "export_vectors.py"
+BENCH   = BASE / "scripts" / "bench_ingest.py"
 LOGFILE = BASE / "logs" / "pipeline-run.log"
 
-def run_script(script_path: Path, label: str, silent: bool = False):
+def run_script(script_path: Path, label: str, silent: bool = False, args: tuple = ()):
     click.echo(f"\n▶️ Running {label}...\n")
     with open(LOGFILE, "a") as log:
         log.write(f"\n\n===== {label} =====\n")
         log.write(f"⏰ Started: {datetime.now().isoformat()}\n")
 
         process = subprocess.Popen(
-            ["python", str(script_path)],
+            ["python", str(script_path), *args],
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True
@@ -56,26 +67,98 @@ def cli():
     """Main command group"""
     pass
 
+def extract_args(workers, timeout):
+    args = ()
+    if workers is not None:
+        args += ("--workers", str(workers))
+    if timeout is not None:
+        args += ("--timeout", str(timeout))
+    return args
+
 @cli.command()
 @click.option('--silent', is_flag=True, help="Suppress stdout, write only to logs")
-def extract(silent):
+@click.option('-w', '--workers', type=int, help="Parallel partitioning processes")
+@click.option('--timeout', type=int, help="Per-file partition timeout (s)")
+def extract(silent, workers, timeout):
     """Run document extraction + image captioning"""
-    run_script(EXTRACT, "Document Extraction + Captioning", silent)
+    run_script(EXTRACT, "Document Extraction + Captioning", silent, extract_args(workers, timeout))
+
+def embed_args(batch_size):
+    return ("--batch-size", str(batch_size)) if batch_size is not None else ()
 
 @cli.command()
 @click.option('--silent', is_flag=True, help="Suppress stdout, write only to logs")
-def embed(silent):
+@click.option('-b', '--batch-size', type=int, help="Chunks per embedding/upsert batch")
+def embed(silent, batch_size):
     """Run embedding to vector store"""
-    run_script(EMBED, "Embedding to Vector Store", silent)
+    run_script(EMBED, "Embedding to Vector Store", silent, embed_args(batch_size))
 
 @cli.command()
 @click.option('--silent', is_flag=True, help="Suppress stdout, write only to logs")
-def all(silent):
+@click.option('-w', '--workers', type=int, help="Parallel partitioning processes")
+@click.option('--timeout', type=int, help="Per-file partition timeout (s)")
+@click.option('-b', '--batch-size', type=int, help="Chunks per embedding/upsert batch")
+@click.option('--stream', is_flag=True, help="Run stages concurrently in one process")
+@click.option('--queue-size', default=32, show_default=True,
+              help="[stream] Documents buffered between extraction and chunking")
+@click.option('--flush-interval', default=5.0, show_default=True,
+              help="[stream] Seconds of idle input before a partial batch is embedded")
+@click.option('--write-clean/--no-write-clean', default=True, show_default=True,
+              help="[stream] Also write extracted documents to the corpus store")
+def all(silent, workers, timeout, batch_size, stream, queue_size, flush_interval, write_clean):
     """Run both extraction and embedding"""
     click.secho("🚀 Starting full pipeline...\n", fg="cyan")
-    run_script(EXTRACT, "Document Extraction + Captioning", silent)
-    run_script(EMBED, "Embedding to Vector Store", silent)
+    if stream:
+        run_streaming(workers, timeout, batch_size, queue_size, flush_interval, write_clean)
+        click.secho("🎉 Pipeline complete! Check logs for details.\n", fg="cyan")
+        return
+    run_script(EXTRACT, "Document Extraction + Captioning", silent, extract_args(workers, timeout))
+    run_script(EMBED, "Embedding to Vector Store", silent, embed_args(batch_size))
     click.secho("🎉 Pipeline complete! Check logs for details.\n", fg="cyan")
 
+@cli.command()
+@click.option('--silent', is_flag=True, help="Suppress stdout, write only to logs")
+@click.option('--dry-run', is_flag=True, help="Report orphans without deleting them")
+@click.option('--vacuum', is_flag=True, help="VACUUM the Chroma sqlite file afterwards")
+def compact(silent, dry_run, vacuum):
+    """Purge orphaned chunks and report reclaimed space"""
+    args = ("--dry-run",) * dry_run + ("--vacuum",) * vacuum
+    run_script(COMPACT, "Vector Store Compaction", silent, args)
+
+@cli.command()
+@click.option('--silent', is_flag=True, help="Suppress stdout, write only to logs")
+@click.option('--int8', is_flag=True, help="Quantize vectors to int8 with per-row scales")
+def export(silent, int8):
+    """Export vectors to the mmap'd NumPy serving snapshot"""
+    run_script(EXPORT, "Vector Export", silent, ("--int8",) * int8)
+
+@cli.command(context_settings={"ignore_unknown_options": True})
+@click.option('--silent', is_flag=True, help="Suppress stdout, write only to logs")
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def bench(silent, args):
+    """Benchmark partition/chunk/embed/store throughput (options: bench_ingest.py --help)"""
+    run_script(BENCH, "Ingestion Benchmark", silent, args)
+
+def run_streaming(workers, timeout, batch_size, queue_size, flush_interval, write_clean):
+    from streaming import run_stream
+
+    extract_kwargs = {"write_clean": write_clean}
+    if workers is not None:
+        extract_kwargs["workers"] = workers
+    if timeout is not None:
+        extract_kwargs["timeout"] = timeout
+
+    with open(LOGFILE, "a") as log:
+        log.write(f"\n\n===== Streaming Ingestion =====\n")
+        log.write(f"⏰ Started: {datetime.now().isoformat()}\n")
+        try:
+            stats = run_stream(extract_kwargs, batch_size=batch_size or 256,
+                               queue_size=queue_size, flush_interval=flush_interval)
+        except Exception as e:
+            log.write(f"❌ Failed: {e!r}\n")
+            click.secho(f"\n❌ Streaming ingestion failed: {e}", fg="red")
+            sys.exit(1)
+        log.write(f"✅ Finished: {stats}\n")
+
 if __name__ == "__main__":
     cli()
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+scripts/streaming.py
+
+In-process streaming ingestion: extract → chunk → embed.
+
+Extraction runs on the main thread (its process pool and SIGALRM timeouts need
+it) and hands finished documents to a chunking thread, which chunks them once
+into the chunk store (chunk_store.py) and packs chunks from consecutive
+documents into upsert batches for an embedding thread. Both hand-offs are
+bounded queues, so extraction blocks instead of outrunning embedding. A
+partial batch is flushed after `flush_interval` seconds of idle input, so the
+first documents become searchable early in the run rather than at its end.
+
+A source is recorded in the manifest only after its last chunk is upserted and
+its stale chunks are dropped; an interrupted run re-extracts whatever had not
+reached the vector store. Chunks of deleted sources are purged at the end.
+"""
+
+import queue
+import threading
+import time
+
+from logconf import logging
+from manifest import Manifest
+from ledger import Ledger
+from chunk_store import ChunkStore
+import extract_and_caption as extract
+import embed
+
+DONE = object()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once another stage has failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_stream(extract_kwargs: dict, batch_size: int = 256, encode_batch_size: int = 64,
+               device: str | None = None, queue_size: int = 32,
+               flush_interval: float = 5.0) -> dict:
+    docs_q  = queue.Queue(maxsize=queue_size)
+    batch_q = queue.Queue(maxsize=max(2, queue_size // 8))
+    stop    = threading.Event()
+    errors: list[BaseException] = []
+    stats   = {"docs": 0, "chunks": 0, "batches": 0, "purged": 0, "first_upsert_s": None}
+    started = time.monotonic()
+
+    def chunk_stage():
+        batcher = embed.Batcher(batch_size)
+        ledger = Ledger()
+        store = ChunkStore()
+        try:
+            store.acquire()
+            while not stop.is_set():
+                try:
+                    item = docs_q.get(timeout=flush_interval)
+                except queue.Empty:
+                    item = None
+                if item is DONE:
+                    break
+                if item is None:
+                    # Idle input: ship what we have so it becomes searchable now
+                    for out in batcher.drain():
+                        _put(batch_q, out, stop)
+                    continue
+
+                doc, entry = item
+                chunks = store.chunks_for(doc)
+                ledger.chunked(doc["id"], doc["source"], embed.expected_count(chunks))
+                for out in batcher.add(doc["id"], chunks, tag=entry):
+                    _put(batch_q, out, stop)
+            for out in batcher.drain():
+                _put(batch_q, out, stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            ledger.close()
+            store.close()
+            _put(batch_q, DONE, threading.Event())
+
+    def embed_stage():
+        manifest = embedder = None
+        try:
+            embedder = embed.Embedder(batch_size, encode_batch_size, device)
+            manifest = Manifest(extract.RAW)
+            while (item := batch_q.get()) is not DONE:
+                batch, finished = item
+                n = embedder.write(batch, finished)
+                if n:
+                    stats["chunks"] += n
+                    stats["batches"] += 1
+                    if stats["first_upsert_s"] is None:
+                        stats["first_upsert_s"] = time.monotonic() - started
+                        logging.info(f"⚡ First chunks searchable after {stats['first_upsert_s']:.1f}s")
+                # The doc is complete once the batch holding its last chunk lands
+                for _, _, entry in finished:
+                    manifest.record(entry)
+                    stats["docs"] += 1
+            if not stop.is_set():
+                stats["purged"] = embedder.purge(embed.live_doc_ids())
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+            # Keep draining so the chunk stage never blocks on a dead consumer
+            while batch_q.get() is not DONE:
+                pass
+        finally:
+            if embedder:
+                embedder.close()
+            if manifest:
+                manifest.close()
+
+    workers = [
+        threading.Thread(target=chunk_stage, name="chunk", daemon=True),
+        threading.Thread(target=embed_stage, name="embed", daemon=True),
+    ]
+    for t in workers:
+        t.start()
+
+    try:
+        for doc, entry in extract.extract_documents(record=False, **extract_kwargs):
+            if not _put(docs_q, (doc, entry), stop):
+                break
+    finally:
+        while workers[0].is_alive():
+            try:
+                docs_q.put(DONE, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        for t in workers:
+            t.join()
+
+    if errors:
+        raise errors[0]
+
+    stats["elapsed_s"] = time.monotonic() - started
+    logging.info(
+        "✅ Streaming ingest: {docs} docs, {chunks} chunks in {batches} batches, "
+        "{purged} purged, {elapsed_s:.1f}s".format(**stats)
+    )
+    return stats
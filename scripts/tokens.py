@@ -0,0 +1,34 @@
+"""
+scripts/tokens.py
+
+Token counting shared by ingestion and the agents.
+
+embed.py stores each chunk's count in its metadata so prompt packing
+(scripts/agents/context.py) never has to tokenize on the request path. Uses
+tiktoken's encoding for TOKEN_MODEL (default gpt-4) when the package is
+installed, otherwise estimates ~4 characters per token.
+"""
+
+import functools
+import os
+
+TOKEN_MODEL = os.getenv("TOKEN_MODEL", "gpt-4")
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(TOKEN_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is None:
+        return max(1, (len(text) + 3) // 4) if text else 0
+    return len(enc.encode(text, disallowed_special=()))
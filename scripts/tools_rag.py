@@ -1,34 +1,84 @@
 #!/usr/bin/env python3
 """Standalone FastAPI search tool — no openai_agents, no mcp. MCP will invoke this as subprocess."""
-from pathlib import Path
-from fastapi import FastAPI
-from pydantic import BaseModel
+import asyncio
+from fastapi import FastAPI, APIRouter, HTTPException
+from pydantic import BaseModel, Field
 # from logconf import logging
 from scripts.logconf import logging
-# from langchain_community.vectorstores import Chroma
-from langchain_chroma import Chroma
+from scripts import tracing
+# Same (cached) vector store and embedding model as the agents, so the combined
+# host (scripts/agents/host.py) loads the index once
+from scripts.agents import readiness
+from scripts.agents.shared import retrieve, batch_search, check_filter, FilterError, RETRIEVAL_K, warm
 
-BASE = Path(__file__).resolve().parent.parent
-VECTOR_DIR = (BASE / "vector_store").expanduser()
-vectordb = Chroma(persist_directory=str(VECTOR_DIR), collection_name="knowledge_base")
-
-app = FastAPI()
+app = FastAPI(lifespan=readiness.lifespan(warm))
+router = APIRouter(route_class=tracing.TimedRoute)
 
 class SearchRequest(BaseModel):
     query: str
+    k: int = Field(RETRIEVAL_K, ge=1, le=100)
+    mode: str | None = Field(None, pattern=r"^(dense|hybrid)$")
 
 class SearchResponse(BaseModel):
     passages: list[str]
+    timings: dict[str, float] = {}
 
-@app.post("/search-kb", response_model=SearchResponse)
-def search_kb(req: SearchRequest):
+@router.post("/search-kb", response_model=SearchResponse)
+async def search_kb(req: SearchRequest):
     try:
-        docs = vectordb.similarity_search(req.query, k=8)
-        return {"passages": [d.page_content for d in docs]}
+        docs, timings = await retrieve(req.query, k=req.k, mode=req.mode)
+        return {"passages": [d.page_content for d in docs], "timings": timings}
     except Exception as e:
         logging.exception("search_kb failed")
         return {"passages": []}
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+class BatchQuery(BaseModel):
+    query: str
+    k: int = Field(RETRIEVAL_K, ge=1, le=100)
+    filter: dict | None = Field(None, description="Metadata equality filter, e.g. {\"src\": \"x.pdf\", \"page\": 3}; "
+                                                  "all fields must match, operators are not supported")
+
+class BatchSearchRequest(BaseModel):
+    queries: list[BatchQuery] = Field(..., min_length=1, max_length=1000)
+
+class Hit(BaseModel):
+    text: str
+    score: float
+    metadata: dict
+
+class BatchResult(BaseModel):
+    query: str
+    hits: list[Hit]
+
+class BatchSearchResponse(BaseModel):
+    results: list[BatchResult]
+    timings: dict[str, float] = {}
+
+@router.post("/search-kb/batch", response_model=BatchSearchResponse)
+async def search_kb_batch(req: BatchSearchRequest):
+    """Dense search for many queries: one embedding pass, grouped vector searches."""
+    try:
+        for q in req.queries:
+            check_filter(q.filter)
+    except FilterError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    with tracing.stage("retrieval"):
+        results, timings = await asyncio.to_thread(
+            batch_search,
+            [q.query for q in req.queries],
+            [q.k for q in req.queries],
+            [q.filter for q in req.queries],
+        )
+    return {
+        "results": [
+            {"query": q.query,
+             "hits": [{"text": d.page_content, "score": score, "metadata": d.metadata}
+                      for d, score in hits]}
+            for q, hits in zip(req.queries, results)
+        ],
+        "timings": timings,
+    }
+
+app.include_router(router)
+app.include_router(readiness.router)
+tracing.instrument(app, "tools_rag")
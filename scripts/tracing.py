@@ -0,0 +1,421 @@
+"""
+scripts/tracing.py
+
+Request tracing and Prometheus metrics for the chat → super → agent chain.
+
+Every service wraps its app with `instrument(app, service)`, which
+
+* takes the caller's `X-Request-ID` (or makes one) and keeps it in a context
+  variable for the life of the request; `http_pool.PooledClient` forwards it
+  on every downstream call, and log lines written during the request are
+  prefixed with it, so one id ties together chat, super and agent logs;
+* collects stage timings recorded with `stage()` / `record()` (retrieval,
+  prompt, llm, each downstream hop, serialize) and returns them in a
+  `Server-Timing` header together with the total;
+* serves `GET /metrics` in the Prometheus text format: request latency and
+  per-stage histograms, in-flight requests and LLM token counters.
+
+Routers use `APIRouter(route_class=TimedRoute)` so the time between the
+endpoint returning and the response starting is reported as `serialize`.
+
+Streaming responses send their headers before the LLM stage ends, so their
+`Server-Timing` only covers the stages before the first byte; the histograms
+still see every stage. The hot path is a context-variable lookup, a couple of
+`perf_counter()` calls and a dict update per stage.
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from fastapi.routing import APIRoute
+from starlette.responses import Response
+
+HEADER = "X-Request-ID"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Trace:
+    __slots__ = ("request_id", "start", "stages", "handler_end")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.stages: list[tuple[str, float]] = []
+        self.handler_end: float | None = None
+
+
+_current: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+
+def current_request_id() -> str | None:
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+
+def outgoing_headers() -> dict:
+    """Headers that carry the current trace to a downstream service."""
+    trace = _current.get()
+    return {HEADER: trace.request_id} if trace else {}
+
+
+# ---- metrics --------------------------------------------------------------------
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms, counters and gauges keyed by (metric name, label tuple).
+
+    `const_labels` are added to every series on output (serve.py workers set
+    `worker`, see `share`).
+    """
+
+    def __init__(self, const_labels: tuple = ()):
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple, Histogram] = defaultdict(Histogram)
+        self.counters: dict[tuple, float] = defaultdict(float)
+        self.gauges: dict[tuple, float] = defaultdict(float)
+        self.help: dict[str, str] = {}
+        self.const_labels = tuple(const_labels)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.histograms[key].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def add(self, name: str, value: float, **labels) -> None:
+        """Move a gauge up or down."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] += value
+
+    def snapshot(self) -> dict:
+        """JSON-able copy of every series (read back with `load`)."""
+        with self._lock:
+            return {
+                "labels": self.const_labels,
+                "histograms": [[n, l, h.counts, h.sum, h.count]
+                               for (n, l), h in self.histograms.items()],
+                "counters": [[n, l, v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, l, v] for (n, l), v in self.gauges.items()],
+            }
+
+    @classmethod
+    def load(cls, data: dict) -> "Registry":
+        pairs = lambda labels: tuple(tuple(p) for p in labels)  # noqa: E731
+        reg = cls(pairs(data["labels"]))
+        for name, labels, counts, total, count in data["histograms"]:
+            h = reg.histograms[(name, pairs(labels))]
+            h.counts, h.sum, h.count = list(counts), total, count
+        for name, labels, v in data["counters"]:
+            reg.counters[(name, pairs(labels))] = v
+        for name, labels, v in data["gauges"]:
+            reg.gauges[(name, pairs(labels))] = v
+        return reg
+
+    def _series(self, kind: str) -> list:
+        with self._lock:
+            items = list(getattr(self, kind).items())
+        if kind == "histograms":  # copy: observe() keeps mutating them
+            items = [(k, (list(h.counts), h.sum, h.count)) for k, h in items]
+        return [((name, self.const_labels + labels), v) for (name, labels), v in items]
+
+    def render(self, others: tuple["Registry", ...] = ()) -> str:
+        """Prometheus text for this registry plus `others` (workers' loaded snapshots)."""
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        registries = (self, *others)
+        for (name, labels), (counts, total, count) in sorted(
+                s for r in registries for s in r._series("histograms")):
+            header(name, "histogram")
+            cumulative = 0
+            for le, n in zip((*BUCKETS, "+Inf"), counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{fmt(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        for kind, typ in (("counters", "counter"), ("gauges", "gauge")):
+            for (name, labels), v in sorted(s for r in registries for s in r._series(kind)):
+                header(name, typ)
+                lines.append(f"{name}{fmt(labels)} {v:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Registry()
+metrics.help.update({
+    "http_request_duration_seconds": "Time to the end of the response body",
+    "http_requests_in_flight": "Requests currently being served",
+    "stage_duration_seconds": "Time spent per request stage",
+    "llm_tokens_total": "LLM tokens by kind (prompt/completion)",
+})
+
+_service: ContextVar[str] = ContextVar("service", default="")
+_peers_dir: Path | None = None
+
+
+def share(directory: Path, worker: str, interval: float | None = None) -> None:
+    """Serve metrics for a prefork worker group (scripts/agents/serve.py).
+
+    Workers share one listening socket, so a scrape lands on an arbitrary
+    worker. Each worker labels its series `worker="<slot>"` and writes a
+    snapshot to `directory` every `interval` seconds (AGENT_METRICS_SHARE_S,
+    default 5) and on every scrape it serves. `/metrics` then renders every
+    worker, itself included, from those files, so each `worker` series comes
+    from the one file its worker only ever overwrites with newer counts and
+    never goes backwards between scrapes (a restarted worker reuses its slot,
+    which Prometheus sees as a counter reset). Other workers' values lag by up
+    to `interval`; aggregate with `sum without (worker)`.
+    """
+    global _peers_dir
+    interval = interval or float(os.getenv("AGENT_METRICS_SHARE_S", "5"))
+    metrics.const_labels = (("worker", worker),)
+    directory.mkdir(parents=True, exist_ok=True)
+    _peers_dir = directory
+
+    def publish():
+        while True:
+            _publish()
+            time.sleep(interval)
+
+    threading.Thread(target=publish, name="metrics-share", daemon=True).start()
+
+
+_publish_lock = threading.Lock()
+
+
+def _publish() -> bool:
+    """Write this worker's snapshot to the shared directory; False if that failed."""
+    own = _peers_dir / f"worker-{dict(metrics.const_labels)['worker']}.json"
+    tmp = own.with_name(f".{own.name}.tmp")
+    with _publish_lock:  # snapshot and replace together, so the file only moves forward
+        try:
+            tmp.write_text(json.dumps(metrics.snapshot()))
+            os.replace(tmp, own)
+            return True
+        except OSError:
+            logging.warning(f"Could not publish metrics to {own}")
+            return False
+
+
+def render_metrics() -> str:
+    """Prometheus text for /metrics: this process, or every worker of a shared group."""
+    if _peers_dir is None:
+        return metrics.render()
+    own = f"worker-{dict(metrics.const_labels)['worker']}"
+    published = _publish()
+    workers = [] if published else [metrics]
+    for fp in _peers_dir.glob("worker-*.json"):
+        if fp.stem == own and not published:
+            continue
+        try:
+            workers.append(Registry.load(json.loads(fp.read_text())))
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    out = Registry()
+    out.help = metrics.help
+    return out.render(tuple(workers))
+
+
+# ---- stages ---------------------------------------------------------------------
+
+def record(name: str, seconds: float) -> None:
+    """Add a finished stage to the current trace and the stage histogram."""
+    trace = _current.get()
+    if trace is not None:
+        trace.stages.append((name, seconds))
+    metrics.observe("stage_duration_seconds", seconds, service=_service.get(), stage=name)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage `name` (works in sync and async code)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+
+def merge_downstream(hop: str, header: str | None) -> None:
+    """Nest a downstream service's Server-Timing under `hop` in the current trace.
+
+    Only the header is extended; the downstream service already put those
+    stages in its own histograms.
+    """
+    trace = _current.get()
+    if trace is None or not header:
+        return
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name == "total" or not params.startswith("dur="):
+            continue
+        try:
+            trace.stages.append((f"{hop}.{name}", float(params[4:]) / 1000))
+        except ValueError:
+            continue
+
+
+def tokens(model: str, prompt: int = 0, completion: int = 0) -> None:
+    if prompt:
+        metrics.inc("llm_tokens_total", prompt, service=_service.get(), model=model, kind="prompt")
+    if completion:
+        metrics.inc("llm_tokens_total", completion, service=_service.get(), model=model,
+                    kind="completion")
+
+
+def server_timing(trace: Trace, now: float) -> str:
+    parts = [f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)};dur={s * 1000:.1f}"
+             for name, s in trace.stages]
+    parts.append(f"total;dur={(now - trace.start) * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# ---- ASGI -----------------------------------------------------------------------
+
+class TracingMiddleware:
+    """Pure ASGI middleware (no body buffering, so streams pass straight through)."""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        rid = None
+        for k, v in scope["headers"]:
+            if k == b"x-request-id":
+                rid = v.decode("latin-1")[:64]
+                break
+        trace = Trace(rid or uuid.uuid4().hex)
+        token = _current.set(trace)
+        service_token = _service.set(self.service)
+        status = 500
+        metrics.add("http_requests_in_flight", 1, service=self.service)
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                now = time.perf_counter()
+                if trace.handler_end is not None:
+                    record("serialize", now - trace.handler_end)
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                headers.append((b"server-timing", server_timing(trace, now).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            # Label by route template; 404s and scans share one series instead of
+            # one per raw URL
+            route = scope.get("route")
+            metrics.add("http_requests_in_flight", -1, service=self.service)
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - trace.start,
+                            service=self.service,
+                            path=getattr(route, "path", "<unmatched>"), status=status)
+            _service.reset(service_token)
+            _current.reset(token)
+
+
+def _mark_handler_end(endpoint):
+    """Stamp the end of the endpoint so the middleware can time serialization."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                trace = _current.get()
+                if trace is not None:
+                    trace.handler_end = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                trace = _current.get()
+                if trace is not None:
+                    trace.handler_end = time.perf_counter()
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """APIRoute whose endpoint marks when it returned (see `serialize` stage)."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _mark_handler_end(endpoint), **kwargs)
+
+
+class _RequestIdRecords:
+    """Log record factory that prefixes messages logged inside a request with its id."""
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __call__(self, *args, **kwargs):
+        record = self.factory(*args, **kwargs)
+        trace = _current.get()
+        if trace is not None and isinstance(record.msg, str):
+            record.msg = f"[{trace.request_id[:12]}] {record.msg}"
+        return record
+
+
+def instrument(app, service: str):
+    """Add request tracing and a `GET /metrics` endpoint to `app`."""
+    if not isinstance(logging.getLogRecordFactory(), _RequestIdRecords):
+        logging.setLogRecordFactory(_RequestIdRecords(logging.getLogRecordFactory()))
+    app.add_middleware(TracingMiddleware, service=service)
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    return app
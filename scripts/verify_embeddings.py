@@ -2,40 +2,37 @@
 """Verify that embeddings are stored and searchable in Chroma."""
 
 from pathlib import Path
-import json
+import os
 import chromadb
 from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from rich import print
+from devices import pick_device
+from chunk_store import ChunkStore
 
 # === Paths ===
 BASE = Path(__file__).resolve().parent.parent
-CLEAN = BASE / "clean"
 VECTOR_DB = BASE / "vector_store"
 
-# === Load model & splitter ===
-model = SentenceTransformer("BAAI/bge-base-en", device="mps")
-splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=80)
+# === Load model ===
+model = SentenceTransformer(os.getenv("EMBED_MODEL", "BAAI/bge-base-en"), device=pick_device())
 
 # === Load ChromaDB ===
 client = chromadb.PersistentClient(path=str(VECTOR_DB))
 collection = client.get_or_create_collection("knowledge_base")
 
-# === Choose a random clean file ===
-files = list(CLEAN.glob("*.json"))
-if not files:
-    print("[red]❌ No documents found in `clean` folder.")
+# === Take the chunks of the first stored document ===
+_, chunks = next(ChunkStore().iter_docs(), (None, None))
+if not chunks:
+    print("[red]❌ No chunks found in the chunk store; run embed.py first.")
     exit(1)
-
-doc = json.loads(files[0].read_text())
-chunks = splitter.split_text(doc["body"])
+chunks = [text for _, text, _ in chunks]
 
 # === Choose a sample chunk to search ===
 sample = next((c for c in chunks if len(c) > 150), chunks[0])
 print(f"[bold green]🔍 Verifying sample chunk:[/bold green]\n{sample[:200]}...\n")
 
 # === Embed and query ===
-query_vec = model.encode([sample])[0].tolist()
+query_vec = model.encode([sample], normalize_embeddings=True)[0].tolist()
 results = collection.query(
     query_embeddings=[query_vec],
     n_results=3